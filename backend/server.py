@@ -1,4 +1,6 @@
 from fastapi import FastAPI, APIRouter, HTTPException, Depends, Request, Response, Query
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, StreamingResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
@@ -6,21 +8,85 @@ import os
 import logging
 from pathlib import Path
 from pydantic import BaseModel, Field, ConfigDict, EmailStr
-from typing import List, Optional, Dict, Any, Literal
+from typing import List, Optional, Dict, Any, Literal, Tuple, Callable, Awaitable
+from collections import OrderedDict, deque
+from contextlib import aclosing
 import uuid
-from datetime import datetime, timezone, timedelta
+import hashlib
+import calendar
+from datetime import date, datetime, timezone, timedelta
 import jwt
 import bcrypt
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+from openpyxl import Workbook
+import bisect
 import csv
 import io
+import json
+import zipfile
+from itertools import groupby
+import asyncio
+import math
+import re
+import socket
+import tempfile
+import time
+from pymongo import IndexModel, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, CollectionInvalid, DuplicateKeyError
+from pymongo.read_preferences import Nearest, Primary, PrimaryPreferred, Secondary, SecondaryPreferred
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
-# MongoDB connection
-mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+# MongoDB connection pool, tunable per deployment
+def build_mongo_client_options() -> Dict[str, Any]:
+    options: Dict[str, Any] = {
+        "maxPoolSize": int(os.environ.get("MONGO_MAX_POOL_SIZE", "100")),
+        "minPoolSize": int(os.environ.get("MONGO_MIN_POOL_SIZE", "0")),
+    }
+    optional_int_options = {
+        "waitQueueTimeoutMS": "MONGO_WAIT_QUEUE_TIMEOUT_MS",
+        "maxIdleTimeMS": "MONGO_MAX_IDLE_TIME_MS",
+        "connectTimeoutMS": "MONGO_CONNECT_TIMEOUT_MS",
+        "serverSelectionTimeoutMS": "MONGO_SERVER_SELECTION_TIMEOUT_MS",
+    }
+    for option, env_name in optional_int_options.items():
+        value = os.environ.get(env_name)
+        if value:
+            options[option] = int(value)
+
+    compressors = os.environ.get("MONGO_COMPRESSORS", "").strip()
+    if compressors:
+        options["compressors"] = compressors
+    return options
+
+# "memory" keeps every store in process (tests, benchmarks); the archive tier and the
+# cross-worker change stream need "mongo".
+STORAGE_BACKEND = os.environ.get("STORAGE_BACKEND", "mongo").lower()
+if STORAGE_BACKEND not in {"mongo", "memory"}:
+    STORAGE_BACKEND = "mongo"
+
+if STORAGE_BACKEND == "mongo":
+    mongo_url = os.environ['MONGO_URL']
+    client = AsyncIOMotorClient(mongo_url, **build_mongo_client_options())
+    db = client[os.environ['DB_NAME']]
+else:
+    client = None
+    db = None
+
+# Read routing: heavy read-only routes may be sent to secondaries with bounded staleness.
+# Per-route MONGO_READ_PREFERENCE_<ROUTE> overrides MONGO_SECONDARY_READ_PREFERENCE.
+READ_PREFERENCE_CLASSES = {
+    "primary": Primary,
+    "primarypreferred": PrimaryPreferred,
+    "secondary": Secondary,
+    "secondarypreferred": SecondaryPreferred,
+    "nearest": Nearest,
+}
+READ_ROUTES = ("analytics", "export", "search")
+MONGO_MIN_MAX_STALENESS_SECONDS = 90
 
 # JWT Configuration
 JWT_SECRET = os.environ.get('JWT_SECRET', 'expense-tracker-secret-key-2024')
@@ -32,6 +98,68 @@ COOKIE_SECURE = os.environ.get('COOKIE_SECURE', 'false').lower() == 'true'
 COOKIE_SAMESITE = os.environ.get('COOKIE_SAMESITE', 'lax').lower()
 if COOKIE_SAMESITE not in {"lax", "strict", "none"}:
     COOKIE_SAMESITE = "lax"
+# "session" resolves every request against user_sessions; "hybrid" trusts the
+# access token claims and only consults the in-memory revocation list.
+AUTH_TOKEN_MODE = os.environ.get("AUTH_TOKEN_MODE", "session").lower()
+if AUTH_TOKEN_MODE not in {"session", "hybrid"}:
+    AUTH_TOKEN_MODE = "session"
+REVOCATION_REFRESH_SECONDS = int(os.environ.get("REVOCATION_REFRESH_SECONDS", "10"))
+
+# Auth rate limiting (token buckets). "mongo" shares buckets across workers.
+AUTH_RATE_LIMIT_BACKEND = os.environ.get("AUTH_RATE_LIMIT_BACKEND", "memory").lower()
+if AUTH_RATE_LIMIT_BACKEND not in {"memory", "mongo"}:
+    AUTH_RATE_LIMIT_BACKEND = "memory"
+AUTH_RATE_LIMIT_IP_BURST = int(os.environ.get("AUTH_RATE_LIMIT_IP_BURST", "20"))
+AUTH_RATE_LIMIT_IP_PER_MINUTE = float(os.environ.get("AUTH_RATE_LIMIT_IP_PER_MINUTE", "10"))
+AUTH_RATE_LIMIT_EMAIL_BURST = int(os.environ.get("AUTH_RATE_LIMIT_EMAIL_BURST", "5"))
+AUTH_RATE_LIMIT_EMAIL_PER_MINUTE = float(os.environ.get("AUTH_RATE_LIMIT_EMAIL_PER_MINUTE", "2"))
+RATE_LIMIT_EVICT_SECONDS = 60
+# Number of reverse proxies in front of the app that append to X-Forwarded-For. With 0 the
+# header is client-controlled and ignored; the socket peer is the client.
+TRUSTED_PROXY_COUNT = int(os.environ.get("TRUSTED_PROXY_COUNT", "0"))
+RATE_LIMIT_MAX_KEYS = 100_000
+# Request admission, in cost units: every limited request holds its route's cost against the
+# worker pool and its user's allowance. 0 disables the limiter.
+CONCURRENCY_WORKER_CAPACITY = int(os.environ.get("CONCURRENCY_WORKER_CAPACITY", "64"))
+CONCURRENCY_USER_CAPACITY = int(os.environ.get("CONCURRENCY_USER_CAPACITY", "10"))
+CONCURRENCY_MAX_WAIT_MS = int(os.environ.get("CONCURRENCY_MAX_WAIT_MS", "2000"))
+CONCURRENCY_MAX_QUEUE = int(os.environ.get("CONCURRENCY_MAX_QUEUE", "100"))
+CONCURRENCY_ROUTE_COSTS = {"default": 1, "search": 1, "analytics": 2, "export": 4, "import": 4}
+CONCURRENCY_ROUTE_DEFAULT_LIMITS = {"default": 0, "search": 16, "analytics": 8, "export": 2, "import": 2}
+CONCURRENCY_ROUTE_PATHS = {
+    "/api/expenses/search": "search",
+    "/api/analytics/raw": "analytics",
+    "/api/analytics/timeseries": "analytics",
+    "/api/reports/export": "export",
+    "/api/reports/import": "import",
+}
+# Long-lived streams have their own connection caps.
+CONCURRENCY_EXEMPT_PATHS = {"/api/events"}
+
+# Analytics/report result cache (per worker, LRU bounded by entries and bytes)
+RESULT_CACHE_MAX_ENTRIES = int(os.environ.get("RESULT_CACHE_MAX_ENTRIES", "1024"))
+RESULT_CACHE_MAX_BYTES = int(os.environ.get("RESULT_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+RESULT_CACHE_MAX_ENTRY_BYTES = int(os.environ.get("RESULT_CACHE_MAX_ENTRY_BYTES", str(4 * 1024 * 1024)))
+RESULT_CACHE_MAX_VERSIONS = int(os.environ.get("RESULT_CACHE_MAX_VERSIONS", "65536"))
+
+# Startup
+MONGO_WARMUP_CONNECTIONS = int(os.environ.get("MONGO_WARMUP_CONNECTIONS", "4"))
+STARTUP_RETRY_SECONDS = int(os.environ.get("STARTUP_RETRY_SECONDS", "5"))
+
+# Live change events (SSE). "changestream" tails the committed watermark in sync_counters so every
+# worker sees writes made by the others; it requires a replica set.
+CHANGE_EVENTS_BACKEND = os.environ.get("CHANGE_EVENTS_BACKEND", "memory").lower()
+if CHANGE_EVENTS_BACKEND not in {"memory", "changestream"}:
+    CHANGE_EVENTS_BACKEND = "memory"
+SSE_MAX_CONNECTIONS_PER_USER = int(os.environ.get("SSE_MAX_CONNECTIONS_PER_USER", "5"))
+SSE_MAX_CONNECTIONS = int(os.environ.get("SSE_MAX_CONNECTIONS", "10000"))
+SSE_QUEUE_SIZE = int(os.environ.get("SSE_QUEUE_SIZE", "16"))
+SSE_HEARTBEAT_SECONDS = int(os.environ.get("SSE_HEARTBEAT_SECONDS", "15"))
+SSE_MAX_CHANGES_PER_EVENT = 100
+
+if STORAGE_BACKEND == "memory":
+    AUTH_RATE_LIMIT_BACKEND = "memory"
+    CHANGE_EVENTS_BACKEND = "memory"
 
 
 # CORS origins from environment or default to local frontend
@@ -44,15 +172,6 @@ cors_origins = [
 # Create the main app
 app = FastAPI(title="Expense Tracker API")
 
-# Add CORS middleware
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=[origin.strip() for origin in cors_origins],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
 
@@ -63,6 +182,53 @@ logger = logging.getLogger(__name__)
 ENTRY_TYPES = {"expense", "income"}
 ANALYTICS_RAW_DEFAULT_LIMIT = 500
 ANALYTICS_RAW_MAX_LIMIT = 2000
+SEARCH_DEFAULT_LIMIT = 50
+SEARCH_MAX_LIMIT = 200
+SEARCH_TERM_MIN_LENGTH = 2
+SEARCH_TERM_MAX_LENGTH = 15
+SEARCH_BACKFILL_BATCH_SIZE = 500
+TIMESERIES_MAX_BUCKETS = 3660
+RECURRING_SCAN_SECONDS = int(os.environ.get("RECURRING_SCAN_SECONDS", "300"))
+RECURRING_RULE_BATCH_SIZE = 200
+RECURRING_MAX_OCCURRENCES_PER_PASS = 400
+RECURRING_MAX_BATCHES_PER_PASS = 50
+RECURRING_UPDATE_ATTEMPTS = 5
+BUDGETS_MAX_PER_USER = 500
+BUDGET_RECONCILE_DELAY_SECONDS = 5
+SYNC_DEFAULT_LIMIT = 500
+SYNC_MAX_LIMIT = 2000
+SYNC_LOCK_STRIPES = 64
+SYNC_COMMIT_TIMEOUT_SECONDS = 10
+WORKSPACE_ROLES = ("owner", "editor", "viewer")
+WORKSPACES_MAX_PER_USER = 100
+WORKSPACE_MEMBERSHIP_TTL_SECONDS = int(os.environ.get("WORKSPACE_MEMBERSHIP_TTL_SECONDS", "60"))
+WORKSPACE_MEMBERSHIP_CACHE_SESSIONS = int(os.environ.get("WORKSPACE_MEMBERSHIP_CACHE_SESSIONS", "10000"))
+# "memory" for a single worker; "socket" fans invalidations out to every worker on the host
+# over Unix datagram sockets in INVALIDATION_SOCKET_DIR.
+INVALIDATION_BACKEND = os.environ.get("INVALIDATION_BACKEND", "memory").lower()
+INVALIDATION_SOCKET_DIR = os.environ.get(
+    "INVALIDATION_SOCKET_DIR",
+    os.path.join(tempfile.gettempdir(), "expense-tracker-invalidation"),
+)
+INVALIDATION_MAX_DATAGRAM_BYTES = 32768
+# search_terms is an internal index field and never leaves the API.
+EXPENSE_PROJECTION = {"_id": 0, "search_terms": 0, "recurrence_key": 0, "fingerprint": 0, "archive_batch": 0}
+FINGERPRINT_FIELDS = ("date", "amount", "currency", "description", "category_id")
+FINGERPRINT_MAX_ORDINAL = 100
+IMPORT_BATCH_SIZE = 1000
+CLASSIFIER_CACHE_USERS = int(os.environ.get("CLASSIFIER_CACHE_USERS", "256"))
+CLASSIFIER_HISTORY_LIMIT = int(os.environ.get("CLASSIFIER_HISTORY_LIMIT", "20000"))
+EXPORT_CHUNK_ROWS = int(os.environ.get("EXPORT_CHUNK_ROWS", "5000"))
+# Yearly budgets read up to a year back from the hot tier, so the horizon never goes below that.
+ARCHIVE_MIN_HORIZON_DAYS = 400
+ARCHIVE_HORIZON_DAYS = max(int(os.environ.get("ARCHIVE_HORIZON_DAYS", "730")), ARCHIVE_MIN_HORIZON_DAYS)
+ARCHIVE_SCAN_SECONDS = int(os.environ.get("ARCHIVE_SCAN_SECONDS", "0"))
+ARCHIVE_BUCKET_ROWS = int(os.environ.get("ARCHIVE_BUCKET_ROWS", "1000"))
+ARCHIVE_BLOCK_COMPRESSOR = os.environ.get("ARCHIVE_BLOCK_COMPRESSOR", "zstd")
+ARCHIVE_ROWS_PER_PASS = 20000
+ARCHIVE_STALE_BATCH_SECONDS = 600
+ARCHIVE_COMMIT_CHUNK = 500
+EXPORT_COLUMNS = ["Date", "Description", "Amount", "Type", "Currency", "Category", "Subcategory"]
 
 # ==================== MODELS ====================
 
@@ -111,6 +277,7 @@ class Category(CategoryBase):
     model_config = ConfigDict(extra="ignore")
     category_id: str
     user_id: str
+    workspace_id: Optional[str] = None
     subcategories: List[SubCategory] = []
     created_at: datetime
 
@@ -130,6 +297,7 @@ class Expense(ExpenseBase):
     model_config = ConfigDict(extra="ignore")
     expense_id: str
     user_id: str
+    workspace_id: Optional[str] = None
     created_at: datetime
 
 class ExpenseUpdate(BaseModel):
@@ -141,6 +309,71 @@ class ExpenseUpdate(BaseModel):
     entry_type: Optional[Literal["expense", "income"]] = None
     date: Optional[datetime] = None
 
+class RecurringRuleBase(BaseModel):
+    amount: float
+    currency: str = "USD"
+    description: str
+    category_id: str
+    subcategory_id: Optional[str] = None
+    entry_type: Literal["expense", "income"] = "expense"
+    frequency: Literal["daily", "weekly", "monthly", "yearly"] = "monthly"
+    interval: int = Field(1, ge=1, le=366)
+    start_date: date
+    end_date: Optional[date] = None
+
+class RecurringRuleCreate(RecurringRuleBase):
+    pass
+
+class RecurringRule(RecurringRuleBase):
+    model_config = ConfigDict(extra="ignore")
+    rule_id: str
+    user_id: str
+    workspace_id: Optional[str] = None
+    active: bool = True
+    next_occurrence: Optional[date] = None
+    created_at: datetime
+
+class RecurringRuleUpdate(BaseModel):
+    amount: Optional[float] = None
+    currency: Optional[str] = None
+    description: Optional[str] = None
+    subcategory_id: Optional[str] = None
+    end_date: Optional[date] = None
+    active: Optional[bool] = None
+
+class BudgetBase(BaseModel):
+    category_id: str
+    subcategory_id: Optional[str] = None
+    period: Literal["week", "month", "year"] = "month"
+    amount: float = Field(gt=0)
+
+class BudgetCreate(BudgetBase):
+    pass
+
+class Budget(BudgetBase):
+    model_config = ConfigDict(extra="ignore")
+    budget_id: str
+    user_id: str
+    workspace_id: Optional[str] = None
+    currency: str
+    tracked_from: date
+    created_at: datetime
+
+class BudgetUpdate(BaseModel):
+    amount: Optional[float] = Field(None, gt=0)
+
+class WorkspaceCreate(BaseModel):
+    name: str = Field(min_length=1, max_length=100)
+
+class WorkspaceMemberAdd(BaseModel):
+    email: EmailStr
+    role: Literal["owner", "editor", "viewer"] = "editor"
+
+class WorkspaceAccess(BaseModel):
+    workspace_id: str
+    role: Literal["owner", "editor", "viewer"]
+    user: User
+
 # ==================== CURRENCY DATA ====================
 
 CURRENCIES = {
@@ -305,6 +538,14 @@ DEFAULT_INCOME_CATEGORIES = [
     ]},
 ]
 
+def convert_amount(amount: float, from_currency: Optional[str], to_currency: str) -> float:
+    # Unknown currency codes are treated as already being in the target currency.
+    from_rate = EXCHANGE_RATES.get(from_currency or to_currency)
+    to_rate = EXCHANGE_RATES.get(to_currency)
+    if not from_rate or not to_rate:
+        return amount
+    return amount / from_rate * to_rate
+
 def normalize_entry_type(value: Optional[str], default: str = "expense") -> str:
     if not value:
         return default
@@ -314,280 +555,2192 @@ def normalize_entry_type(value: Optional[str], default: str = "expense") -> str:
         raise HTTPException(status_code=400, detail="Invalid entry type")
     return normalized
 
-# ==================== AUTH HELPERS ====================
-
-def build_subcategories_payload(subcategories: List[Dict[str, Any]]) -> List[Dict[str, str]]:
+def build_period_totals_pipeline(match: Dict[str, Any], unit: str) -> List[Dict[str, Any]]:
+    # Dates are stored as ISO strings; bucket on the calendar day prefix.
+    date_trunc: Dict[str, Any] = {"date": "$day", "unit": unit}
+    if unit == "week":
+        date_trunc["startOfWeek"] = "monday"
     return [
+        {"$match": match},
         {
-            "subcategory_id": f"sub_{uuid.uuid4().hex[:12]}",
-            "name": sub["name"],
-            "icon": sub.get("icon") or "tag",
-        }
-        for sub in subcategories
+            "$project": {
+                "_id": 0,
+                "amount": 1,
+                "currency": 1,
+                "entry_type": {"$ifNull": ["$entry_type", "expense"]},
+                "day": {
+                    "$dateFromString": {
+                        "dateString": {"$substrBytes": ["$date", 0, 10]},
+                        "format": "%Y-%m-%d",
+                        "onError": None,
+                        "onNull": None,
+                    }
+                },
+            }
+        },
+        {"$match": {"day": {"$ne": None}}},
+        {
+            "$group": {
+                "_id": {
+                    "period": {"$dateTrunc": date_trunc},
+                    "currency": "$currency",
+                    "entry_type": "$entry_type",
+                },
+                "total": {"$sum": "$amount"},
+                "count": {"$sum": 1},
+            }
+        },
     ]
 
-def build_category_doc(user_id: str, category: Dict[str, Any], entry_type: str) -> Dict[str, Any]:
-    return {
-        "category_id": f"cat_{uuid.uuid4().hex[:12]}",
-        "user_id": user_id,
-        "name": category["name"],
-        "icon": category.get("icon", "folder"),
-        "color": category.get("color", "#064E3B"),
-        "entry_type": entry_type,
-        "subcategories": build_subcategories_payload(category.get("subcategories", [])),
-        "created_at": datetime.now(timezone.utc).isoformat(),
-    }
-
-async def insert_category_doc(user_id: str, category: Dict[str, Any], entry_type: str) -> Dict[str, Any]:
-    category_doc = build_category_doc(user_id, category, entry_type)
-    await db.categories.insert_one(category_doc)
-    return category_doc
+def parse_bucket_day(value: str) -> date:
+    try:
+        return date.fromisoformat(value[:10])
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail=f"Invalid date '{value}'")
 
-def set_session_cookie(response: Response, token: str) -> None:
-    response.set_cookie(
-        key="session_token",
-        value=token,
-        httponly=True,
-        secure=COOKIE_SECURE,
-        samesite=COOKIE_SAMESITE,
-        path="/",
-        max_age=SESSION_ABSOLUTE_HOURS * 60 * 60
-    )
+def truncate_to_bucket(day: date, granularity: str) -> date:
+    if granularity == "week":
+        return day - timedelta(days=day.weekday())
+    if granularity == "month":
+        return day.replace(day=1)
+    if granularity == "year":
+        return day.replace(month=1, day=1)
+    return day
 
+def next_bucket(day: date, granularity: str) -> date:
+    if granularity == "week":
+        return day + timedelta(days=7)
+    if granularity == "month":
+        return date(day.year + (day.month // 12), day.month % 12 + 1, 1)
+    if granularity == "year":
+        return date(day.year + 1, 1, 1)
+    return day + timedelta(days=1)
 
-def get_client_ip(request: Request) -> str:
-    x_forwarded_for = request.headers.get("x-forwarded-for")
-    if x_forwarded_for:
-        return x_forwarded_for.split(",")[0].strip()
-    client_host = request.client.host if request.client else None
-    return client_host or "unknown"
+# ==================== READ ROUTING ====================
 
+def build_read_preference(mode: str, max_staleness: int):
+    preference_class = READ_PREFERENCE_CLASSES.get(mode.replace("_", "").lower())
+    if preference_class is None:
+        logger.warning("Unknown read preference '%s', using primary", mode)
+        return Primary()
+    if preference_class is Primary:
+        return Primary()
+    if 0 <= max_staleness < MONGO_MIN_MAX_STALENESS_SECONDS:
+        max_staleness = MONGO_MIN_MAX_STALENESS_SECONDS
+    return preference_class(max_staleness=max_staleness)
 
-def create_session_doc(user_id: str, request: Request) -> Dict[str, Any]:
-    now = datetime.now(timezone.utc)
-    session_id = f"sess_{uuid.uuid4().hex[:16]}"
+def load_route_read_preferences() -> Dict[str, Any]:
+    default_mode = os.environ.get("MONGO_SECONDARY_READ_PREFERENCE", "primary")
+    max_staleness = int(os.environ.get("MONGO_MAX_STALENESS_SECONDS", "-1"))
     return {
-        "session_id": session_id,
-        "user_id": user_id,
-        "created_at": now.isoformat(),
-        "last_activity_at": now.isoformat(),
-        "idle_expires_at": (now + timedelta(minutes=SESSION_IDLE_MINUTES)).isoformat(),
-        "absolute_expires_at": (now + timedelta(hours=SESSION_ABSOLUTE_HOURS)).isoformat(),
-        "revoked": False,
-        "ip": get_client_ip(request),
-        "user_agent": request.headers.get("user-agent", "unknown"),
+        route: build_read_preference(
+            os.environ.get(f"MONGO_READ_PREFERENCE_{route.upper()}", default_mode),
+            max_staleness,
+        )
+        for route in READ_ROUTES
     }
 
-def build_auth_response(user_doc: Dict[str, Any], token: str) -> Dict[str, Any]:
-    return {
-        "user_id": user_doc["user_id"],
-        "email": user_doc["email"],
-        "name": user_doc["name"],
-        "profile_type": user_doc.get("profile_type", "salaried"),
-        "preferred_currency": user_doc.get("preferred_currency", "USD"),
-        "token": token,
-    }
+route_read_preferences = load_route_read_preferences()
 
-def build_date_query(start_date: Optional[str], end_date: Optional[str]) -> Dict[str, Any]:
-    if not start_date and not end_date:
-        return {}
+def reads_from_primary(route: str) -> bool:
+    read_preference = route_read_preferences.get(route)
+    return read_preference is None or isinstance(read_preference, Primary)
 
-    date_query: Dict[str, str] = {}
-    if start_date:
-        date_query["$gte"] = start_date
-    if end_date:
-        date_query["$lte"] = end_date
-    return {"date": date_query}
+def get_read_db(route: str):
+    if reads_from_primary(route):
+        return db
+    return db.with_options(read_preference=route_read_preferences[route])
 
-def hash_password(password: str) -> str:
-    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+# ==================== STORAGE ====================
 
-def verify_password(password: str, hashed: str) -> bool:
-    return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
+def project_doc(doc: Dict[str, Any], projection: Dict[str, int]) -> Dict[str, Any]:
+    included = {key for key, value in projection.items() if value and key != "_id"}
+    if included:
+        return {key: value for key, value in doc.items() if key in included}
+    return {key: value for key, value in doc.items() if projection.get(key, 1) != 0}
 
-def create_jwt_token(user_id: str, session_id: str) -> str:
-    now = datetime.now(timezone.utc)
-    payload = {
-        "user_id": user_id,
-        "sid": session_id,
-        "exp": now + timedelta(minutes=ACCESS_TOKEN_MINUTES),
-        "iat": now
-    }
-    return jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALGORITHM)
+def build_expense_query(
+    workspace_id: str,
+    cursor: Optional[Tuple[str, str]] = None,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    category_id: Optional[str] = None,
+    subcategory_id: Optional[str] = None,
+    entry_type: Optional[str] = None,
+    min_amount: Optional[float] = None,
+    max_amount: Optional[float] = None,
+    terms: Optional[List[str]] = None,
+) -> Dict[str, Any]:
+    query: Dict[str, Any] = {"workspace_id": workspace_id}
+    if terms:
+        query["search_terms"] = {"$all": terms}
+    if min_amount is not None or max_amount is not None:
+        amount_query: Dict[str, float] = {}
+        if min_amount is not None:
+            amount_query["$gte"] = min_amount
+        if max_amount is not None:
+            amount_query["$lte"] = max_amount
+        query["amount"] = amount_query
+    if category_id:
+        query["category_id"] = category_id
+    if subcategory_id:
+        query["subcategory_id"] = subcategory_id
+    query.update(build_date_query(start_date, end_date))
 
-def decode_jwt_token(token: str) -> Optional[dict]:
-    try:
-        payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
-        return payload
-    except jwt.ExpiredSignatureError:
-        return None
-    except jwt.InvalidTokenError:
-        return None
+    # Entry type and cursor filters are both $or clauses, so they are ANDed explicitly.
+    or_clauses = [build_entry_type_query(entry_type)]
+    if cursor:
+        cursor_date, cursor_expense_id = cursor
+        or_clauses.append({
+            "$or": [
+                {"date": {"$lt": cursor_date}},
+                {"date": cursor_date, "expense_id": {"$lt": cursor_expense_id}},
+            ]
+        })
+    or_clauses = [clause for clause in or_clauses if clause]
+    if or_clauses:
+        query["$and"] = or_clauses
+    return query
 
-async def get_current_user(request: Request) -> User:
-    # Check cookie first
-    session_token = request.cookies.get("session_token")
+class MongoUserRepository:
+    async def get(self, user_id: str) -> Optional[Dict[str, Any]]:
+        return await db.users.find_one({"user_id": user_id}, {"_id": 0})
 
-    # Then check Authorization header
-    auth_header = request.headers.get("Authorization")
-    if auth_header and auth_header.startswith("Bearer "):
-        token = auth_header.split(" ")[1]
-        if not session_token:
-            session_token = token
+    async def get_by_email(self, email: str) -> Optional[Dict[str, Any]]:
+        return await db.users.find_one({"email": email}, {"_id": 0})
 
-    if not session_token:
-        raise HTTPException(status_code=401, detail="Not authenticated")
+    async def insert(self, user_doc: Dict[str, Any]) -> None:
+        await db.users.insert_one(user_doc)
+        user_doc.pop("_id", None)
 
-    payload = decode_jwt_token(session_token)
-    if not payload:
-        raise HTTPException(status_code=401, detail="Invalid token")
+    async def update(self, user_id: str, fields: Dict[str, Any]) -> None:
+        await db.users.update_one({"user_id": user_id}, {"$set": fields})
 
-    user_id = payload.get("user_id")
-    session_id = payload.get("sid")
-    if not user_id or not session_id:
-        raise HTTPException(status_code=401, detail="Invalid token")
+    async def claims_changed_since(self, cutoff: str) -> List[Dict[str, Any]]:
+        return await db.users.find(
+            {"claims_changed_at": {"$gte": cutoff}},
+            {"_id": 0, "user_id": 1, "claims_changed_at": 1},
+        ).to_list(None)
 
-    session_doc = await db.user_sessions.find_one({"session_id": session_id, "user_id": user_id}, {"_id": 0})
-    if not session_doc or session_doc.get("revoked"):
-        raise HTTPException(status_code=401, detail="Session revoked")
+    async def get_many(self, user_ids: List[str]) -> List[Dict[str, Any]]:
+        return await db.users.find({"user_id": {"$in": user_ids}}, {"_id": 0}).to_list(None)
 
-    now = datetime.now(timezone.utc)
-    idle_expires_at = session_doc.get("idle_expires_at")
-    absolute_expires_at = session_doc.get("absolute_expires_at")
+class MongoSessionRepository:
+    async def get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        return await db.user_sessions.find_one({"session_id": session_id}, {"_id": 0})
 
-    try:
-        idle_expiry_dt = datetime.fromisoformat(idle_expires_at) if idle_expires_at else None
-        absolute_expiry_dt = datetime.fromisoformat(absolute_expires_at) if absolute_expires_at else None
-    except Exception:
-        raise HTTPException(status_code=401, detail="Invalid session")
+    async def insert(self, session_doc: Dict[str, Any]) -> None:
+        await db.user_sessions.insert_one(session_doc)
+        session_doc.pop("_id", None)
 
-    if idle_expiry_dt and idle_expiry_dt <= now:
-        await db.user_sessions.update_one({"session_id": session_id}, {"$set": {"revoked": True, "revoked_reason": "idle_timeout"}})
-        raise HTTPException(status_code=401, detail="SESSION_IDLE_TIMEOUT")
+    async def update(self, session_id: str, fields: Dict[str, Any]) -> None:
+        await db.user_sessions.update_one({"session_id": session_id}, {"$set": fields})
 
-    if absolute_expiry_dt and absolute_expiry_dt <= now:
-        await db.user_sessions.update_one({"session_id": session_id}, {"$set": {"revoked": True, "revoked_reason": "absolute_timeout"}})
-        raise HTTPException(status_code=401, detail="SESSION_EXPIRED")
+    async def revoked_since(self, cutoff: str) -> List[Dict[str, Any]]:
+        return await db.user_sessions.find(
+            {"revoked": True, "revoked_at": {"$gte": cutoff}},
+            {"_id": 0, "session_id": 1, "revoked_at": 1},
+        ).to_list(None)
 
-    await db.user_sessions.update_one(
-        {"session_id": session_id},
-        {
-            "$set": {
-                "last_activity_at": now.isoformat(),
-                "idle_expires_at": (now + timedelta(minutes=SESSION_IDLE_MINUTES)).isoformat(),
-            }
-        },
-    )
+class MongoCategoryRepository:
+    async def list(
+        self,
+        workspace_id: str,
+        entry_type: Optional[str] = None,
+        route: Optional[str] = None,
+    ) -> List[Dict[str, Any]]:
+        read_db = get_read_db(route) if route else db
+        query = {"workspace_id": workspace_id}
+        query.update(build_entry_type_query(entry_type))
+        return await read_db.categories.find(query, {"_id": 0}).to_list(200)
 
-    user_doc = await db.users.find_one({"user_id": user_id}, {"_id": 0})
-    if not user_doc:
-        raise HTTPException(status_code=401, detail="Invalid token")
+    async def get(self, workspace_id: str, category_id: str) -> Optional[Dict[str, Any]]:
+        return await db.categories.find_one({"category_id": category_id, "workspace_id": workspace_id}, {"_id": 0})
 
-    return User(**user_doc)
+    async def get_many(self, workspace_id: str, category_ids: List[str]) -> List[Dict[str, Any]]:
+        return await db.categories.find(
+            {"workspace_id": workspace_id, "category_id": {"$in": category_ids}},
+            {"_id": 0},
+        ).to_list(None)
 
-async def create_default_categories(user_id: str, profile_type: str):
-    expense_categories = DEFAULT_CATEGORIES.get(profile_type, DEFAULT_CATEGORIES["salaried"])
-    for cat in expense_categories:
-        await insert_category_doc(user_id, cat, "expense")
-    for cat in DEFAULT_INCOME_CATEGORIES:
-        await insert_category_doc(user_id, cat, "income")
+    async def count(self, workspace_id: str, entry_type: str) -> int:
+        return await db.categories.count_documents({"workspace_id": workspace_id, "entry_type": entry_type})
 
-async def seed_income_categories_if_missing(user_id: str):
-    income_count = await db.categories.count_documents({"user_id": user_id, "entry_type": "income"})
-    if income_count > 0:
-        return
+    async def insert(self, category_doc: Dict[str, Any]) -> None:
+        await db.categories.insert_one(category_doc)
+        category_doc.pop("_id", None)
 
-    for cat in DEFAULT_INCOME_CATEGORIES:
-        await insert_category_doc(user_id, cat, "income")
+    async def update(self, workspace_id: str, category_id: str, fields: Dict[str, Any]) -> None:
+        await db.categories.update_one({"category_id": category_id, "workspace_id": workspace_id}, {"$set": fields})
 
-def normalize_category_doc(category_doc: Dict[str, Any]) -> Dict[str, Any]:
-    if "entry_type" not in category_doc:
-        category_doc["entry_type"] = "expense"
-    return category_doc
+    async def add_subcategory(self, workspace_id: str, category_id: str, subcategory: Dict[str, Any]) -> bool:
+        result = await db.categories.update_one(
+            {"category_id": category_id, "workspace_id": workspace_id},
+            {"$push": {"subcategories": subcategory}},
+        )
+        return result.modified_count > 0
 
-def normalize_expense_doc(expense_doc: Dict[str, Any]) -> Dict[str, Any]:
-    if "entry_type" not in expense_doc:
-        expense_doc["entry_type"] = "expense"
-    return expense_doc
+    async def remove_subcategory(self, workspace_id: str, category_id: str, subcategory_id: str) -> bool:
+        result = await db.categories.update_one(
+            {"category_id": category_id, "workspace_id": workspace_id},
+            {"$pull": {"subcategories": {"subcategory_id": subcategory_id}}},
+        )
+        return result.modified_count > 0
 
-def parse_analytics_cursor(cursor: str) -> Dict[str, Any]:
-    parts = cursor.split("|", 1)
-    if len(parts) != 2:
-        raise HTTPException(status_code=400, detail="Invalid analytics cursor")
+    async def delete(self, workspace_id: str, category_id: str) -> bool:
+        result = await db.categories.delete_one({"category_id": category_id, "workspace_id": workspace_id})
+        return result.deleted_count > 0
 
-    cursor_date = parts[0].strip()
-    cursor_expense_id = parts[1].strip()
-    if not cursor_date or not cursor_expense_id:
-        raise HTTPException(status_code=400, detail="Invalid analytics cursor")
+class MongoExpenseRepository:
+    async def page(
+        self,
+        workspace_id: str,
+        limit: int,
+        projection: Dict[str, int] = EXPENSE_PROJECTION,
+        route: Optional[str] = None,
+        **filters: Any,
+    ) -> List[Dict[str, Any]]:
+        read_db = get_read_db(route) if route else db
+        return await read_db.expenses.find(build_expense_query(workspace_id, **filters), projection).sort([
+            ("date", -1),
+            ("expense_id", -1),
+        ]).to_list(limit)
 
-    return {
-        "$or": [
-            {"date": {"$lt": cursor_date}},
-            {"date": cursor_date, "expense_id": {"$lt": cursor_expense_id}},
-        ]
-    }
+    async def stream(
+        self,
+        workspace_id: str,
+        batch_size: int,
+        route: Optional[str] = None,
+        **filters: Any,
+    ):
+        # Same order as page(), read through one cursor in batch_size round trips.
+        read_db = get_read_db(route) if route else db
+        async for doc in read_db.expenses.find(build_expense_query(workspace_id, **filters), EXPENSE_PROJECTION).sort([
+            ("date", -1),
+            ("expense_id", -1),
+        ]).batch_size(batch_size):
+            yield doc
 
-def build_entry_type_query(entry_type: Optional[str]) -> Dict[str, Any]:
-    if not entry_type:
-        return {}
+    async def existing_fingerprints(self, workspace_id: str, fingerprints: List[str]) -> set:
+        return {
+            doc["fingerprint"]
+            async for doc in db.expenses.find(
+                {"workspace_id": workspace_id, "fingerprint": {"$in": fingerprints}},
+                {"_id": 0, "fingerprint": 1},
+            )
+        }
 
-    normalized = normalize_entry_type(entry_type)
-    if normalized == "expense":
-        return {"$or": [{"entry_type": "expense"}, {"entry_type": {"$exists": False}}]}
-    return {"entry_type": "income"}
+    async def period_totals(
+        self,
+        workspace_id: str,
+        unit: str,
+        route: Optional[str] = None,
+        **filters: Any,
+    ) -> List[Dict[str, Any]]:
+        read_db = get_read_db(route) if route else db
+        pipeline = build_period_totals_pipeline(build_expense_query(workspace_id, **filters), unit)
+        return await read_db.expenses.aggregate(pipeline).to_list(None)
 
-async def ensure_category_for_entry_type(category_id: str, user_id: str, entry_type: str):
-    category = await db.categories.find_one(
-        {"category_id": category_id, "user_id": user_id},
-        {"_id": 0}
-    )
-    if not category:
-        raise HTTPException(status_code=400, detail="Category not found")
+    async def get(
+        self,
+        workspace_id: str,
+        expense_id: str,
+        projection: Dict[str, int] = EXPENSE_PROJECTION,
+    ) -> Optional[Dict[str, Any]]:
+        return await db.expenses.find_one({"expense_id": expense_id, "workspace_id": workspace_id}, projection)
 
-    category_type = normalize_entry_type(category.get("entry_type"), "expense")
-    if category_type != entry_type:
-        raise HTTPException(
-            status_code=400,
-            detail=f"Category type mismatch. Expected '{entry_type}' category."
-        )
+    async def get_many(self, workspace_id: str, expense_ids: List[str]) -> List[Dict[str, Any]]:
+        return await db.expenses.find(
+            {"workspace_id": workspace_id, "expense_id": {"$in": expense_ids}},
+            EXPENSE_PROJECTION,
+        ).to_list(None)
 
-# ==================== AUTH ENDPOINTS ====================
+    async def insert(self, expense_doc: Dict[str, Any]) -> None:
+        await db.expenses.insert_one(expense_doc)
+        expense_doc.pop("_id", None)
 
-@api_router.post("/auth/register")
-async def register(user_data: UserCreate, request: Request, response: Response):
-    existing = await db.users.find_one({"email": user_data.email}, {"_id": 0})
-    if existing:
-        raise HTTPException(status_code=400, detail="Email already registered")
-    
-    user_id = f"user_{uuid.uuid4().hex[:12]}"
-    hashed_pw = hash_password(user_data.password)
-    
-    user_doc = {
-        "user_id": user_id,
-        "email": user_data.email,
-        "name": user_data.name,
-        "password_hash": hashed_pw,
-        "profile_type": user_data.profile_type,
-        "preferred_currency": user_data.preferred_currency,
-        "picture": None,
-        "created_at": datetime.now(timezone.utc).isoformat()
-    }
-    await db.users.insert_one(user_doc)
-    
-    # Create default categories
-    await create_default_categories(user_id, user_data.profile_type)
-    
-    session_doc = create_session_doc(user_id, request)
-    await db.user_sessions.insert_one(session_doc)
+    async def insert_many(self, expense_docs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        # Unique recurrence_key / fingerprint indexes reject rows that already exist;
+        # those are skipped and only the rows actually written are returned.
+        try:
+            await db.expenses.insert_many(expense_docs, ordered=False)
+            inserted = expense_docs
+        except BulkWriteError as exc:
+            write_errors = exc.details.get("writeErrors", [])
+            if any(error.get("code") != 11000 for error in write_errors):
+                raise
+            rejected = {error["index"] for error in write_errors}
+            inserted = [doc for index, doc in enumerate(expense_docs) if index not in rejected]
+        for doc in expense_docs:
+            doc.pop("_id", None)
+        return inserted
 
-    token = create_jwt_token(user_id, session_doc["session_id"])
+    async def update(self, workspace_id: str, expense_id: str, fields: Dict[str, Any]) -> None:
+        await db.expenses.update_one({"expense_id": expense_id, "workspace_id": workspace_id}, {"$set": fields})
 
-    set_session_cookie(response, token)
+    async def delete(self, workspace_id: str, expense_id: str) -> Optional[Dict[str, Any]]:
+        return await db.expenses.find_one_and_delete(
+            {"expense_id": expense_id, "workspace_id": workspace_id},
+            projection={"_id": 0},
+        )
+
+    async def delete_by_category(self, workspace_id: str, category_id: str) -> List[str]:
+        query = {"category_id": category_id, "workspace_id": workspace_id}
+        expense_ids = await db.expenses.distinct("expense_id", query)
+        await db.expenses.delete_many(query)
+        return expense_ids
+
+class MongoWorkspaceRepository:
+    async def memberships(self, user_id: str) -> List[Dict[str, Any]]:
+        return await db.workspace_members.find(
+            {"user_id": user_id},
+            {"_id": 0, "workspace_id": 1, "role": 1},
+        ).to_list(WORKSPACES_MAX_PER_USER)
+
+    async def count_memberships(self, user_id: str) -> int:
+        return await db.workspace_members.count_documents({"user_id": user_id})
+
+    async def get_many(self, workspace_ids: List[str]) -> List[Dict[str, Any]]:
+        return await db.workspaces.find({"workspace_id": {"$in": workspace_ids}}, {"_id": 0}).to_list(WORKSPACES_MAX_PER_USER)
+
+    async def insert(self, workspace_doc: Dict[str, Any]) -> None:
+        await db.workspaces.insert_one(workspace_doc)
+        workspace_doc.pop("_id", None)
+
+    async def members(self, workspace_id: str) -> List[Dict[str, Any]]:
+        return await db.workspace_members.find({"workspace_id": workspace_id}, {"_id": 0}).to_list(None)
+
+    async def get_member(self, workspace_id: str, user_id: str) -> Optional[Dict[str, Any]]:
+        return await db.workspace_members.find_one({"workspace_id": workspace_id, "user_id": user_id}, {"_id": 0})
+
+    async def set_member(self, workspace_id: str, user_id: str, role: str) -> None:
+        await db.workspace_members.update_one(
+            {"workspace_id": workspace_id, "user_id": user_id},
+            {
+                "$set": {"role": role},
+                "$setOnInsert": {"added_at": datetime.now(timezone.utc).isoformat()},
+            },
+            upsert=True,
+        )
+
+    async def count_owners(self, workspace_id: str) -> int:
+        return await db.workspace_members.count_documents({"workspace_id": workspace_id, "role": "owner"})
+
+    async def remove_member(self, workspace_id: str, user_id: str) -> None:
+        await db.workspace_members.delete_one({"workspace_id": workspace_id, "user_id": user_id})
+
+class MongoRecurringRuleRepository:
+    async def list(self, workspace_id: str) -> List[Dict[str, Any]]:
+        return await db.recurring_rules.find({"workspace_id": workspace_id}, {"_id": 0}).to_list(500)
+
+    async def get(self, workspace_id: str, rule_id: str) -> Optional[Dict[str, Any]]:
+        return await db.recurring_rules.find_one({"rule_id": rule_id, "workspace_id": workspace_id}, {"_id": 0})
+
+    async def due(self, today: str, workspace_id: Optional[str], limit: int) -> List[Dict[str, Any]]:
+        query: Dict[str, Any] = {"active": True, "next_occurrence": {"$lte": today}}
+        if workspace_id:
+            query["workspace_id"] = workspace_id
+        return await db.recurring_rules.find(query, {"_id": 0}).to_list(limit)
+
+    async def insert(self, rule_doc: Dict[str, Any]) -> None:
+        await db.recurring_rules.insert_one(rule_doc)
+        rule_doc.pop("_id", None)
+
+    async def advance(self, updates: List[Tuple[Dict[str, Any], Dict[str, Any]]]) -> int:
+        # Each (rule, fields) applies only while the rule is still at the occurrence_index it was
+        # read at, so concurrent writers cannot move a rule backwards. Returns how many applied.
+        if not updates:
+            return 0
+        result = await db.recurring_rules.bulk_write([
+            UpdateOne({"rule_id": rule["rule_id"], "occurrence_index": rule.get("occurrence_index", 0)}, {"$set": fields})
+            for rule, fields in updates
+        ], ordered=False)
+        return result.matched_count
+
+    async def delete(self, workspace_id: str, rule_id: str) -> bool:
+        result = await db.recurring_rules.delete_one({"rule_id": rule_id, "workspace_id": workspace_id})
+        return result.deleted_count > 0
+
+    async def delete_by_category(self, workspace_id: str, category_id: str) -> None:
+        await db.recurring_rules.delete_many({"category_id": category_id, "workspace_id": workspace_id})
+
+class MongoBudgetRepository:
+    async def list(self, workspace_id: str) -> List[Dict[str, Any]]:
+        return await db.budgets.find({"workspace_id": workspace_id}, {"_id": 0}).to_list(BUDGETS_MAX_PER_USER)
+
+    async def count(self, workspace_id: str) -> int:
+        return await db.budgets.count_documents({"workspace_id": workspace_id})
+
+    async def get(self, workspace_id: str, budget_id: str) -> Optional[Dict[str, Any]]:
+        return await db.budgets.find_one({"budget_id": budget_id, "workspace_id": workspace_id}, {"_id": 0})
+
+    async def insert(self, budget_doc: Dict[str, Any]) -> None:
+        await db.budgets.insert_one(budget_doc)
+        budget_doc.pop("_id", None)
+
+    async def update(self, workspace_id: str, budget_id: str, fields: Dict[str, Any]) -> None:
+        await db.budgets.update_one({"budget_id": budget_id, "workspace_id": workspace_id}, {"$set": fields})
+
+    async def delete(self, workspace_id: str, **filters: str) -> int:
+        query = {"workspace_id": workspace_id, **filters}
+        budget_ids = [
+            budget["budget_id"]
+            for budget in await db.budgets.find(query, {"_id": 0, "budget_id": 1}).to_list(BUDGETS_MAX_PER_USER)
+        ]
+        if not budget_ids:
+            return 0
+        await db.budgets.delete_many({"budget_id": {"$in": budget_ids}})
+        await db.budget_usage.delete_many({"budget_id": {"$in": budget_ids}})
+        return len(budget_ids)
+
+    async def add_usage(self, workspace_id: str, deltas: Dict[Tuple[str, str], float]) -> None:
+        await db.budget_usage.bulk_write([
+            UpdateOne(
+                {"budget_id": budget_id, "period_start": period_start},
+                {"$inc": {"consumed": delta}, "$setOnInsert": {"workspace_id": workspace_id}},
+                upsert=True,
+            )
+            for (budget_id, period_start), delta in deltas.items()
+        ], ordered=False)
+
+    async def set_usage(self, workspace_id: str, budget_id: str, consumed: Dict[str, float]) -> None:
+        await db.budget_usage.bulk_write([
+            UpdateOne(
+                {"budget_id": budget_id, "period_start": period_start},
+                {"$set": {"consumed": amount}, "$setOnInsert": {"workspace_id": workspace_id}},
+                upsert=True,
+            )
+            for period_start, amount in consumed.items()
+        ], ordered=False)
+
+    async def usage_periods(self, budget_id: str) -> List[str]:
+        return await db.budget_usage.distinct("period_start", {"budget_id": budget_id})
+
+    async def usage(self, budget_ids: List[str], period_starts: List[str]) -> Dict[Tuple[str, str], float]:
+        usage_docs = await db.budget_usage.find(
+            {"budget_id": {"$in": budget_ids}, "period_start": {"$in": period_starts}},
+            {"_id": 0},
+        ).to_list(None)
+        return {(doc["budget_id"], doc["period_start"]): doc.get("consumed", 0.0) for doc in usage_docs}
+
+class MongoSyncRepository:
+    async def allocate(self, workspace_id: str, count: int) -> int:
+        counter = await db.sync_counters.find_one_and_update(
+            {"workspace_id": workspace_id},
+            {"$inc": {"revision": count}, "$setOnInsert": {"committed": 0}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        return counter["revision"]
+
+    async def log(self, workspace_id: str, entity: str, changes: List[Tuple[str, str, int]], changed_at: str) -> None:
+        await db.sync_changes.bulk_write([
+            UpdateOne(
+                {"workspace_id": workspace_id, "entity": entity, "entity_id": entity_id},
+                {"$set": {"revision": revision, "op": op, "changed_at": changed_at}},
+                upsert=True,
+            )
+            for entity_id, op, revision in changes
+        ], ordered=True)
+
+    async def commit(self, workspace_id: str, first_revision: int, last_revision: int) -> bool:
+        result = await db.sync_counters.update_one(
+            {"workspace_id": workspace_id, "committed": first_revision - 1},
+            {"$set": {"committed": last_revision}},
+        )
+        return result.modified_count > 0
+
+    async def force_commit(self, workspace_id: str, last_revision: int) -> None:
+        await db.sync_counters.update_one({"workspace_id": workspace_id}, {"$max": {"committed": last_revision}})
+
+    async def committed(self, workspace_id: str) -> int:
+        counter = await db.sync_counters.find_one({"workspace_id": workspace_id}, {"_id": 0, "revision": 1, "committed": 1})
+        if not counter:
+            return 0
+        return counter.get("committed", counter["revision"])
+
+    async def changes(self, workspace_id: str, since: int, until: int, limit: int) -> List[Dict[str, Any]]:
+        return await db.sync_changes.find(
+            {"workspace_id": workspace_id, "revision": {"$gt": since, "$lte": until}},
+            {"_id": 0, "entity": 1, "entity_id": 1, "revision": 1, "op": 1, "changed_at": 1},
+        ).sort("revision", 1).to_list(limit)
+
+class MemoryUserRepository:
+    def __init__(self):
+        self._users: Dict[str, Dict[str, Any]] = {}
+        self._ids_by_email: Dict[str, str] = {}
+
+    async def get(self, user_id: str) -> Optional[Dict[str, Any]]:
+        user_doc = self._users.get(user_id)
+        return dict(user_doc) if user_doc else None
+
+    async def get_by_email(self, email: str) -> Optional[Dict[str, Any]]:
+        user_id = self._ids_by_email.get(email)
+        return await self.get(user_id) if user_id else None
+
+    async def insert(self, user_doc: Dict[str, Any]) -> None:
+        self._users[user_doc["user_id"]] = dict(user_doc)
+        self._ids_by_email[user_doc["email"]] = user_doc["user_id"]
+
+    async def update(self, user_id: str, fields: Dict[str, Any]) -> None:
+        if user_id in self._users:
+            self._users[user_id] = {**self._users[user_id], **fields}
+
+    async def claims_changed_since(self, cutoff: str) -> List[Dict[str, Any]]:
+        return [
+            {"user_id": doc["user_id"], "claims_changed_at": doc["claims_changed_at"]}
+            for doc in self._users.values()
+            if (doc.get("claims_changed_at") or "") >= cutoff
+        ]
+
+    async def get_many(self, user_ids: List[str]) -> List[Dict[str, Any]]:
+        return [dict(self._users[user_id]) for user_id in dict.fromkeys(user_ids) if user_id in self._users]
+
+class MemorySessionRepository:
+    def __init__(self):
+        self._sessions: Dict[str, Dict[str, Any]] = {}
+
+    async def get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        session_doc = self._sessions.get(session_id)
+        return dict(session_doc) if session_doc else None
+
+    async def insert(self, session_doc: Dict[str, Any]) -> None:
+        self._sessions[session_doc["session_id"]] = dict(session_doc)
+
+    async def update(self, session_id: str, fields: Dict[str, Any]) -> None:
+        if session_id in self._sessions:
+            self._sessions[session_id] = {**self._sessions[session_id], **fields}
+
+    async def revoked_since(self, cutoff: str) -> List[Dict[str, Any]]:
+        return [
+            {"session_id": doc["session_id"], "revoked_at": doc["revoked_at"]}
+            for doc in self._sessions.values()
+            if doc.get("revoked") and (doc.get("revoked_at") or "") >= cutoff
+        ]
+
+class MemoryCategoryRepository:
+    # workspace_id -> {category_id: doc}; stored docs are replaced, never mutated, so copies handed out stay valid.
+    def __init__(self):
+        self._categories: Dict[str, Dict[str, Dict[str, Any]]] = {}
+
+    async def list(
+        self,
+        workspace_id: str,
+        entry_type: Optional[str] = None,
+        route: Optional[str] = None,
+    ) -> List[Dict[str, Any]]:
+        normalized = normalize_entry_type(entry_type) if entry_type else None
+        return [
+            dict(doc)
+            for doc in self._categories.get(workspace_id, {}).values()
+            if normalized is None or doc.get("entry_type", "expense") == normalized
+        ][:200]
+
+    async def get(self, workspace_id: str, category_id: str) -> Optional[Dict[str, Any]]:
+        category_doc = self._categories.get(workspace_id, {}).get(category_id)
+        return dict(category_doc) if category_doc else None
+
+    async def get_many(self, workspace_id: str, category_ids: List[str]) -> List[Dict[str, Any]]:
+        categories = self._categories.get(workspace_id, {})
+        return [dict(categories[category_id]) for category_id in dict.fromkeys(category_ids) if category_id in categories]
+
+    async def count(self, workspace_id: str, entry_type: str) -> int:
+        return sum(1 for doc in self._categories.get(workspace_id, {}).values() if doc.get("entry_type") == entry_type)
+
+    async def insert(self, category_doc: Dict[str, Any]) -> None:
+        self._categories.setdefault(category_doc["workspace_id"], {})[category_doc["category_id"]] = dict(category_doc)
+
+    async def update(self, workspace_id: str, category_id: str, fields: Dict[str, Any]) -> None:
+        categories = self._categories.get(workspace_id, {})
+        if category_id in categories:
+            categories[category_id] = {**categories[category_id], **fields}
+
+    async def add_subcategory(self, workspace_id: str, category_id: str, subcategory: Dict[str, Any]) -> bool:
+        categories = self._categories.get(workspace_id, {})
+        if category_id not in categories:
+            return False
+        category_doc = categories[category_id]
+        categories[category_id] = {**category_doc, "subcategories": category_doc.get("subcategories", []) + [dict(subcategory)]}
+        return True
+
+    async def remove_subcategory(self, workspace_id: str, category_id: str, subcategory_id: str) -> bool:
+        categories = self._categories.get(workspace_id, {})
+        if category_id not in categories:
+            return False
+        category_doc = categories[category_id]
+        subcategories = [sub for sub in category_doc.get("subcategories", []) if sub["subcategory_id"] != subcategory_id]
+        if len(subcategories) == len(category_doc.get("subcategories", [])):
+            return False
+        categories[category_id] = {**category_doc, "subcategories": subcategories}
+        return True
+
+    async def delete(self, workspace_id: str, category_id: str) -> bool:
+        return self._categories.get(workspace_id, {}).pop(category_id, None) is not None
+
+class MemoryExpenseRepository:
+    # Per-workspace (date, expense_id) keys kept sorted with bisect, mirroring the
+    # (workspace_id, date, expense_id) index: pages and cursors are a reverse walk from a bisect point.
+    def __init__(self):
+        self._docs: Dict[str, Dict[str, Any]] = {}
+        self._keys: Dict[str, List[Tuple[str, str]]] = {}
+        # (workspace_id, field, value) -> expense_id for the unique fingerprint / recurrence_key indexes.
+        self._unique: Dict[Tuple[str, str, str], str] = {}
+
+    def _unique_keys(self, expense_doc: Dict[str, Any]) -> List[Tuple[str, str, str]]:
+        return [
+            (expense_doc["workspace_id"], field, expense_doc[field])
+            for field in ("fingerprint", "recurrence_key")
+            if expense_doc.get(field)
+        ]
+
+    def _check_unique(self, expense_doc: Dict[str, Any], expense_id: Optional[str] = None) -> None:
+        for key in self._unique_keys(expense_doc):
+            owner = self._unique.get(key)
+            if owner is not None and owner != expense_id:
+                raise DuplicateKeyError(f"E11000 duplicate key: {key[1]}", 11000)
+
+    def _store(self, expense_doc: Dict[str, Any]) -> None:
+        self._docs[expense_doc["expense_id"]] = expense_doc
+        bisect.insort(self._keys.setdefault(expense_doc["workspace_id"], []), (expense_doc["date"], expense_doc["expense_id"]))
+        for key in self._unique_keys(expense_doc):
+            self._unique[key] = expense_doc["expense_id"]
+
+    def _unstore(self, expense_doc: Dict[str, Any]) -> None:
+        del self._docs[expense_doc["expense_id"]]
+        keys = self._keys[expense_doc["workspace_id"]]
+        position = bisect.bisect_left(keys, (expense_doc["date"], expense_doc["expense_id"]))
+        del keys[position]
+        for key in self._unique_keys(expense_doc):
+            self._unique.pop(key, None)
+
+    def _lookup(self, workspace_id: str, expense_id: str) -> Optional[Dict[str, Any]]:
+        expense_doc = self._docs.get(expense_id)
+        if expense_doc is None or expense_doc["workspace_id"] != workspace_id:
+            return None
+        return expense_doc
+
+    async def page(
+        self,
+        workspace_id: str,
+        limit: int,
+        projection: Dict[str, int] = EXPENSE_PROJECTION,
+        route: Optional[str] = None,
+        cursor: Optional[Tuple[str, str]] = None,
+        start_date: Optional[str] = None,
+        end_date: Optional[str] = None,
+        category_id: Optional[str] = None,
+        subcategory_id: Optional[str] = None,
+        entry_type: Optional[str] = None,
+        min_amount: Optional[float] = None,
+        max_amount: Optional[float] = None,
+        terms: Optional[List[str]] = None,
+    ) -> List[Dict[str, Any]]:
+        keys = self._keys.get(workspace_id, [])
+        # Keys sort before (end_date, "\uffff") iff date <= end_date, matching the string $lte.
+        position = len(keys)
+        if end_date:
+            position = bisect.bisect_right(keys, (end_date, "\uffff"))
+        if cursor:
+            position = min(position, bisect.bisect_left(keys, cursor))
+        normalized_type = normalize_entry_type(entry_type) if entry_type else None
+        required_terms = set(terms or ())
+
+        results = []
+        for index in range(position - 1, -1, -1):
+            date_key, expense_id = keys[index]
+            if start_date and date_key < start_date:
+                break
+            doc = self._docs[expense_id]
+            if category_id and doc.get("category_id") != category_id:
+                continue
+            if subcategory_id and doc.get("subcategory_id") != subcategory_id:
+                continue
+            if normalized_type and doc.get("entry_type", "expense") != normalized_type:
+                continue
+            if min_amount is not None and doc.get("amount", 0) < min_amount:
+                continue
+            if max_amount is not None and doc.get("amount", 0) > max_amount:
+                continue
+            if required_terms and not required_terms.issubset(doc.get("search_terms", ())):
+                continue
+            results.append(project_doc(doc, projection))
+            if len(results) >= limit:
+                break
+        return results
+
+    async def stream(
+        self,
+        workspace_id: str,
+        batch_size: int,
+        route: Optional[str] = None,
+        **filters: Any,
+    ):
+        # Walks page() by cursor so writes between batches cannot shift the walk.
+        cursor = filters.pop("cursor", None)
+        while True:
+            batch = await self.page(workspace_id, batch_size, cursor=cursor, **filters)
+            for doc in batch:
+                yield doc
+            if len(batch) < batch_size:
+                return
+            cursor = expense_sort_key(batch[-1])
+
+    async def existing_fingerprints(self, workspace_id: str, fingerprints: List[str]) -> set:
+        return {fingerprint for fingerprint in fingerprints if (workspace_id, "fingerprint", fingerprint) in self._unique}
+
+    async def period_totals(
+        self,
+        workspace_id: str,
+        unit: str,
+        route: Optional[str] = None,
+        **filters: Any,
+    ) -> List[Dict[str, Any]]:
+        # Same row shape as build_period_totals_pipeline.
+        totals: Dict[Tuple[date, str, str], List[float]] = {}
+        async for doc in self.stream(workspace_id, 1000, **filters):
+            day = expense_day(doc)
+            if day is None:
+                continue
+            key = (truncate_to_bucket(day, unit), doc.get("currency"), doc.get("entry_type") or "expense")
+            total = totals.setdefault(key, [0.0, 0])
+            total[0] += doc.get("amount", 0.0)
+            total[1] += 1
+        return [
+            {
+                "_id": {"period": datetime(period.year, period.month, period.day), "currency": currency, "entry_type": entry_type},
+                "total": total,
+                "count": count,
+            }
+            for (period, currency, entry_type), (total, count) in totals.items()
+        ]
+
+    async def get(
+        self,
+        workspace_id: str,
+        expense_id: str,
+        projection: Dict[str, int] = EXPENSE_PROJECTION,
+    ) -> Optional[Dict[str, Any]]:
+        expense_doc = self._lookup(workspace_id, expense_id)
+        return project_doc(expense_doc, projection) if expense_doc else None
+
+    async def get_many(self, workspace_id: str, expense_ids: List[str]) -> List[Dict[str, Any]]:
+        return [
+            project_doc(expense_doc, EXPENSE_PROJECTION)
+            for expense_doc in (self._lookup(workspace_id, expense_id) for expense_id in dict.fromkeys(expense_ids))
+            if expense_doc is not None
+        ]
+
+    async def insert(self, expense_doc: Dict[str, Any]) -> None:
+        if expense_doc["expense_id"] in self._docs:
+            raise DuplicateKeyError("E11000 duplicate key: expense_id", 11000)
+        self._check_unique(expense_doc)
+        self._store(dict(expense_doc))
+
+    async def insert_many(self, expense_docs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        inserted = []
+        for expense_doc in expense_docs:
+            try:
+                await self.insert(expense_doc)
+            except DuplicateKeyError:
+                continue
+            inserted.append(expense_doc)
+        return inserted
+
+    async def update(self, workspace_id: str, expense_id: str, fields: Dict[str, Any]) -> None:
+        current = self._lookup(workspace_id, expense_id)
+        if current is None:
+            return
+        updated = {**current, **fields}
+        self._check_unique(updated, expense_id)
+        self._unstore(current)
+        self._store(updated)
+
+    async def delete(self, workspace_id: str, expense_id: str) -> Optional[Dict[str, Any]]:
+        expense_doc = self._lookup(workspace_id, expense_id)
+        if expense_doc is None:
+            return None
+        self._unstore(expense_doc)
+        return dict(expense_doc)
+
+    async def delete_by_category(self, workspace_id: str, category_id: str) -> List[str]:
+        doomed = [
+            self._docs[expense_id]
+            for _, expense_id in self._keys.get(workspace_id, [])
+            if self._docs[expense_id].get("category_id") == category_id
+        ]
+        for expense_doc in doomed:
+            self._unstore(expense_doc)
+        return [expense_doc["expense_id"] for expense_doc in doomed]
+
+class MemoryWorkspaceRepository:
+    def __init__(self):
+        self._workspaces: Dict[str, Dict[str, Any]] = {}
+        # workspace_id -> {user_id: member doc}, plus the reverse index for membership lookups.
+        self._members: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        self._workspace_ids_by_user: Dict[str, set] = {}
+
+    async def memberships(self, user_id: str) -> List[Dict[str, Any]]:
+        return [
+            {"workspace_id": workspace_id, "role": self._members[workspace_id][user_id]["role"]}
+            for workspace_id in self._workspace_ids_by_user.get(user_id, ())
+        ][:WORKSPACES_MAX_PER_USER]
+
+    async def count_memberships(self, user_id: str) -> int:
+        return len(self._workspace_ids_by_user.get(user_id, ()))
+
+    async def get_many(self, workspace_ids: List[str]) -> List[Dict[str, Any]]:
+        return [
+            dict(self._workspaces[workspace_id])
+            for workspace_id in dict.fromkeys(workspace_ids)
+            if workspace_id in self._workspaces
+        ][:WORKSPACES_MAX_PER_USER]
+
+    async def insert(self, workspace_doc: Dict[str, Any]) -> None:
+        if workspace_doc["workspace_id"] in self._workspaces:
+            raise DuplicateKeyError("E11000 duplicate key: workspace_id", 11000)
+        self._workspaces[workspace_doc["workspace_id"]] = dict(workspace_doc)
+
+    async def members(self, workspace_id: str) -> List[Dict[str, Any]]:
+        return [dict(member) for member in self._members.get(workspace_id, {}).values()]
+
+    async def get_member(self, workspace_id: str, user_id: str) -> Optional[Dict[str, Any]]:
+        member = self._members.get(workspace_id, {}).get(user_id)
+        return dict(member) if member else None
+
+    async def set_member(self, workspace_id: str, user_id: str, role: str) -> None:
+        members = self._members.setdefault(workspace_id, {})
+        current = members.get(user_id) or {
+            "workspace_id": workspace_id,
+            "user_id": user_id,
+            "added_at": datetime.now(timezone.utc).isoformat(),
+        }
+        members[user_id] = {**current, "role": role}
+        self._workspace_ids_by_user.setdefault(user_id, set()).add(workspace_id)
+
+    async def count_owners(self, workspace_id: str) -> int:
+        return sum(1 for member in self._members.get(workspace_id, {}).values() if member["role"] == "owner")
+
+    async def remove_member(self, workspace_id: str, user_id: str) -> None:
+        if self._members.get(workspace_id, {}).pop(user_id, None) is None:
+            return
+        workspace_ids = self._workspace_ids_by_user[user_id]
+        workspace_ids.discard(workspace_id)
+        if not workspace_ids:
+            del self._workspace_ids_by_user[user_id]
+
+class MemoryRecurringRuleRepository:
+    def __init__(self):
+        self._rules: Dict[str, Dict[str, Any]] = {}
+
+    async def list(self, workspace_id: str) -> List[Dict[str, Any]]:
+        return [dict(rule) for rule in self._rules.values() if rule["workspace_id"] == workspace_id][:500]
+
+    async def get(self, workspace_id: str, rule_id: str) -> Optional[Dict[str, Any]]:
+        rule = self._rules.get(rule_id)
+        return dict(rule) if rule and rule["workspace_id"] == workspace_id else None
+
+    async def due(self, today: str, workspace_id: Optional[str], limit: int) -> List[Dict[str, Any]]:
+        return [
+            dict(rule)
+            for rule in self._rules.values()
+            if rule.get("active") and rule.get("next_occurrence") and rule["next_occurrence"] <= today
+            and (not workspace_id or rule["workspace_id"] == workspace_id)
+        ][:limit]
+
+    async def insert(self, rule_doc: Dict[str, Any]) -> None:
+        if rule_doc["rule_id"] in self._rules:
+            raise DuplicateKeyError("E11000 duplicate key: rule_id", 11000)
+        self._rules[rule_doc["rule_id"]] = dict(rule_doc)
+
+    async def advance(self, updates: List[Tuple[Dict[str, Any], Dict[str, Any]]]) -> int:
+        matched = 0
+        for rule, fields in updates:
+            current = self._rules.get(rule["rule_id"])
+            if current is None or current.get("occurrence_index") != rule.get("occurrence_index", 0):
+                continue
+            self._rules[rule["rule_id"]] = {**current, **fields}
+            matched += 1
+        return matched
+
+    async def delete(self, workspace_id: str, rule_id: str) -> bool:
+        if await self.get(workspace_id, rule_id) is None:
+            return False
+        del self._rules[rule_id]
+        return True
+
+    async def delete_by_category(self, workspace_id: str, category_id: str) -> None:
+        for rule_id in [
+            rule_id for rule_id, rule in self._rules.items()
+            if rule["workspace_id"] == workspace_id and rule["category_id"] == category_id
+        ]:
+            del self._rules[rule_id]
+
+class MemoryBudgetRepository:
+    def __init__(self):
+        self._budgets: Dict[str, Dict[str, Any]] = {}
+        self._usage: Dict[Tuple[str, str], float] = {}
+
+    async def list(self, workspace_id: str) -> List[Dict[str, Any]]:
+        return [dict(budget) for budget in self._budgets.values() if budget["workspace_id"] == workspace_id][:BUDGETS_MAX_PER_USER]
+
+    async def count(self, workspace_id: str) -> int:
+        return sum(1 for budget in self._budgets.values() if budget["workspace_id"] == workspace_id)
+
+    async def get(self, workspace_id: str, budget_id: str) -> Optional[Dict[str, Any]]:
+        budget = self._budgets.get(budget_id)
+        return dict(budget) if budget and budget["workspace_id"] == workspace_id else None
+
+    async def insert(self, budget_doc: Dict[str, Any]) -> None:
+        if budget_doc["budget_id"] in self._budgets:
+            raise DuplicateKeyError("E11000 duplicate key: budget_id", 11000)
+        self._budgets[budget_doc["budget_id"]] = dict(budget_doc)
+
+    async def update(self, workspace_id: str, budget_id: str, fields: Dict[str, Any]) -> None:
+        if await self.get(workspace_id, budget_id) is not None:
+            self._budgets[budget_id] = {**self._budgets[budget_id], **fields}
+
+    async def delete(self, workspace_id: str, **filters: str) -> int:
+        budget_ids = {
+            budget_id for budget_id, budget in self._budgets.items()
+            if budget["workspace_id"] == workspace_id and all(budget.get(field) == value for field, value in filters.items())
+        }
+        for budget_id in budget_ids:
+            del self._budgets[budget_id]
+        for key in [key for key in self._usage if key[0] in budget_ids]:
+            del self._usage[key]
+        return len(budget_ids)
+
+    async def add_usage(self, workspace_id: str, deltas: Dict[Tuple[str, str], float]) -> None:
+        for key, delta in deltas.items():
+            self._usage[key] = self._usage.get(key, 0.0) + delta
+
+    async def set_usage(self, workspace_id: str, budget_id: str, consumed: Dict[str, float]) -> None:
+        for period_start, amount in consumed.items():
+            self._usage[(budget_id, period_start)] = amount
+
+    async def usage_periods(self, budget_id: str) -> List[str]:
+        return [period_start for usage_budget_id, period_start in self._usage if usage_budget_id == budget_id]
+
+    async def usage(self, budget_ids: List[str], period_starts: List[str]) -> Dict[Tuple[str, str], float]:
+        return {
+            (budget_id, period_start): self._usage[(budget_id, period_start)]
+            for budget_id in budget_ids
+            for period_start in period_starts
+            if (budget_id, period_start) in self._usage
+        }
+
+class MemorySyncRepository:
+    # Per workspace: the counter, the compacted change rows keyed by (entity, entity_id), and
+    # (revision, key) pairs kept sorted with bisect so a feed page is a slice.
+    def __init__(self):
+        self._counters: Dict[str, Dict[str, int]] = {}
+        self._rows: Dict[str, Dict[Tuple[str, str], Dict[str, Any]]] = {}
+        self._revisions: Dict[str, List[Tuple[int, Tuple[str, str]]]] = {}
+
+    async def allocate(self, workspace_id: str, count: int) -> int:
+        counter = self._counters.setdefault(workspace_id, {"revision": 0, "committed": 0})
+        counter["revision"] += count
+        return counter["revision"]
+
+    async def log(self, workspace_id: str, entity: str, changes: List[Tuple[str, str, int]], changed_at: str) -> None:
+        rows = self._rows.setdefault(workspace_id, {})
+        revisions = self._revisions.setdefault(workspace_id, [])
+        for entity_id, op, revision in changes:
+            key = (entity, entity_id)
+            previous = rows.get(key)
+            if previous is not None:
+                del revisions[bisect.bisect_left(revisions, (previous["revision"], key))]
+            rows[key] = {"entity": entity, "entity_id": entity_id, "revision": revision, "op": op, "changed_at": changed_at}
+            bisect.insort(revisions, (revision, key))
+
+    async def commit(self, workspace_id: str, first_revision: int, last_revision: int) -> bool:
+        counter = self._counters.get(workspace_id)
+        if counter is None or counter["committed"] != first_revision - 1:
+            return False
+        counter["committed"] = last_revision
+        return True
+
+    async def force_commit(self, workspace_id: str, last_revision: int) -> None:
+        counter = self._counters.get(workspace_id)
+        if counter is not None:
+            counter["committed"] = max(counter["committed"], last_revision)
+
+    async def committed(self, workspace_id: str) -> int:
+        counter = self._counters.get(workspace_id)
+        return counter["committed"] if counter else 0
+
+    async def changes(self, workspace_id: str, since: int, until: int, limit: int) -> List[Dict[str, Any]]:
+        revisions = self._revisions.get(workspace_id, [])
+        start = bisect.bisect_right(revisions, (since, ("\uffff", "\uffff")))
+        end = bisect.bisect_right(revisions, (until, ("\uffff", "\uffff")))
+        rows = self._rows.get(workspace_id, {})
+        return [dict(rows[key]) for _, key in revisions[start:min(end, start + limit)]]
+
+class Storage:
+    def __init__(self, users, sessions, categories, expenses, workspaces, recurring_rules, budgets, sync):
+        self.users = users
+        self.sessions = sessions
+        self.categories = categories
+        self.expenses = expenses
+        self.workspaces = workspaces
+        self.recurring_rules = recurring_rules
+        self.budgets = budgets
+        self.sync = sync
+
+def build_storage(backend: str) -> Storage:
+    if backend == "memory":
+        return Storage(
+            MemoryUserRepository(),
+            MemorySessionRepository(),
+            MemoryCategoryRepository(),
+            MemoryExpenseRepository(),
+            MemoryWorkspaceRepository(),
+            MemoryRecurringRuleRepository(),
+            MemoryBudgetRepository(),
+            MemorySyncRepository(),
+        )
+    return Storage(
+        MongoUserRepository(),
+        MongoSessionRepository(),
+        MongoCategoryRepository(),
+        MongoExpenseRepository(),
+        MongoWorkspaceRepository(),
+        MongoRecurringRuleRepository(),
+        MongoBudgetRepository(),
+        MongoSyncRepository(),
+    )
+
+storage = build_storage(STORAGE_BACKEND)
+
+async def require_database_ready() -> None:
+    # Fingerprint ordinals depend on the unique index raising DuplicateKeyError; before it
+    # exists, identical writes would share an ordinal and then block the index build.
+    if not database_ready.is_set():
+        raise HTTPException(
+            status_code=503,
+            detail="Database is starting, retry shortly",
+            headers={"Retry-After": str(STARTUP_RETRY_SECONDS)},
+        )
+
+# ==================== CACHE COHERENCE ====================
+
+def apply_remote_invalidation(message: Dict[str, Any]) -> None:
+    # Applied on the workers that did not make the change; the origin already updated its own caches.
+    kind = message.get("type")
+    if kind == "workspace_data":
+        workspace_id = message["workspace_id"]
+        result_cache.bump(workspace_id)
+        # The origin updated its classifier in place; everyone else rebuilds from history on next use.
+        category_classifiers.pop(workspace_id, None)
+    elif kind == "session_revoked":
+        try:
+            revoked_at = datetime.fromisoformat(message["revoked_at"])
+        except (KeyError, TypeError, ValueError):
+            revoked_at = None
+        session_revocations.add(message["session_id"], revoked_at)
+    elif kind == "memberships":
+        workspace_memberships.invalidate_user(message["user_id"])
+    elif kind == "claims_changed":
+        try:
+            changed_at = datetime.fromisoformat(message["changed_at"])
+        except (KeyError, TypeError, ValueError):
+            changed_at = datetime.now(timezone.utc)
+        session_revocations.mark_claims_changed(message["user_id"], changed_at)
+    elif kind == "flush":
+        result_cache.clear()
+        category_classifiers.clear()
+        workspace_memberships.clear()
+        session_revocations.invalidate()
+
+class MemoryInvalidationBus:
+    # One worker: there is nobody to notify.
+    async def start(self) -> None:
+        return None
+
+    def publish(self, message: Dict[str, Any]) -> None:
+        return None
+
+    async def close(self) -> None:
+        return None
+
+class SocketInvalidationBus:
+    # Every worker binds a datagram socket in a shared directory and publishes by sending to all
+    # the others. Messages published during one loop tick are deduplicated and sent together,
+    # since the kernel queues only a handful of datagrams per socket. Sends never block a
+    # request: a peer whose queue is full misses the batch, so it is sent a "flush" (drop every
+    # local cache) as soon as it accepts datagrams again.
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.path = os.path.join(directory, f"{os.getpid()}-{uuid.uuid4().hex[:8]}.sock")
+        self._socket: Optional[socket.socket] = None
+        # Serialized message -> None: an insertion-ordered set, so repeats within a tick collapse.
+        self._pending: Dict[str, None] = {}
+        self._lossy_peers: set = set()
+
+    async def start(self) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        sock.bind(self.path)
+        sock.setblocking(False)
+        self._socket = sock
+        asyncio.get_running_loop().add_reader(sock.fileno(), self._receive)
+
+    def _receive(self) -> None:
+        while True:
+            try:
+                payload = self._socket.recv(INVALIDATION_MAX_DATAGRAM_BYTES)
+            except (BlockingIOError, InterruptedError):
+                return
+            try:
+                messages = json.loads(payload)
+            except ValueError:
+                continue
+            for message in messages:
+                try:
+                    apply_remote_invalidation(message)
+                except Exception as exc:
+                    logger.warning("Ignoring invalidation message %s: %s", message, exc)
+
+    def _send(self, peer: str, payload: bytes) -> Optional[bool]:
+        # True when sent, False when the peer's queue is full, None when the peer is gone.
+        try:
+            self._socket.sendto(payload, peer)
+            return True
+        except (ConnectionRefusedError, FileNotFoundError):
+            self._lossy_peers.discard(peer)
+            try:
+                os.unlink(peer)
+            except OSError:
+                pass
+            return None
+        except (BlockingIOError, InterruptedError):
+            return False
+
+    def _build_payloads(self, messages: List[str]) -> List[bytes]:
+        payloads: List[bytes] = []
+        batch: List[str] = []
+        size = 2
+        for message in messages:
+            if batch and size + len(message) + 1 > INVALIDATION_MAX_DATAGRAM_BYTES:
+                payloads.append(f"[{','.join(batch)}]".encode("utf-8"))
+                batch, size = [], 2
+            batch.append(message)
+            size += len(message) + 1
+        if batch:
+            payloads.append(f"[{','.join(batch)}]".encode("utf-8"))
+        return payloads
+
+    def _flush_pending(self) -> None:
+        pending, self._pending = self._pending, {}
+        if self._socket is None or not pending:
+            return
+        payloads = self._build_payloads(list(pending))
+        flush = json.dumps([{"type": "flush"}]).encode("utf-8")
+        for name in os.listdir(self.directory):
+            peer = os.path.join(self.directory, name)
+            if not name.endswith(".sock") or peer == self.path:
+                continue
+            if peer in self._lossy_peers:
+                if not self._send(peer, flush):
+                    continue
+                self._lossy_peers.discard(peer)
+            for payload in payloads:
+                sent = self._send(peer, payload)
+                if sent is None:
+                    break
+                if not sent:
+                    logger.warning("Invalidation peer %s is not keeping up", name)
+                    self._lossy_peers.add(peer)
+                    break
+
+    def publish(self, message: Dict[str, Any]) -> None:
+        if self._socket is None:
+            return
+        if not self._pending:
+            asyncio.get_running_loop().call_soon(self._flush_pending)
+        self._pending[json.dumps(message, sort_keys=True)] = None
+
+    async def close(self) -> None:
+        if self._socket is None:
+            return
+        self._flush_pending()
+        asyncio.get_running_loop().remove_reader(self._socket.fileno())
+        self._socket.close()
+        self._socket = None
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+
+def build_invalidation_bus(backend: str):
+    if backend == "socket":
+        return SocketInvalidationBus(INVALIDATION_SOCKET_DIR)
+    return MemoryInvalidationBus()
+
+invalidation_bus = build_invalidation_bus(INVALIDATION_BACKEND)
+
+# ==================== RESULT CACHE ====================
+
+class ResultCache:
+    def __init__(self, max_entries: int, max_bytes: int, max_entry_bytes: int, max_versions: int):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+        self._entries: "OrderedDict[tuple, Tuple[bytes, str, Dict[str, str]]]" = OrderedDict()
+        self._bytes = 0
+        # Bumped on every ledger mutation; entries keyed by an older version are never hit again.
+        # Versions come from one clock and live in a bounded LRU: a workspace whose version was
+        # evicted reads the newest evicted version, which is never below any version it had.
+        self.max_versions = max_versions
+        self._versions: "OrderedDict[str, int]" = OrderedDict()
+        self._clock = 0
+        self._evicted_version = 0
+
+    def bump(self, workspace_id: str) -> None:
+        self._clock += 1
+        self._versions.pop(workspace_id, None)
+        self._versions[workspace_id] = self._clock
+        while len(self._versions) > self.max_versions:
+            _, self._evicted_version = self._versions.popitem(last=False)
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._bytes = 0
+
+    def make_key(self, workspace_id: str, endpoint: str, params: Dict[str, Any]) -> tuple:
+        normalized_params = tuple(sorted((k, str(v)) for k, v in params.items() if v is not None))
+        return (workspace_id, endpoint, normalized_params, self._versions.get(workspace_id, self._evicted_version))
+
+    def get(self, key: tuple) -> Optional[Tuple[bytes, str, Dict[str, str]]]:
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+        return entry
+
+    def set(self, key: tuple, body: bytes, media_type: str, headers: Dict[str, str]) -> None:
+        if len(body) > self.max_entry_bytes:
+            return
+
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self._bytes -= len(previous[0])
+        self._entries[key] = (body, media_type, headers)
+        self._bytes += len(body)
+
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            _, (evicted_body, _, _) = self._entries.popitem(last=False)
+            self._bytes -= len(evicted_body)
+
+result_cache = ResultCache(
+    RESULT_CACHE_MAX_ENTRIES,
+    RESULT_CACHE_MAX_BYTES,
+    RESULT_CACHE_MAX_ENTRY_BYTES,
+    RESULT_CACHE_MAX_VERSIONS,
+)
+
+def mark_workspace_data_changed(workspace_id: str) -> None:
+    result_cache.bump(workspace_id)
+    invalidation_bus.publish({"type": "workspace_data", "workspace_id": workspace_id})
+
+async def serve_cached(
+    workspace_id: str,
+    endpoint: str,
+    params: Dict[str, Any],
+    render: Callable[[], Awaitable[Response]],
+    route: Optional[str] = None,
+) -> Response:
+    # A lagging secondary could return pre-mutation data under the new version key.
+    if route and not reads_from_primary(route):
+        return await render()
+
+    # The key captures the data version before rendering, so a concurrent mutation cannot be cached as fresh.
+    key = result_cache.make_key(workspace_id, endpoint, params)
+    cached = result_cache.get(key)
+    if cached is not None:
+        body, media_type, headers = cached
+        return Response(content=body, media_type=media_type, headers={**headers, "X-Cache": "HIT"})
+
+    response = await render()
+    headers = {
+        name: value
+        for name, value in response.headers.items()
+        if name not in {"content-length", "content-type"}
+    }
+    result_cache.set(key, response.body, response.media_type, headers)
+    response.headers["X-Cache"] = "MISS"
+    return response
+
+# ==================== AUTH HELPERS ====================
+
+def build_subcategories_payload(subcategories: List[Dict[str, Any]]) -> List[Dict[str, str]]:
+    return [
+        {
+            "subcategory_id": f"sub_{uuid.uuid4().hex[:12]}",
+            "name": sub["name"],
+            "icon": sub.get("icon") or "tag",
+        }
+        for sub in subcategories
+    ]
+
+def build_category_doc(workspace_id: str, user_id: str, category: Dict[str, Any], entry_type: str) -> Dict[str, Any]:
+    return {
+        "category_id": f"cat_{uuid.uuid4().hex[:12]}",
+        "user_id": user_id,
+        "workspace_id": workspace_id,
+        "name": category["name"],
+        "icon": category.get("icon", "folder"),
+        "color": category.get("color", "#064E3B"),
+        "entry_type": entry_type,
+        "subcategories": build_subcategories_payload(category.get("subcategories", [])),
+        "created_at": datetime.now(timezone.utc).isoformat(),
+    }
+
+async def insert_category_doc(workspace_id: str, user_id: str, category: Dict[str, Any], entry_type: str) -> Dict[str, Any]:
+    category_doc = build_category_doc(workspace_id, user_id, category, entry_type)
+    await storage.categories.insert(category_doc)
+    mark_workspace_data_changed(workspace_id)
+    await record_changes(workspace_id, "category", upserted=[category_doc["category_id"]])
+    return category_doc
+
+def set_session_cookie(response: Response, token: str) -> None:
+    response.set_cookie(
+        key="session_token",
+        value=token,
+        httponly=True,
+        secure=COOKIE_SECURE,
+        samesite=COOKIE_SAMESITE,
+        path="/",
+        max_age=SESSION_ABSOLUTE_HOURS * 60 * 60
+    )
+
+
+def get_client_ip(request: Request) -> str:
+    client_host = (request.client.host if request.client else None) or "unknown"
+    if TRUSTED_PROXY_COUNT <= 0:
+        return client_host
+    # Each trusted proxy appends the peer it saw, so the client is the hop just before them;
+    # anything further left was supplied by the client and is not trusted.
+    forwarded = [hop.strip() for hop in request.headers.get("x-forwarded-for", "").split(",") if hop.strip()]
+    hops = forwarded + [client_host]
+    return hops[max(len(hops) - 1 - TRUSTED_PROXY_COUNT, 0)]
+
+
+def create_session_doc(user_id: str, request: Request) -> Dict[str, Any]:
+    now = datetime.now(timezone.utc)
+    session_id = f"sess_{uuid.uuid4().hex[:16]}"
+    return {
+        "session_id": session_id,
+        "user_id": user_id,
+        "created_at": now.isoformat(),
+        "last_activity_at": now.isoformat(),
+        "idle_expires_at": (now + timedelta(minutes=SESSION_IDLE_MINUTES)).isoformat(),
+        "absolute_expires_at": (now + timedelta(hours=SESSION_ABSOLUTE_HOURS)).isoformat(),
+        "revoked": False,
+        "ip": get_client_ip(request),
+        "user_agent": request.headers.get("user-agent", "unknown"),
+    }
+
+def build_auth_response(user_doc: Dict[str, Any], token: str) -> Dict[str, Any]:
+    return {
+        "user_id": user_doc["user_id"],
+        "email": user_doc["email"],
+        "name": user_doc["name"],
+        "profile_type": user_doc.get("profile_type", "salaried"),
+        "preferred_currency": user_doc.get("preferred_currency", "USD"),
+        "token": token,
+    }
+
+def build_date_query(start_date: Optional[str], end_date: Optional[str]) -> Dict[str, Any]:
+    if not start_date and not end_date:
+        return {}
+
+    date_query: Dict[str, str] = {}
+    if start_date:
+        date_query["$gte"] = start_date
+    if end_date:
+        date_query["$lte"] = end_date
+    return {"date": date_query}
+
+def hash_password(password: str) -> str:
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+
+def verify_password(password: str, hashed: str) -> bool:
+    return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
+
+def create_jwt_token(user_doc: Dict[str, Any], session_doc: Dict[str, Any]) -> str:
+    now = datetime.now(timezone.utc)
+    payload = {
+        "user_id": user_doc["user_id"],
+        "sid": session_doc["session_id"],
+        "email": user_doc["email"],
+        "name": user_doc["name"],
+        "profile_type": user_doc.get("profile_type", "salaried"),
+        "preferred_currency": user_doc.get("preferred_currency", "USD"),
+        "picture": user_doc.get("picture"),
+        "created_at": user_doc.get("created_at"),
+        "exp": now + timedelta(minutes=ACCESS_TOKEN_MINUTES),
+        "iat": now
+    }
+    absolute_expires_at = session_doc.get("absolute_expires_at")
+    if absolute_expires_at:
+        payload["sexp"] = int(datetime.fromisoformat(absolute_expires_at).timestamp())
+    return jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALGORITHM)
+
+def decode_jwt_token(token: str, allow_expired: bool = False) -> Optional[dict]:
+    try:
+        payload = jwt.decode(
+            token,
+            JWT_SECRET,
+            algorithms=[JWT_ALGORITHM],
+            options={"verify_exp": not allow_expired},
+        )
+        return payload
+    except jwt.ExpiredSignatureError:
+        return None
+    except jwt.InvalidTokenError:
+        return None
+
+def extract_session_token(request: Request) -> Optional[str]:
+    # Check cookie first
+    session_token = request.cookies.get("session_token")
+
+    # Then check Authorization header
+    auth_header = request.headers.get("Authorization")
+    if auth_header and auth_header.startswith("Bearer "):
+        token = auth_header.split(" ")[1]
+        if not session_token:
+            session_token = token
+    return session_token
+
+class SessionRevocationList:
+    # Also tracks users whose profile changed: tokens issued before that carry stale claims.
+    def __init__(self, window_minutes: int):
+        self.window = timedelta(minutes=window_minutes)
+        self._revoked: Dict[str, datetime] = {}
+        self._claims_changed: Dict[str, datetime] = {}
+        self._synced_at: Optional[datetime] = None
+
+    def add(self, session_id: str, revoked_at: Optional[datetime] = None) -> None:
+        self._revoked[session_id] = revoked_at or datetime.now(timezone.utc)
+
+    def mark_claims_changed(self, user_id: str, changed_at: datetime) -> None:
+        current = self._claims_changed.get(user_id)
+        if current is None or changed_at > current:
+            self._claims_changed[user_id] = changed_at
+
+    def has_stale_claims(self, user_id: str, issued_at: Any) -> bool:
+        changed_at = self._claims_changed.get(user_id)
+        if changed_at is None:
+            return False
+        return not isinstance(issued_at, (int, float)) or issued_at < changed_at.timestamp()
+
+    def invalidate(self) -> None:
+        # Forces full session checks until the next refresh repopulates the list.
+        self._synced_at = None
+
+    def is_revoked(self, session_id: str) -> bool:
+        return session_id in self._revoked
+
+    @property
+    def is_stale(self) -> bool:
+        if self._synced_at is None:
+            return True
+        max_age = timedelta(seconds=max(REVOCATION_REFRESH_SECONDS, 1) * 3)
+        return datetime.now(timezone.utc) - self._synced_at > max_age
+
+    async def refresh(self) -> None:
+        now = datetime.now(timezone.utc)
+        cutoff = now - self.window
+        revoked: Dict[str, datetime] = {
+            session_id: revoked_at
+            for session_id, revoked_at in self._revoked.items()
+            if revoked_at > cutoff
+        }
+        for doc in await storage.sessions.revoked_since(cutoff.isoformat()):
+            try:
+                revoked[doc["session_id"]] = datetime.fromisoformat(doc["revoked_at"])
+            except (KeyError, TypeError, ValueError):
+                revoked[doc.get("session_id", "")] = now
+        claims_changed: Dict[str, datetime] = {
+            user_id: changed_at
+            for user_id, changed_at in self._claims_changed.items()
+            if changed_at > cutoff
+        }
+        for doc in await storage.users.claims_changed_since(cutoff.isoformat()):
+            try:
+                changed_at = datetime.fromisoformat(doc["claims_changed_at"])
+            except (KeyError, TypeError, ValueError):
+                changed_at = now
+            claims_changed[doc["user_id"]] = max(changed_at, claims_changed.get(doc["user_id"], changed_at))
+        self._revoked = revoked
+        self._claims_changed = claims_changed
+        self._synced_at = now
+
+    async def run(self) -> None:
+        while True:
+            try:
+                await self.refresh()
+            except Exception as exc:
+                logger.warning("Unable to refresh session revocation list: %s", exc)
+            await asyncio.sleep(REVOCATION_REFRESH_SECONDS)
+
+session_revocations = SessionRevocationList(ACCESS_TOKEN_MINUTES)
+
+def build_user_from_claims(payload: Dict[str, Any]) -> Optional[User]:
+    if not payload.get("email") or not payload.get("name") or not payload.get("created_at"):
+        return None
+
+    session_expiry = payload.get("sexp")
+    if session_expiry and session_expiry <= datetime.now(timezone.utc).timestamp():
+        return None
+
+    try:
+        return User(
+            user_id=payload["user_id"],
+            email=payload["email"],
+            name=payload["name"],
+            profile_type=payload.get("profile_type", "salaried"),
+            preferred_currency=payload.get("preferred_currency", "USD"),
+            picture=payload.get("picture"),
+            created_at=payload["created_at"],
+        )
+    except Exception:
+        return None
+
+async def revoke_session(session_id: str, reason: str) -> None:
+    revoked_at = datetime.now(timezone.utc)
+    await storage.sessions.update(
+        session_id,
+        {"revoked": True, "revoked_reason": reason, "revoked_at": revoked_at.isoformat()},
+    )
+    session_revocations.add(session_id, revoked_at)
+    invalidation_bus.publish({"type": "session_revoked", "session_id": session_id, "revoked_at": revoked_at.isoformat()})
+
+def mark_user_claims_changed(user_id: str, changed_at: datetime) -> None:
+    session_revocations.mark_claims_changed(user_id, changed_at)
+    invalidation_bus.publish({"type": "claims_changed", "user_id": user_id, "changed_at": changed_at.isoformat()})
+
+async def validate_session(user_id: str, session_id: str) -> Dict[str, Any]:
+    session_doc = await storage.sessions.get(session_id)
+    if not session_doc or session_doc.get("user_id") != user_id or session_doc.get("revoked"):
+        raise HTTPException(status_code=401, detail="Session revoked")
+
+    now = datetime.now(timezone.utc)
+    idle_expires_at = session_doc.get("idle_expires_at")
+    absolute_expires_at = session_doc.get("absolute_expires_at")
+
+    try:
+        idle_expiry_dt = datetime.fromisoformat(idle_expires_at) if idle_expires_at else None
+        absolute_expiry_dt = datetime.fromisoformat(absolute_expires_at) if absolute_expires_at else None
+    except Exception:
+        raise HTTPException(status_code=401, detail="Invalid session")
+
+    if idle_expiry_dt and idle_expiry_dt <= now:
+        await revoke_session(session_id, "idle_timeout")
+        raise HTTPException(status_code=401, detail="SESSION_IDLE_TIMEOUT")
+
+    if absolute_expiry_dt and absolute_expiry_dt <= now:
+        await revoke_session(session_id, "absolute_timeout")
+        raise HTTPException(status_code=401, detail="SESSION_EXPIRED")
+
+    await storage.sessions.update(
+        session_id,
+        {
+            "last_activity_at": now.isoformat(),
+            "idle_expires_at": (now + timedelta(minutes=SESSION_IDLE_MINUTES)).isoformat(),
+        },
+    )
+    return session_doc
+
+async def get_current_user(request: Request) -> User:
+    session_token = extract_session_token(request)
+    if not session_token:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+
+    payload = decode_jwt_token(session_token)
+    if not payload:
+        raise HTTPException(status_code=401, detail="Invalid token")
+
+    user_id = payload.get("user_id")
+    session_id = payload.get("sid")
+    if not user_id or not session_id:
+        raise HTTPException(status_code=401, detail="Invalid token")
+    request.state.session_id = session_id
+
+    # Hybrid mode: trust the signed claims unless the revocation list is out of date.
+    if AUTH_TOKEN_MODE == "hybrid" and not session_revocations.is_stale:
+        if session_revocations.is_revoked(session_id):
+            raise HTTPException(status_code=401, detail="Session revoked")
+        # Profile changed after this token was issued: load the user instead of trusting its claims.
+        claims_user = None if session_revocations.has_stale_claims(user_id, payload.get("iat")) else build_user_from_claims(payload)
+        if claims_user:
+            return claims_user
+
+    await validate_session(user_id, session_id)
+
+    user_doc = await storage.users.get(user_id)
+    if not user_doc:
+        raise HTTPException(status_code=401, detail="Invalid token")
+
+    return User(**user_doc)
+
+class WorkspaceMembershipCache:
+    # session_id -> (loaded_at, user_id, {workspace_id: role}). A session resolves its
+    # memberships once per TTL no matter how many members the workspaces have.
+    def __init__(self, ttl_seconds: int, max_sessions: int):
+        self.ttl_seconds = ttl_seconds
+        self.max_sessions = max_sessions
+        self._entries: "OrderedDict[str, Tuple[float, str, Dict[str, str]]]" = OrderedDict()
+        self._sessions_by_user: Dict[str, set] = {}
+
+    async def get(self, session_id: str, user_id: str) -> Dict[str, str]:
+        now = time.monotonic()
+        entry = self._entries.get(session_id)
+        if entry is not None and entry[1] == user_id and now - entry[0] < self.ttl_seconds:
+            self._entries.move_to_end(session_id)
+            return entry[2]
+
+        memberships = await storage.workspaces.memberships(user_id)
+        roles = {doc["workspace_id"]: doc["role"] for doc in memberships}
+        self._entries[session_id] = (now, user_id, roles)
+        self._entries.move_to_end(session_id)
+        self._sessions_by_user.setdefault(user_id, set()).add(session_id)
+        while len(self._entries) > self.max_sessions:
+            evicted_session_id, (_, evicted_user_id, _) = self._entries.popitem(last=False)
+            sessions = self._sessions_by_user.get(evicted_user_id)
+            if sessions is not None:
+                sessions.discard(evicted_session_id)
+                if not sessions:
+                    del self._sessions_by_user[evicted_user_id]
+        return roles
+
+    def invalidate_user(self, user_id: str) -> None:
+        for session_id in self._sessions_by_user.pop(user_id, ()):
+            self._entries.pop(session_id, None)
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._sessions_by_user.clear()
+
+workspace_memberships = WorkspaceMembershipCache(WORKSPACE_MEMBERSHIP_TTL_SECONDS, WORKSPACE_MEMBERSHIP_CACHE_SESSIONS)
+
+def invalidate_workspace_memberships(user_id: str) -> None:
+    workspace_memberships.invalidate_user(user_id)
+    invalidation_bus.publish({"type": "memberships", "user_id": user_id})
+
+async def resolve_workspace_role(request: Request, user: User, workspace_id: str) -> Optional[str]:
+    # Every user owns a personal workspace whose id is their user_id; it needs no lookup.
+    if workspace_id == user.user_id:
+        return "owner"
+    session_id = getattr(request.state, "session_id", None) or user.user_id
+    memberships = await workspace_memberships.get(session_id, user.user_id)
+    return memberships.get(workspace_id)
+
+async def get_workspace(request: Request, user: User = Depends(get_current_user)) -> WorkspaceAccess:
+    # EventSource cannot set headers, so the query parameter is accepted as well.
+    workspace_id = (
+        request.headers.get("x-workspace-id")
+        or request.query_params.get("workspace_id")
+        or user.user_id
+    )
+    role = await resolve_workspace_role(request, user, workspace_id)
+    if role is None:
+        raise HTTPException(status_code=404, detail="Workspace not found")
+    return WorkspaceAccess(workspace_id=workspace_id, role=role, user=user)
+
+async def get_writable_workspace(workspace: WorkspaceAccess = Depends(get_workspace)) -> WorkspaceAccess:
+    if workspace.role == "viewer":
+        raise HTTPException(status_code=403, detail="Read-only access to this workspace")
+    return workspace
+
+async def create_default_categories(workspace_id: str, user_id: str, profile_type: str):
+    expense_categories = DEFAULT_CATEGORIES.get(profile_type, DEFAULT_CATEGORIES["salaried"])
+    for cat in expense_categories:
+        await insert_category_doc(workspace_id, user_id, cat, "expense")
+    for cat in DEFAULT_INCOME_CATEGORIES:
+        await insert_category_doc(workspace_id, user_id, cat, "income")
+
+async def seed_income_categories_if_missing(workspace_id: str, user_id: str):
+    income_count = await storage.categories.count(workspace_id, "income")
+    if income_count > 0:
+        return
+
+    for cat in DEFAULT_INCOME_CATEGORIES:
+        await insert_category_doc(workspace_id, user_id, cat, "income")
+
+def normalize_category_doc(category_doc: Dict[str, Any]) -> Dict[str, Any]:
+    if "entry_type" not in category_doc:
+        category_doc["entry_type"] = "expense"
+    return category_doc
+
+def normalize_expense_doc(expense_doc: Dict[str, Any]) -> Dict[str, Any]:
+    if "entry_type" not in expense_doc:
+        expense_doc["entry_type"] = "expense"
+    return expense_doc
+
+def tokenize_description(description: Optional[str]) -> List[str]:
+    return re.findall(r"[^\W_]+", (description or "").lower())
+
+def build_search_terms(description: Optional[str]) -> List[str]:
+    # Edge n-grams of every word, so prefix queries become exact multikey index matches.
+    terms = set()
+    for word in tokenize_description(description):
+        for end in range(SEARCH_TERM_MIN_LENGTH, min(len(word), SEARCH_TERM_MAX_LENGTH) + 1):
+            terms.add(word[:end])
+    return sorted(terms)
+
+def build_search_query_terms(q: Optional[str]) -> List[str]:
+    return sorted({
+        word[:SEARCH_TERM_MAX_LENGTH]
+        for word in tokenize_description(q)
+        if len(word) >= SEARCH_TERM_MIN_LENGTH
+    })
+
+def expense_fingerprint_base(expense_doc: Dict[str, Any]) -> str:
+    try:
+        amount = f"{float(expense_doc.get('amount') or 0):.2f}"
+    except (TypeError, ValueError):
+        amount = str(expense_doc.get("amount"))
+    parts = [
+        str(expense_doc.get("date") or "")[:10],
+        amount,
+        str(expense_doc.get("currency") or "").upper(),
+        " ".join(str(expense_doc.get("description") or "").lower().split()),
+        str(expense_doc.get("category_id") or ""),
+    ]
+    return hashlib.sha256("|".join(parts).encode("utf-8")).hexdigest()[:24]
+
+def assign_batch_fingerprints(expense_docs: List[Dict[str, Any]]) -> None:
+    # The n-th identical row in a batch gets ordinal n, so genuinely repeated rows in one
+    # statement survive while re-importing the same statement maps onto the same fingerprints.
+    seen: Dict[Tuple[str, str], int] = {}
+    for expense_doc in expense_docs:
+        base = expense_fingerprint_base(expense_doc)
+        key = (expense_doc["workspace_id"], base)
+        ordinal = seen.get(key, 0)
+        seen[key] = ordinal + 1
+        expense_doc["fingerprint"] = f"{base}:{ordinal}"
+
+async def insert_expense_doc(expense_doc: Dict[str, Any]) -> None:
+    # Manual entries may legitimately repeat (two coffees a day): take the next free ordinal.
+    base = expense_fingerprint_base(expense_doc)
+    for ordinal in range(FINGERPRINT_MAX_ORDINAL):
+        expense_doc["fingerprint"] = f"{base}:{ordinal}"
+        try:
+            await storage.expenses.insert(expense_doc)
+            return
+        except DuplicateKeyError:
+            expense_doc.pop("_id", None)
+    raise HTTPException(status_code=409, detail="Too many identical transactions")
+
+async def update_expense_doc(
+    workspace_id: str,
+    expense_id: str,
+    update_data: Dict[str, Any],
+    merged_doc: Dict[str, Any],
+) -> None:
+    # updated_at lets an archive pass tell a row it copied from one edited since.
+    update_data = {**update_data, "updated_at": datetime.now(timezone.utc).isoformat()}
+    base = expense_fingerprint_base(merged_doc)
+    current = str(merged_doc.get("fingerprint") or "")
+    if current.startswith(f"{base}:"):
+        await storage.expenses.update(workspace_id, expense_id, update_data)
+        return
+
+    for ordinal in range(FINGERPRINT_MAX_ORDINAL):
+        try:
+            await storage.expenses.update(workspace_id, expense_id, {**update_data, "fingerprint": f"{base}:{ordinal}"})
+            return
+        except DuplicateKeyError:
+            continue
+    raise HTTPException(status_code=409, detail="Too many identical transactions")
+
+async def insert_expenses_skipping_duplicates(expense_docs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    if not expense_docs:
+        return []
+    return await storage.expenses.insert_many(expense_docs)
+
+def parse_analytics_cursor(cursor: str) -> Tuple[str, str]:
+    parts = cursor.split("|", 1)
+    if len(parts) != 2:
+        raise HTTPException(status_code=400, detail="Invalid analytics cursor")
+
+    cursor_date = parts[0].strip()
+    cursor_expense_id = parts[1].strip()
+    if not cursor_date or not cursor_expense_id:
+        raise HTTPException(status_code=400, detail="Invalid analytics cursor")
+
+    return cursor_date, cursor_expense_id
+
+def build_next_cursor(page_expenses: List[Dict[str, Any]], has_more: bool) -> Optional[str]:
+    if not has_more or not page_expenses:
+        return None
+
+    last_expense = page_expenses[-1]
+    last_date = str(last_expense.get("date", "")).strip()
+    last_id = str(last_expense.get("expense_id", "")).strip()
+    if last_date and last_id:
+        return f"{last_date}|{last_id}"
+    return None
+
+def build_entry_type_query(entry_type: Optional[str]) -> Dict[str, Any]:
+    if not entry_type:
+        return {}
+
+    normalized = normalize_entry_type(entry_type)
+    if normalized == "expense":
+        return {"$or": [{"entry_type": "expense"}, {"entry_type": {"$exists": False}}]}
+    return {"entry_type": "income"}
+
+async def ensure_category_for_entry_type(category_id: str, workspace_id: str, entry_type: str):
+    category = await storage.categories.get(workspace_id, category_id)
+    if not category:
+        raise HTTPException(status_code=400, detail="Category not found")
+
+    category_type = normalize_entry_type(category.get("entry_type"), "expense")
+    if category_type != entry_type:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Category type mismatch. Expected '{entry_type}' category."
+        )
+
+# ==================== RATE LIMITING ====================
+
+class MemoryTokenBucketLimiter:
+    def __init__(self, name: str, capacity: int, per_minute: float):
+        self.name = name
+        self.capacity = float(capacity)
+        self.rate = per_minute / 60.0
+        # key -> (tokens, updated_at); re-inserted on every touch so iteration order is LRU.
+        self._buckets: Dict[str, tuple] = {}
+        self._evicted_at = time.monotonic()
+
+    def _evict(self, now: float) -> None:
+        self._evicted_at = now
+        full_keys = [
+            key
+            for key, (tokens, updated_at) in self._buckets.items()
+            if tokens + (now - updated_at) * self.rate >= self.capacity
+        ]
+        for key in full_keys:
+            del self._buckets[key]
+
+        overflow = len(self._buckets) - RATE_LIMIT_MAX_KEYS
+        if overflow > 0:
+            for key in list(self._buckets)[:overflow]:
+                del self._buckets[key]
+
+    async def consume(self, key: str, cost: float = 1.0) -> float:
+        now = time.monotonic()
+        if now - self._evicted_at >= RATE_LIMIT_EVICT_SECONDS or len(self._buckets) > RATE_LIMIT_MAX_KEYS:
+            self._evict(now)
+
+        tokens, updated_at = self._buckets.pop(key, (self.capacity, now))
+        tokens = min(self.capacity, tokens + (now - updated_at) * self.rate)
+        allowed = tokens >= cost
+        if allowed:
+            tokens -= cost
+        self._buckets[key] = (tokens, now)
+        return 0.0 if allowed else (cost - tokens) / self.rate
+
+class MongoTokenBucketLimiter:
+    def __init__(self, name: str, capacity: int, per_minute: float):
+        self.name = name
+        self.capacity = float(capacity)
+        self.rate = per_minute / 60.0
+
+    async def consume(self, key: str, cost: float = 1.0) -> float:
+        now = time.time()
+        refilled = {
+            "$min": [
+                self.capacity,
+                {
+                    "$add": [
+                        {"$ifNull": ["$tokens", self.capacity]},
+                        {"$multiply": [{"$max": [0, {"$subtract": [now, {"$ifNull": ["$updated_at", now]}]}]}, self.rate]},
+                    ]
+                },
+            ]
+        }
+        pipeline = [
+            {"$set": {"tokens": refilled}},
+            {
+                "$set": {
+                    "allowed": {"$gte": ["$tokens", cost]},
+                    "tokens": {"$cond": [{"$gte": ["$tokens", cost]}, {"$subtract": ["$tokens", cost]}, "$tokens"]},
+                    "updated_at": now,
+                    "expires_at": datetime.now(timezone.utc) + timedelta(seconds=self.capacity / self.rate),
+                }
+            },
+        ]
+        bucket = await db.rate_limits.find_one_and_update(
+            {"_id": f"{self.name}:{key}"},
+            pipeline,
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        if bucket.get("allowed"):
+            return 0.0
+        return (cost - bucket.get("tokens", 0.0)) / self.rate
+
+def build_rate_limiter(name: str, capacity: int, per_minute: float):
+    if AUTH_RATE_LIMIT_BACKEND == "mongo":
+        return MongoTokenBucketLimiter(name, capacity, per_minute)
+    return MemoryTokenBucketLimiter(name, capacity, per_minute)
+
+auth_ip_limiter = build_rate_limiter("auth_ip", AUTH_RATE_LIMIT_IP_BURST, AUTH_RATE_LIMIT_IP_PER_MINUTE)
+auth_email_limiter = build_rate_limiter("auth_email", AUTH_RATE_LIMIT_EMAIL_BURST, AUTH_RATE_LIMIT_EMAIL_PER_MINUTE)
+
+async def enforce_rate_limit(limiter, key: str) -> None:
+    try:
+        retry_after = await limiter.consume(key)
+    except Exception as exc:
+        # Fail open: a rate-limit store outage must not lock everyone out.
+        logger.warning("Rate limiter '%s' unavailable: %s", limiter.name, exc)
+        return
+
+    if retry_after > 0:
+        raise HTTPException(
+            status_code=429,
+            detail="Too many attempts. Please try again later.",
+            headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+        )
+
+# ==================== CONCURRENCY LIMITS ====================
+
+class WeightedSemaphore:
+    # FIFO: a heavy request at the head is not overtaken by lighter ones, so it cannot starve.
+    def __init__(self, capacity: int, max_queue: int):
+        self.capacity = capacity
+        self.max_queue = max_queue
+        self.in_use = 0
+        self._waiters: deque = deque()
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    def _wake(self) -> None:
+        while self._waiters:
+            cost, future = self._waiters[0]
+            if future.done():
+                self._waiters.popleft()
+                continue
+            if self.in_use + cost > self.capacity:
+                return
+            self._waiters.popleft()
+            self.in_use += cost
+            future.set_result(True)
+
+    async def acquire(self, cost: int, timeout: float) -> Optional[str]:
+        # Returns None once admitted, otherwise why the request was shed.
+        cost = min(cost, self.capacity)
+        if not self._waiters and self.in_use + cost <= self.capacity:
+            self.in_use += cost
+            return None
+        if len(self._waiters) >= self.max_queue:
+            return "queue_full"
+
+        future = asyncio.get_running_loop().create_future()
+        waiter = (cost, future)
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(future, max(timeout, 0.0))
+            return None
+        except asyncio.TimeoutError:
+            return "timeout"
+        except asyncio.CancelledError:
+            # Admitted at the moment the client went away: hand the capacity back.
+            if future.done() and not future.cancelled():
+                self.release(cost)
+            raise
+        finally:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+                self._wake()
+
+    def release(self, cost: int) -> None:
+        self.in_use -= min(cost, self.capacity)
+        self._wake()
+
+class AdmissionController:
+    def __init__(self, worker_capacity: int, user_capacity: int, max_wait_ms: int, max_queue: int):
+        self.user_capacity = user_capacity
+        self.max_wait = max_wait_ms / 1000
+        self.worker = WeightedSemaphore(worker_capacity, max_queue)
+        self.routes = {
+            route: WeightedSemaphore(limit, max_queue)
+            for route, limit in (
+                (route, int(os.environ.get(f"CONCURRENCY_LIMIT_{route.upper()}", str(default))))
+                for route, default in CONCURRENCY_ROUTE_DEFAULT_LIMITS.items()
+            )
+            if limit > 0
+        }
+        self._user_usage: Dict[str, int] = {}
+        self.counters: Dict[str, Dict[str, int]] = {
+            route: {"admitted": 0, "queued": 0, "rejected_user": 0, "rejected_queue_full": 0, "rejected_timeout": 0}
+            for route in CONCURRENCY_ROUTE_COSTS
+        }
+
+    async def acquire(self, route: str, user_key: str) -> Tuple[Optional[str], int]:
+        # Returns (None, cost) once every level admitted the request, else (reason, 0).
+        cost = CONCURRENCY_ROUTE_COSTS[route]
+        counters = self.counters[route]
+        # A user over their own allowance is refused outright; queueing would only let them
+        # occupy queue slots other users need.
+        usage = self._user_usage.get(user_key, 0)
+        if self.user_capacity > 0 and usage and usage + cost > self.user_capacity:
+            counters["rejected_user"] += 1
+            return "user", 0
+        self._user_usage[user_key] = usage + cost
+
+        # Route limits count requests; the worker pool is weighted by cost.
+        deadline = time.monotonic() + self.max_wait
+        acquired = []
+        levels = [(self.routes.get(route), 1), (self.worker, cost)]
+        try:
+            for semaphore, units in levels:
+                if semaphore is None:
+                    continue
+                if semaphore.queued or semaphore.in_use + min(units, semaphore.capacity) > semaphore.capacity:
+                    counters["queued"] += 1
+                reason = await semaphore.acquire(units, deadline - time.monotonic())
+                if reason is not None:
+                    self._release_held(acquired, user_key, cost)
+                    counters[f"rejected_{reason}"] += 1
+                    return reason, 0
+                acquired.append((semaphore, units))
+        except BaseException:
+            # Cancelled while queued (client gone, shutdown): nothing will call release().
+            self._release_held(acquired, user_key, cost)
+            raise
+        counters["admitted"] += 1
+        return None, cost
+
+    def release(self, route: str, user_key: str, cost: int) -> None:
+        route_semaphore = self.routes.get(route)
+        if route_semaphore is not None:
+            route_semaphore.release(1)
+        self.worker.release(cost)
+        self._release_user(user_key, cost)
+
+    def _release_held(self, acquired: List[Tuple[WeightedSemaphore, int]], user_key: str, cost: int) -> None:
+        for held, held_units in acquired:
+            held.release(held_units)
+        self._release_user(user_key, cost)
+
+    def _release_user(self, user_key: str, cost: int) -> None:
+        remaining = self._user_usage.get(user_key, 0) - cost
+        if remaining > 0:
+            self._user_usage[user_key] = remaining
+        else:
+            self._user_usage.pop(user_key, None)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "worker": {"capacity": self.worker.capacity, "in_use": self.worker.in_use, "queue_depth": self.worker.queued},
+            "routes": {
+                route: {
+                    "cost": CONCURRENCY_ROUTE_COSTS[route],
+                    "limit": self.routes[route].capacity if route in self.routes else None,
+                    "in_use": self.routes[route].in_use if route in self.routes else None,
+                    "queue_depth": self.routes[route].queued if route in self.routes else None,
+                    **counters,
+                }
+                for route, counters in self.counters.items()
+            },
+            "users_active": len(self._user_usage),
+        }
+
+admission_controller = AdmissionController(
+    CONCURRENCY_WORKER_CAPACITY,
+    CONCURRENCY_USER_CAPACITY,
+    CONCURRENCY_MAX_WAIT_MS,
+    CONCURRENCY_MAX_QUEUE,
+)
+
+def concurrency_user_key(request: Request) -> str:
+    # Keyed on the token's claims without a session lookup; the endpoint still authenticates.
+    session_token = extract_session_token(request)
+    payload = decode_jwt_token(session_token, allow_expired=True) if session_token else None
+    if payload and payload.get("user_id"):
+        return f"user:{payload['user_id']}"
+    return f"ip:{get_client_ip(request)}"
+
+class ConcurrencyLimitMiddleware:
+    # Plain ASGI rather than a dependency so streamed exports hold their slot until the body is sent.
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        path = scope.get("path", "")
+        if (
+            scope["type"] != "http"
+            or scope["method"] == "OPTIONS"
+            or not path.startswith("/api/")
+            or path in CONCURRENCY_EXEMPT_PATHS
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        route = CONCURRENCY_ROUTE_PATHS.get(path, "default")
+        user_key = concurrency_user_key(Request(scope))
+        reason, cost = await admission_controller.acquire(route, user_key)
+        if reason is not None:
+            status_code = 429 if reason == "user" else 503
+            detail = "Too many concurrent requests" if reason == "user" else "Server busy, please retry"
+            response = JSONResponse(status_code=status_code, content={"detail": detail}, headers={"Retry-After": "1"})
+            await response(scope, receive, send)
+            return
+
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            admission_controller.release(route, user_key, cost)
+
+# ==================== AUTH ENDPOINTS ====================
+
+@api_router.post("/auth/register")
+async def register(user_data: UserCreate, request: Request, response: Response):
+    await enforce_rate_limit(auth_ip_limiter, get_client_ip(request))
+    await enforce_rate_limit(auth_email_limiter, user_data.email.lower())
+
+    existing = await storage.users.get_by_email(user_data.email)
+    if existing:
+        raise HTTPException(status_code=400, detail="Email already registered")
+    
+    user_id = f"user_{uuid.uuid4().hex[:12]}"
+    hashed_pw = hash_password(user_data.password)
+    
+    user_doc = {
+        "user_id": user_id,
+        "email": user_data.email,
+        "name": user_data.name,
+        "password_hash": hashed_pw,
+        "profile_type": user_data.profile_type,
+        "preferred_currency": user_data.preferred_currency,
+        "picture": None,
+        "created_at": datetime.now(timezone.utc).isoformat()
+    }
+    await storage.users.insert(user_doc)
+    
+    # Create default categories
+    await create_default_categories(user_id, user_id, user_data.profile_type)
+    
+    session_doc = create_session_doc(user_id, request)
+    await storage.sessions.insert(session_doc)
+
+    token = create_jwt_token(user_doc, session_doc)
+
+    set_session_cookie(response, token)
     return build_auth_response(user_doc, token)
 
 @api_router.post("/auth/login")
 async def login(credentials: UserLogin, request: Request, response: Response):
-    user_doc = await db.users.find_one({"email": credentials.email}, {"_id": 0})
+    await enforce_rate_limit(auth_ip_limiter, get_client_ip(request))
+    await enforce_rate_limit(auth_email_limiter, credentials.email.lower())
+
+    user_doc = await storage.users.get_by_email(credentials.email)
 
     if not user_doc:
         raise HTTPException(status_code=401, detail="Invalid credentials")
@@ -596,14 +2749,38 @@ async def login(credentials: UserLogin, request: Request, response: Response):
         raise HTTPException(status_code=401, detail="Invalid credentials")
     
     session_doc = create_session_doc(user_doc["user_id"], request)
-    await db.user_sessions.insert_one(session_doc)
+    await storage.sessions.insert(session_doc)
 
-    token = create_jwt_token(user_doc["user_id"], session_doc["session_id"])
+    token = create_jwt_token(user_doc, session_doc)
 
     set_session_cookie(response, token)
     return build_auth_response(user_doc, token)
 
+@api_router.post("/auth/refresh")
+async def refresh_access_token(request: Request, response: Response):
+    session_token = extract_session_token(request)
+    if not session_token:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+
+    # Expired access tokens are accepted here; the full session check below bounds their use.
+    payload = decode_jwt_token(session_token, allow_expired=True)
+    if not payload:
+        raise HTTPException(status_code=401, detail="Invalid token")
+
+    user_id = payload.get("user_id")
+    session_id = payload.get("sid")
+    if not user_id or not session_id:
+        raise HTTPException(status_code=401, detail="Invalid token")
+
+    session_doc = await validate_session(user_id, session_id)
+    user_doc = await storage.users.get(user_id)
+    if not user_doc:
+        raise HTTPException(status_code=401, detail="Invalid token")
+
+    token = create_jwt_token(user_doc, session_doc)
 
+    set_session_cookie(response, token)
+    return build_auth_response(user_doc, token)
 
 @api_router.get("/auth/me")
 async def get_me(user: User = Depends(get_current_user)):
@@ -618,20 +2795,13 @@ async def get_me(user: User = Depends(get_current_user)):
 
 @api_router.post("/auth/logout")
 async def logout(request: Request, response: Response):
-    session_token = request.cookies.get("session_token")
-    if not session_token:
-        auth_header = request.headers.get("Authorization")
-        if auth_header and auth_header.startswith("Bearer "):
-            session_token = auth_header.split(" ")[1]
+    session_token = extract_session_token(request)
 
     if session_token:
-        payload = decode_jwt_token(session_token)
+        payload = decode_jwt_token(session_token, allow_expired=True)
         session_id = payload.get("sid") if payload else None
         if session_id:
-            await db.user_sessions.update_one(
-                {"session_id": session_id},
-                {"$set": {"revoked": True, "revoked_reason": "logout", "revoked_at": datetime.now(timezone.utc).isoformat()}},
-            )
+            await revoke_session(session_id, "logout")
 
     response.delete_cookie(
         key="session_token",
@@ -641,9 +2811,10 @@ async def logout(request: Request, response: Response):
     )
     return {"message": "Logged out successfully"}
 
-@api_router.put("/auth/profile")
+@api_router.put("/auth/profile", response_model=User)
 async def update_profile(
     request: Request,
+    response: Response,
     user: User = Depends(get_current_user)
 ):
     body = await request.json()
@@ -657,33 +2828,132 @@ async def update_profile(
         update_data["preferred_currency"] = body["preferred_currency"]
     
     if update_data:
-        await db.users.update_one(
-            {"user_id": user.user_id},
-            {"$set": update_data}
-        )
+        changed_at = datetime.now(timezone.utc)
+        await storage.users.update(user.user_id, {**update_data, "claims_changed_at": changed_at.isoformat()})
+        mark_user_claims_changed(user.user_id, changed_at)
     
-    user_doc = await db.users.find_one({"user_id": user.user_id}, {"_id": 0})
-    return user_doc
+    user_doc = await storage.users.get(user.user_id)
+
+    # Access tokens carry profile claims, so re-issue one reflecting the update.
+    session_id = getattr(request.state, "session_id", None)
+    if update_data and user_doc and session_id:
+        session_doc = await storage.sessions.get(session_id)
+        if session_doc:
+            set_session_cookie(response, create_jwt_token(user_doc, session_doc))
+
+    if not user_doc:
+        raise HTTPException(status_code=404, detail="User not found")
+    # The public model: password_hash and claims_changed_at stay server-side.
+    return User(**user_doc)
+
+# ==================== WORKSPACES ====================
+
+async def require_workspace_owner(request: Request, user: User, workspace_id: str) -> None:
+    if workspace_id == user.user_id:
+        raise HTTPException(status_code=400, detail="Personal workspace cannot be shared")
+    role = await resolve_workspace_role(request, user, workspace_id)
+    if role is None:
+        raise HTTPException(status_code=404, detail="Workspace not found")
+    if role != "owner":
+        raise HTTPException(status_code=403, detail="Only workspace owners can manage members")
+
+@api_router.get("/workspaces")
+async def get_workspaces(user: User = Depends(get_current_user)):
+    memberships = await storage.workspaces.memberships(user.user_id)
+    roles = {doc["workspace_id"]: doc["role"] for doc in memberships}
+    workspaces = await storage.workspaces.get_many(list(roles))
+
+    personal = {"workspace_id": user.user_id, "name": "Personal", "role": "owner", "personal": True}
+    return [personal] + [
+        {**workspace, "role": roles[workspace["workspace_id"]], "personal": False}
+        for workspace in workspaces
+    ]
+
+@api_router.post("/workspaces")
+async def create_workspace(workspace_data: WorkspaceCreate, user: User = Depends(get_current_user)):
+    if await storage.workspaces.count_memberships(user.user_id) >= WORKSPACES_MAX_PER_USER:
+        raise HTTPException(status_code=400, detail="Workspace limit reached")
+
+    now = datetime.now(timezone.utc).isoformat()
+    workspace_doc = {
+        "workspace_id": f"ws_{uuid.uuid4().hex[:12]}",
+        "name": workspace_data.name,
+        "owner_id": user.user_id,
+        "created_at": now,
+    }
+    await storage.workspaces.insert(workspace_doc)
+    await storage.workspaces.set_member(workspace_doc["workspace_id"], user.user_id, "owner")
+    invalidate_workspace_memberships(user.user_id)
+    await create_default_categories(workspace_doc["workspace_id"], user.user_id, user.profile_type)
+    return {**workspace_doc, "role": "owner", "personal": False}
+
+@api_router.get("/workspaces/{workspace_id}/members")
+async def get_workspace_members(workspace_id: str, request: Request, user: User = Depends(get_current_user)):
+    if await resolve_workspace_role(request, user, workspace_id) is None or workspace_id == user.user_id:
+        raise HTTPException(status_code=404, detail="Workspace not found")
+
+    members = await storage.workspaces.members(workspace_id)
+    users = await storage.users.get_many([member["user_id"] for member in members])
+    users_by_id = {doc["user_id"]: doc for doc in users}
+    return [
+        {**member, "email": users_by_id.get(member["user_id"], {}).get("email"), "name": users_by_id.get(member["user_id"], {}).get("name")}
+        for member in members
+    ]
+
+@api_router.post("/workspaces/{workspace_id}/members")
+async def add_workspace_member(
+    workspace_id: str,
+    member_data: WorkspaceMemberAdd,
+    request: Request,
+    user: User = Depends(get_current_user)
+):
+    await require_workspace_owner(request, user, workspace_id)
+    member_doc = await storage.users.get_by_email(member_data.email)
+    if not member_doc:
+        raise HTTPException(status_code=404, detail="User not found")
+
+    await storage.workspaces.set_member(workspace_id, member_doc["user_id"], member_data.role)
+    invalidate_workspace_memberships(member_doc["user_id"])
+    return {"workspace_id": workspace_id, "user_id": member_doc["user_id"], "role": member_data.role}
+
+@api_router.delete("/workspaces/{workspace_id}/members/{member_user_id}")
+async def remove_workspace_member(
+    workspace_id: str,
+    member_user_id: str,
+    request: Request,
+    user: User = Depends(get_current_user)
+):
+    # Members may always leave; removing someone else requires ownership.
+    if member_user_id != user.user_id:
+        await require_workspace_owner(request, user, workspace_id)
+
+    member = await storage.workspaces.get_member(workspace_id, member_user_id)
+    if not member:
+        raise HTTPException(status_code=404, detail="Member not found")
+    if member["role"] == "owner" and await storage.workspaces.count_owners(workspace_id) <= 1:
+        raise HTTPException(status_code=400, detail="A workspace must keep at least one owner")
+
+    await storage.workspaces.remove_member(workspace_id, member_user_id)
+    invalidate_workspace_memberships(member_user_id)
+    return {"message": "Member removed"}
 
 # ==================== CATEGORY ENDPOINTS ====================
 
 @api_router.get("/categories", response_model=List[Category])
 async def get_categories(
     entry_type: Optional[str] = None,
-    user: User = Depends(get_current_user)
+    workspace: WorkspaceAccess = Depends(get_workspace)
 ):
-    await seed_income_categories_if_missing(user.user_id)
-    query = {"user_id": user.user_id}
-    query.update(build_entry_type_query(entry_type))
-
-    categories = await db.categories.find(query, {"_id": 0}).to_list(200)
+    await seed_income_categories_if_missing(workspace.workspace_id, workspace.user.user_id)
+    categories = await storage.categories.list(workspace.workspace_id, entry_type)
     return [normalize_category_doc(category) for category in categories]
 
 @api_router.post("/categories", response_model=Category)
-async def create_category(category_data: CategoryCreate, user: User = Depends(get_current_user)):
+async def create_category(category_data: CategoryCreate, workspace: WorkspaceAccess = Depends(get_writable_workspace)):
     entry_type = normalize_entry_type(category_data.entry_type)
     category_doc = await insert_category_doc(
-        user.user_id,
+        workspace.workspace_id,
+        workspace.user.user_id,
         {
             "name": category_data.name,
             "icon": category_data.icon or "folder",
@@ -698,7 +2968,7 @@ async def create_category(category_data: CategoryCreate, user: User = Depends(ge
 async def update_category(
     category_id: str,
     request: Request,
-    user: User = Depends(get_current_user)
+    workspace: WorkspaceAccess = Depends(get_writable_workspace)
 ):
     body = await request.json()
     update_data = {}
@@ -713,155 +2983,1587 @@ async def update_category(
         update_data["entry_type"] = normalize_entry_type(body.get("entry_type"))
     
     if update_data:
-        await db.categories.update_one(
-            {"category_id": category_id, "user_id": user.user_id},
-            {"$set": update_data}
+        await storage.categories.update(workspace.workspace_id, category_id, update_data)
+        mark_workspace_data_changed(workspace.workspace_id)
+        await record_changes(workspace.workspace_id, "category", upserted=[category_id])
+    
+    category_doc = await storage.categories.get(workspace.workspace_id, category_id)
+    if not category_doc:
+        raise HTTPException(status_code=404, detail="Category not found")
+    return normalize_category_doc(category_doc)
+
+@api_router.delete("/categories/{category_id}")
+async def delete_category(category_id: str, workspace: WorkspaceAccess = Depends(get_writable_workspace)):
+    if not await storage.categories.delete(workspace.workspace_id, category_id):
+        raise HTTPException(status_code=404, detail="Category not found")
+    
+    # Also delete expenses in this category
+    deleted_expense_ids = await storage.expenses.delete_by_category(workspace.workspace_id, category_id)
+    deleted_expense_ids += await purge_archived_category(workspace.workspace_id, category_id)
+    await storage.recurring_rules.delete_by_category(workspace.workspace_id, category_id)
+    await storage.budgets.delete(workspace.workspace_id, category_id=category_id)
+    if workspace.workspace_id in category_classifiers:
+        category_classifiers[workspace.workspace_id].forget_category(category_id)
+    mark_workspace_data_changed(workspace.workspace_id)
+    await record_changes(workspace.workspace_id, "expense", deleted=deleted_expense_ids)
+    await record_changes(workspace.workspace_id, "category", deleted=[category_id])
+    return {"message": "Category deleted"}
+
+@api_router.post("/categories/{category_id}/subcategories")
+async def add_subcategory(
+    category_id: str,
+    subcategory: SubCategoryCreate,
+    workspace: WorkspaceAccess = Depends(get_writable_workspace)
+):
+    subcategory_id = f"sub_{uuid.uuid4().hex[:12]}"
+    new_sub = {
+        "subcategory_id": subcategory_id,
+        "name": subcategory.name,
+        "icon": subcategory.icon or "tag"
+    }
+    
+    if not await storage.categories.add_subcategory(workspace.workspace_id, category_id, new_sub):
+        raise HTTPException(status_code=404, detail="Category not found")
+    
+    mark_workspace_data_changed(workspace.workspace_id)
+    await record_changes(workspace.workspace_id, "category", upserted=[category_id])
+    return new_sub
+
+@api_router.delete("/categories/{category_id}/subcategories/{subcategory_id}")
+async def delete_subcategory(
+    category_id: str,
+    subcategory_id: str,
+    workspace: WorkspaceAccess = Depends(get_writable_workspace)
+):
+    if not await storage.categories.remove_subcategory(workspace.workspace_id, category_id, subcategory_id):
+        raise HTTPException(status_code=404, detail="Category or subcategory not found")
+    
+    mark_workspace_data_changed(workspace.workspace_id)
+    await record_changes(workspace.workspace_id, "category", upserted=[category_id])
+    return {"message": "Subcategory deleted"}
+
+# ==================== EXPENSE ENDPOINTS ====================
+
+@api_router.get("/expenses", response_model=List[Expense])
+async def get_expenses(
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    category_id: Optional[str] = None,
+    entry_type: Optional[str] = None,
+    workspace: WorkspaceAccess = Depends(get_workspace)
+):
+    filters = {"start_date": start_date, "end_date": end_date, "category_id": category_id, "entry_type": entry_type}
+    expenses = await storage.expenses.page(workspace.workspace_id, 1000, **filters)
+    expenses = await merge_archived_page(workspace.workspace_id, expenses, 1000, **filters)
+    return [normalize_expense_doc(expense) for expense in expenses]
+
+@api_router.get("/expenses/search")
+async def search_expenses(
+    q: Optional[str] = None,
+    min_amount: Optional[float] = None,
+    max_amount: Optional[float] = None,
+    category_id: Optional[str] = None,
+    subcategory_id: Optional[str] = None,
+    entry_type: Optional[str] = None,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    limit: int = Query(SEARCH_DEFAULT_LIMIT, ge=1, le=SEARCH_MAX_LIMIT),
+    cursor: Optional[str] = None,
+    workspace: WorkspaceAccess = Depends(get_workspace),
+):
+    terms = build_search_query_terms(q)
+    if q and not terms:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Search terms must be at least {SEARCH_TERM_MIN_LENGTH} characters",
+        )
+
+    expenses = await storage.expenses.page(
+        workspace.workspace_id,
+        limit + 1,
+        route="search",
+        cursor=parse_analytics_cursor(cursor) if cursor else None,
+        start_date=start_date,
+        end_date=end_date,
+        category_id=category_id,
+        subcategory_id=subcategory_id,
+        entry_type=entry_type,
+        min_amount=min_amount,
+        max_amount=max_amount,
+        terms=terms,
+    )
+
+    has_more = len(expenses) > limit
+    page_expenses = expenses[:limit]
+    return {
+        "expenses": [normalize_expense_doc(expense) for expense in page_expenses],
+        "has_more": has_more,
+        "next_cursor": build_next_cursor(page_expenses, has_more),
+        "limit": limit,
+    }
+
+@api_router.post("/expenses", response_model=Expense, dependencies=[Depends(require_database_ready)])
+async def create_expense(expense_data: ExpenseCreate, workspace: WorkspaceAccess = Depends(get_writable_workspace)):
+    expense_id = f"exp_{uuid.uuid4().hex[:12]}"
+    entry_type = normalize_entry_type(expense_data.entry_type)
+
+    await ensure_category_for_entry_type(expense_data.category_id, workspace.workspace_id, entry_type)
+    
+    expense_doc = {
+        "expense_id": expense_id,
+        "user_id": workspace.user.user_id,
+        "workspace_id": workspace.workspace_id,
+        "amount": expense_data.amount,
+        "currency": expense_data.currency,
+        "description": expense_data.description,
+        "search_terms": build_search_terms(expense_data.description),
+        "category_id": expense_data.category_id,
+        "subcategory_id": expense_data.subcategory_id,
+        "entry_type": entry_type,
+        "date": expense_data.date.isoformat() if isinstance(expense_data.date, datetime) else expense_data.date,
+        "created_at": datetime.now(timezone.utc).isoformat()
+    }
+    await insert_expense_doc(expense_doc)
+    mark_workspace_data_changed(workspace.workspace_id)
+    await record_changes(workspace.workspace_id, "expense", upserted=[expense_id])
+    await apply_budget_usage(workspace.workspace_id, added=[expense_doc])
+    observe_category_examples(workspace.workspace_id, added=[expense_doc])
+    expense_doc.pop("_id", None)
+    expense_doc.pop("search_terms", None)
+    expense_doc.pop("fingerprint", None)
+    return expense_doc
+
+@api_router.put("/expenses/{expense_id}", dependencies=[Depends(require_database_ready)])
+async def update_expense(
+    expense_id: str,
+    expense_data: ExpenseUpdate,
+    workspace: WorkspaceAccess = Depends(get_writable_workspace)
+):
+    update_data = {k: v for k, v in expense_data.model_dump().items() if v is not None}
+    if "date" in update_data and isinstance(update_data["date"], datetime):
+        update_data["date"] = update_data["date"].isoformat()
+    if "description" in update_data:
+        update_data["search_terms"] = build_search_terms(update_data["description"])
+
+    existing_doc = await storage.expenses.get(workspace.workspace_id, expense_id, {"_id": 0})
+    if not existing_doc:
+        existing_doc = await restore_archived_expense(workspace.workspace_id, expense_id)
+    if not existing_doc:
+        raise HTTPException(status_code=404, detail="Expense not found")
+
+    target_entry_type = normalize_entry_type(
+        update_data.get("entry_type", existing_doc.get("entry_type")),
+        "expense"
+    )
+    target_category_id = update_data.get("category_id", existing_doc.get("category_id"))
+    await ensure_category_for_entry_type(target_category_id, workspace.workspace_id, target_entry_type)
+    update_data["entry_type"] = target_entry_type
+
+    if update_data:
+        await update_expense_doc(
+            workspace.workspace_id,
+            expense_id,
+            update_data,
+            {**existing_doc, **update_data},
         )
+        mark_workspace_data_changed(workspace.workspace_id)
+        await record_changes(workspace.workspace_id, "expense", upserted=[expense_id])
     
-    category_doc = await db.categories.find_one(
-        {"category_id": category_id, "user_id": user.user_id},
-        {"_id": 0}
+    expense_doc = await storage.expenses.get(workspace.workspace_id, expense_id)
+    if not expense_doc:
+        raise HTTPException(status_code=404, detail="Expense not found")
+    await apply_budget_usage(workspace.workspace_id, added=[expense_doc], removed=[existing_doc])
+    observe_category_examples(workspace.workspace_id, added=[expense_doc], removed=[existing_doc])
+    return normalize_expense_doc(expense_doc)
+
+@api_router.delete("/expenses/{expense_id}")
+async def delete_expense(expense_id: str, workspace: WorkspaceAccess = Depends(get_writable_workspace)):
+    expense_doc = await storage.expenses.delete(workspace.workspace_id, expense_id)
+    if not expense_doc and await restore_archived_expense(workspace.workspace_id, expense_id):
+        expense_doc = await storage.expenses.delete(workspace.workspace_id, expense_id)
+    if not expense_doc:
+        raise HTTPException(status_code=404, detail="Expense not found")
+    if expense_doc.get("archive_batch"):
+        # Deleted while an archive pass was moving it: drop the copy that pass wrote.
+        await remove_archived_row(workspace.workspace_id, expense_id, expense_doc["archive_batch"])
+    mark_workspace_data_changed(workspace.workspace_id)
+    await record_changes(workspace.workspace_id, "expense", deleted=[expense_id])
+    await apply_budget_usage(workspace.workspace_id, removed=[expense_doc])
+    observe_category_examples(workspace.workspace_id, removed=[expense_doc])
+    return {"message": "Expense deleted"}
+
+# ==================== RECURRING TRANSACTIONS ====================
+
+def nth_occurrence(start: date, frequency: str, interval: int, index: int) -> date:
+    steps = index * interval
+    if frequency == "daily":
+        return start + timedelta(days=steps)
+    if frequency == "weekly":
+        return start + timedelta(weeks=steps)
+
+    months = steps * 12 if frequency == "yearly" else steps
+    year_offset, month_index = divmod(start.month - 1 + months, 12)
+    year = start.year + year_offset
+    month = month_index + 1
+    # Anchor on the start day, clamped for short months (e.g. the 31st, Feb 29th).
+    return date(year, month, min(start.day, calendar.monthrange(year, month)[1]))
+
+def recurrence_expense_id(recurrence_key: str) -> str:
+    return f"exp_{hashlib.sha1(recurrence_key.encode('utf-8')).hexdigest()[:12]}"
+
+def plan_rule_occurrences(rule: Dict[str, Any], today: date) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+    start = date.fromisoformat(rule["start_date"])
+    end = date.fromisoformat(rule["end_date"]) if rule.get("end_date") else None
+    index = rule.get("occurrence_index", 0)
+    now = datetime.now(timezone.utc).isoformat()
+
+    expense_docs = []
+    occurrence = nth_occurrence(start, rule["frequency"], rule["interval"], index)
+    while occurrence <= today and (end is None or occurrence <= end) and len(expense_docs) < RECURRING_MAX_OCCURRENCES_PER_PASS:
+        recurrence_key = f"{rule['rule_id']}:{occurrence.isoformat()}"
+        expense_docs.append({
+            "expense_id": recurrence_expense_id(recurrence_key),
+            "user_id": rule["user_id"],
+            "workspace_id": rule["workspace_id"],
+            "amount": rule["amount"],
+            "currency": rule["currency"],
+            "description": rule["description"],
+            "search_terms": build_search_terms(rule["description"]),
+            "category_id": rule["category_id"],
+            "subcategory_id": rule.get("subcategory_id"),
+            "entry_type": rule.get("entry_type", "expense"),
+            "date": datetime(occurrence.year, occurrence.month, occurrence.day, tzinfo=timezone.utc).isoformat(),
+            "recurrence_key": recurrence_key,
+            "created_at": now,
+        })
+        expense_docs[-1]["fingerprint"] = f"{expense_fingerprint_base(expense_docs[-1])}:0"
+        index += 1
+        occurrence = nth_occurrence(start, rule["frequency"], rule["interval"], index)
+
+    finished = end is not None and occurrence > end
+    rule_update = {
+        "occurrence_index": index,
+        "next_occurrence": None if finished else occurrence.isoformat(),
+        "active": rule.get("active", True) and not finished,
+    }
+    return expense_docs, rule_update
+
+async def materialize_due_rules(workspace_id: Optional[str] = None, today: Optional[date] = None) -> int:
+    today = today or datetime.now(timezone.utc).date()
+
+    materialized = 0
+    for _ in range(RECURRING_MAX_BATCHES_PER_PASS):
+        rules = await storage.recurring_rules.due(today.isoformat(), workspace_id, RECURRING_RULE_BATCH_SIZE)
+        if not rules:
+            break
+
+        expense_docs: List[Dict[str, Any]] = []
+        rule_updates = []
+        for rule in rules:
+            rule_docs, rule_update = plan_rule_occurrences(rule, today)
+            expense_docs.extend(rule_docs)
+            rule_updates.append((rule, rule_update))
+
+        inserted = await insert_expenses_skipping_duplicates(expense_docs)
+        # Guarded on occurrence_index so two concurrent schedulers cannot move a rule backwards.
+        await storage.recurring_rules.advance(rule_updates)
+        inserted_by_workspace: Dict[str, List[Dict[str, Any]]] = {}
+        for doc in inserted:
+            inserted_by_workspace.setdefault(doc["workspace_id"], []).append(doc)
+        for changed_workspace_id, workspace_docs in inserted_by_workspace.items():
+            mark_workspace_data_changed(changed_workspace_id)
+            await record_changes(changed_workspace_id, "expense", upserted=[doc["expense_id"] for doc in workspace_docs])
+            await apply_budget_usage(changed_workspace_id, added=workspace_docs)
+            observe_category_examples(changed_workspace_id, added=workspace_docs)
+        materialized += len(inserted)
+
+        if len(rules) < RECURRING_RULE_BATCH_SIZE:
+            break
+    return materialized
+
+async def run_recurring_scheduler() -> None:
+    # Idempotency rests on the unique recurrence_key index, so wait until it exists.
+    await database_ready.wait()
+    while True:
+        try:
+            materialized = await materialize_due_rules()
+            if materialized:
+                logger.info("Materialized %s recurring transactions", materialized)
+        except Exception as exc:
+            logger.warning("Recurring transaction pass failed: %s", exc)
+        await asyncio.sleep(RECURRING_SCAN_SECONDS)
+
+@api_router.get("/recurring", response_model=List[RecurringRule])
+async def get_recurring_rules(workspace: WorkspaceAccess = Depends(get_workspace)):
+    return await storage.recurring_rules.list(workspace.workspace_id)
+
+@api_router.post("/recurring", response_model=RecurringRule)
+async def create_recurring_rule(rule_data: RecurringRuleCreate, workspace: WorkspaceAccess = Depends(get_writable_workspace)):
+    entry_type = normalize_entry_type(rule_data.entry_type)
+    await ensure_category_for_entry_type(rule_data.category_id, workspace.workspace_id, entry_type)
+    if rule_data.end_date and rule_data.end_date < rule_data.start_date:
+        raise HTTPException(status_code=400, detail="end_date must not be before start_date")
+
+    rule_doc = {
+        "rule_id": f"rule_{uuid.uuid4().hex[:12]}",
+        "user_id": workspace.user.user_id,
+        "workspace_id": workspace.workspace_id,
+        "amount": rule_data.amount,
+        "currency": rule_data.currency,
+        "description": rule_data.description,
+        "category_id": rule_data.category_id,
+        "subcategory_id": rule_data.subcategory_id,
+        "entry_type": entry_type,
+        "frequency": rule_data.frequency,
+        "interval": rule_data.interval,
+        "start_date": rule_data.start_date.isoformat(),
+        "end_date": rule_data.end_date.isoformat() if rule_data.end_date else None,
+        "occurrence_index": 0,
+        "next_occurrence": rule_data.start_date.isoformat(),
+        "active": True,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+    }
+    await storage.recurring_rules.insert(rule_doc)
+
+    # Catch up past-due occurrences now rather than waiting for the next scheduler pass.
+    await materialize_due_rules(workspace_id=workspace.workspace_id)
+    return await storage.recurring_rules.get(workspace.workspace_id, rule_doc["rule_id"]) or rule_doc
+
+@api_router.put("/recurring/{rule_id}", response_model=RecurringRule)
+async def update_recurring_rule(
+    rule_id: str,
+    rule_data: RecurringRuleUpdate,
+    workspace: WorkspaceAccess = Depends(get_writable_workspace)
+):
+    update_data = {k: v for k, v in rule_data.model_dump().items() if v is not None}
+    if "end_date" in update_data:
+        update_data["end_date"] = update_data["end_date"].isoformat()
+
+    for _ in range(RECURRING_UPDATE_ATTEMPTS):
+        rule_doc = await storage.recurring_rules.get(workspace.workspace_id, rule_id)
+        if not rule_doc:
+            raise HTTPException(status_code=404, detail="Recurring rule not found")
+        if not update_data:
+            return rule_doc
+        if update_data.get("end_date") and update_data["end_date"] < rule_doc["start_date"]:
+            raise HTTPException(status_code=400, detail="end_date must not be before start_date")
+
+        # A moved end_date can finish a rule or bring a finished one back, so the schedule is
+        # re-derived from the occurrences already materialized.
+        merged = {**rule_doc, **update_data}
+        index = rule_doc.get("occurrence_index", 0)
+        occurrence = nth_occurrence(date.fromisoformat(merged["start_date"]), merged["frequency"], merged["interval"], index)
+        finished = bool(merged.get("end_date")) and occurrence.isoformat() > merged["end_date"]
+        update_data.update(next_occurrence=None if finished else occurrence.isoformat(), active=not finished)
+        # Guarded like the scheduler's own updates: if it advanced the rule meanwhile, re-read.
+        if await storage.recurring_rules.advance([(rule_doc, update_data)]):
+            break
+    else:
+        raise HTTPException(status_code=409, detail="Recurring rule is being updated, retry")
+
+    if not finished and occurrence <= datetime.now(timezone.utc).date():
+        await materialize_due_rules(workspace_id=workspace.workspace_id)
+    return await storage.recurring_rules.get(workspace.workspace_id, rule_id)
+
+@api_router.delete("/recurring/{rule_id}")
+async def delete_recurring_rule(rule_id: str, workspace: WorkspaceAccess = Depends(get_writable_workspace)):
+    if not await storage.recurring_rules.delete(workspace.workspace_id, rule_id):
+        raise HTTPException(status_code=404, detail="Recurring rule not found")
+    return {"message": "Recurring rule deleted"}
+
+# ==================== BUDGETS ====================
+
+def expense_day(expense_doc: Dict[str, Any]) -> Optional[date]:
+    try:
+        return date.fromisoformat(str(expense_doc.get("date", ""))[:10])
+    except ValueError:
+        return None
+
+async def apply_budget_usage(
+    workspace_id: str,
+    added: List[Dict[str, Any]] = (),
+    removed: List[Dict[str, Any]] = (),
+) -> None:
+    # Keeps budget_usage.consumed in step with expense mutations so status reads never scan expenses.
+    if not added and not removed:
+        return
+
+    budgets = await storage.budgets.list(workspace_id)
+    if not budgets:
+        return
+    budgets_by_category: Dict[str, List[Dict[str, Any]]] = {}
+    for budget in budgets:
+        budgets_by_category.setdefault(budget["category_id"], []).append(budget)
+
+    deltas: Dict[Tuple[str, str], float] = {}
+    for sign, expense_docs in ((1, added), (-1, removed)):
+        for expense_doc in expense_docs:
+            if normalize_entry_type(expense_doc.get("entry_type"), "expense") != "expense":
+                continue
+            day = expense_day(expense_doc)
+            if day is None:
+                continue
+            for budget in budgets_by_category.get(expense_doc.get("category_id"), []):
+                if budget.get("subcategory_id") and budget["subcategory_id"] != expense_doc.get("subcategory_id"):
+                    continue
+                period_start = truncate_to_bucket(day, budget["period"]).isoformat()
+                if period_start < budget["tracked_from"]:
+                    continue
+                amount = convert_amount(expense_doc.get("amount", 0.0), expense_doc.get("currency"), budget["currency"])
+                key = (budget["budget_id"], period_start)
+                deltas[key] = deltas.get(key, 0.0) + sign * amount
+
+    deltas = {key: delta for key, delta in deltas.items() if delta}
+    if deltas:
+        await storage.budgets.add_usage(workspace_id, deltas)
+
+# Delayed reconcile passes, referenced here so they are not garbage collected mid-sleep.
+budget_reconcile_tasks: set = set()
+
+async def reconcile_budget_usage(budget_doc: Dict[str, Any]) -> None:
+    # Recomputes usage from the expenses and overwrites it; between passes, usage is only ever
+    # adjusted incrementally by apply_budget_usage.
+    rows = await storage.expenses.period_totals(
+        budget_doc["workspace_id"],
+        budget_doc["period"],
+        category_id=budget_doc["category_id"],
+        subcategory_id=budget_doc.get("subcategory_id"),
+        entry_type="expense",
+        start_date=budget_doc["tracked_from"],
+    )
+    consumed: Dict[str, float] = {
+        period_start: 0.0
+        for period_start in await storage.budgets.usage_periods(budget_doc["budget_id"])
+    }
+    for row in rows:
+        period_start = row["_id"]["period"].date().isoformat()
+        amount = convert_amount(row["total"], row["_id"].get("currency"), budget_doc["currency"])
+        consumed[period_start] = consumed.get(period_start, 0.0) + amount
+
+    if consumed:
+        await storage.budgets.set_usage(budget_doc["workspace_id"], budget_doc["budget_id"], consumed)
+
+async def reconcile_budget_usage_later(budget_doc: Dict[str, Any]) -> None:
+    await asyncio.sleep(BUDGET_RECONCILE_DELAY_SECONDS)
+    try:
+        if await storage.budgets.get(budget_doc["workspace_id"], budget_doc["budget_id"]):
+            await reconcile_budget_usage(budget_doc)
+    except Exception as exc:
+        logger.warning("Budget usage reconcile failed for %s: %s", budget_doc["budget_id"], exc)
+
+@api_router.get("/budgets", response_model=List[Budget])
+async def get_budgets(workspace: WorkspaceAccess = Depends(get_workspace)):
+    return await storage.budgets.list(workspace.workspace_id)
+
+@api_router.post("/budgets", response_model=Budget)
+async def create_budget(budget_data: BudgetCreate, workspace: WorkspaceAccess = Depends(get_writable_workspace)):
+    await ensure_category_for_entry_type(budget_data.category_id, workspace.workspace_id, "expense")
+    if await storage.budgets.count(workspace.workspace_id) >= BUDGETS_MAX_PER_USER:
+        raise HTTPException(status_code=400, detail="Budget limit reached")
+
+    today = datetime.now(timezone.utc).date()
+    budget_doc = {
+        "budget_id": f"bud_{uuid.uuid4().hex[:12]}",
+        "user_id": workspace.user.user_id,
+        "workspace_id": workspace.workspace_id,
+        "category_id": budget_data.category_id,
+        "subcategory_id": budget_data.subcategory_id,
+        "period": budget_data.period,
+        "amount": budget_data.amount,
+        "currency": workspace.user.preferred_currency,
+        "tracked_from": truncate_to_bucket(today, budget_data.period).isoformat(),
+        "created_at": datetime.now(timezone.utc).isoformat(),
+    }
+    # Stored first so apply_budget_usage counts every expense written from here on, then seeded
+    # from an aggregation. An expense whose write straddles the seed can still be counted twice
+    # or not at all, so usage is recomputed once more after in-flight writes have settled. Only a
+    # write straddling that second pass as well can still leave the total off.
+    await storage.budgets.insert(budget_doc)
+    await reconcile_budget_usage(budget_doc)
+    task = asyncio.create_task(reconcile_budget_usage_later(budget_doc))
+    budget_reconcile_tasks.add(task)
+    task.add_done_callback(budget_reconcile_tasks.discard)
+    return budget_doc
+
+@api_router.get("/budgets/status")
+async def get_budget_status(workspace: WorkspaceAccess = Depends(get_workspace)):
+    budgets = await storage.budgets.list(workspace.workspace_id)
+    today = datetime.now(timezone.utc).date()
+    current_periods = {
+        budget["budget_id"]: truncate_to_bucket(today, budget["period"])
+        for budget in budgets
+    }
+
+    usage: Dict[Tuple[str, str], float] = {}
+    if budgets:
+        usage = await storage.budgets.usage(
+            list(current_periods),
+            sorted({start.isoformat() for start in current_periods.values()}),
+        )
+
+    statuses = []
+    for budget in budgets:
+        period_start = current_periods[budget["budget_id"]]
+        limit = convert_amount(budget["amount"], budget["currency"], workspace.user.preferred_currency)
+        consumed = convert_amount(
+            usage.get((budget["budget_id"], period_start.isoformat()), 0.0),
+            budget["currency"],
+            workspace.user.preferred_currency,
+        )
+        statuses.append({
+            "budget_id": budget["budget_id"],
+            "category_id": budget["category_id"],
+            "subcategory_id": budget.get("subcategory_id"),
+            "period": budget["period"],
+            "period_start": period_start.isoformat(),
+            "period_end": (next_bucket(period_start, budget["period"]) - timedelta(days=1)).isoformat(),
+            "amount": round(limit, 2),
+            "consumed": round(consumed, 2),
+            "remaining": round(limit - consumed, 2),
+            "utilization": round(consumed / limit, 4) if limit else None,
+        })
+
+    return {"currency": workspace.user.preferred_currency, "budgets": statuses}
+
+@api_router.put("/budgets/{budget_id}", response_model=Budget)
+async def update_budget(
+    budget_id: str,
+    budget_data: BudgetUpdate,
+    workspace: WorkspaceAccess = Depends(get_writable_workspace)
+):
+    update_data = {k: v for k, v in budget_data.model_dump().items() if v is not None}
+    if update_data:
+        await storage.budgets.update(workspace.workspace_id, budget_id, update_data)
+
+    budget_doc = await storage.budgets.get(workspace.workspace_id, budget_id)
+    if not budget_doc:
+        raise HTTPException(status_code=404, detail="Budget not found")
+    return budget_doc
+
+@api_router.delete("/budgets/{budget_id}")
+async def delete_budget(budget_id: str, workspace: WorkspaceAccess = Depends(get_writable_workspace)):
+    if not await storage.budgets.delete(workspace.workspace_id, budget_id=budget_id):
+        raise HTTPException(status_code=404, detail="Budget not found")
+    return {"message": "Budget deleted"}
+
+# ==================== CHANGE FEED ====================
+
+# Revisions are allocated and logged under a per-workspace lock so writers in one process
+# commit in order; stripes keep the lock table bounded. Across workers, ordering comes from
+# the committed watermark on sync_counters.
+sync_locks = [asyncio.Lock() for _ in range(SYNC_LOCK_STRIPES)]
+
+def sync_lock_for(workspace_id: str) -> asyncio.Lock:
+    digest = hashlib.sha256(workspace_id.encode("utf-8")).digest()
+    return sync_locks[int.from_bytes(digest[:4], "big") % SYNC_LOCK_STRIPES]
+
+async def record_changes(
+    workspace_id: str,
+    entity: Literal["expense", "category"],
+    upserted: List[str] = (),
+    deleted: List[str] = (),
+) -> None:
+    # sync_changes keeps one row per record (its latest revision), so the log stays
+    # compacted and deletes survive as tombstones.
+    changes = [(entity_id, "upsert") for entity_id in upserted] + [(entity_id, "delete") for entity_id in deleted]
+    if not changes:
+        return
+
+    async with sync_lock_for(workspace_id):
+        last_revision = await storage.sync.allocate(workspace_id, len(changes))
+        first_revision = last_revision - len(changes) + 1
+        await storage.sync.log(
+            workspace_id,
+            entity,
+            [(entity_id, op, first_revision + offset) for offset, (entity_id, op) in enumerate(changes)],
+            datetime.now(timezone.utc).isoformat(),
+        )
+        await commit_sync_revisions(workspace_id, first_revision, last_revision)
+        if CHANGE_EVENTS_BACKEND == "memory":
+            change_broker.publish(workspace_id, "change", build_change_event(entity, [
+                {"entity_id": entity_id, "op": op, "revision": first_revision + offset}
+                for offset, (entity_id, op) in enumerate(changes)
+            ]))
+
+async def commit_sync_revisions(workspace_id: str, first_revision: int, last_revision: int) -> None:
+    # The watermark only moves from first-1 to last, so /api/sync never exposes a batch while one
+    # allocated before it (possibly on another worker) is still being written.
+    deadline = time.monotonic() + SYNC_COMMIT_TIMEOUT_SECONDS
+    delay = 0.005
+    while True:
+        if await storage.sync.commit(workspace_id, first_revision, last_revision):
+            return
+        if await get_sync_revision(workspace_id) >= last_revision:
+            return
+        if time.monotonic() >= deadline:
+            # A writer that died between allocating and committing would otherwise stall the feed.
+            logger.warning("Sync revisions before %s of %s never committed; skipping ahead", first_revision, workspace_id)
+            await storage.sync.force_commit(workspace_id, last_revision)
+            return
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, 0.1)
+
+async def get_sync_revision(workspace_id: str) -> int:
+    return await storage.sync.committed(workspace_id)
+
+@api_router.get("/sync")
+async def sync_changes(
+    since: int = Query(0, ge=0),
+    limit: int = Query(SYNC_DEFAULT_LIMIT, ge=1, le=SYNC_MAX_LIMIT),
+    workspace: WorkspaceAccess = Depends(get_workspace)
+):
+    # Only revisions up to the committed watermark are served: later ones may still have
+    # gaps below them and are picked up by the next call.
+    revision = await get_sync_revision(workspace.workspace_id)
+    changes = await storage.sync.changes(workspace.workspace_id, since, revision, limit + 1)
+
+    has_more = len(changes) > limit
+    page = changes[:limit]
+    upserted_ids = {"expense": [], "category": []}
+    for change in page:
+        if change["op"] == "upsert":
+            upserted_ids[change["entity"]].append(change["entity_id"])
+
+    records: Dict[Tuple[str, str], Dict[str, Any]] = {}
+    if upserted_ids["expense"]:
+        for doc in await storage.expenses.get_many(workspace.workspace_id, upserted_ids["expense"]):
+            records[("expense", doc["expense_id"])] = normalize_expense_doc(doc)
+    archived_ids = [expense_id for expense_id in upserted_ids["expense"] if ("expense", expense_id) not in records]
+    for doc in await find_archived_expenses(workspace.workspace_id, archived_ids):
+        records[("expense", doc["expense_id"])] = normalize_expense_doc(doc)
+    if upserted_ids["category"]:
+        for doc in await storage.categories.get_many(workspace.workspace_id, upserted_ids["category"]):
+            records[("category", doc["category_id"])] = normalize_category_doc(doc)
+
+    result = []
+    for change in page:
+        data = records.get((change["entity"], change["entity_id"])) if change["op"] == "upsert" else None
+        # Deleted after this page's change rows were read; its tombstone follows later.
+        if change["op"] == "upsert" and data is None:
+            continue
+        result.append({**change, "data": data})
+
+    return {
+        "changes": result,
+        "next_since": page[-1]["revision"] if page else since,
+        "has_more": has_more,
+        "revision": revision,
+    }
+
+# ==================== LIVE EVENTS ====================
+
+def encode_sse_frame(event: str, payload: Dict[str, Any]) -> bytes:
+    return f"id: {payload['revision']}\nevent: {event}\ndata: {json.dumps(payload)}\n\n".encode("utf-8")
+
+def build_change_event(entity: str, changes: List[Dict[str, Any]]) -> Dict[str, Any]:
+    # Events are hints: large batches only carry the count and clients pull them via /api/sync.
+    payload: Dict[str, Any] = {"revision": changes[-1]["revision"], "entity": entity, "count": len(changes)}
+    if len(changes) <= SSE_MAX_CHANGES_PER_EVENT:
+        payload["changes"] = changes
+    return payload
+
+class ChangeBroker:
+    # In-process fan-out. Each connection holds one bounded queue of pre-encoded frames,
+    # so an idle subscriber costs an empty queue and a slow one can never grow unbounded.
+    def __init__(self, max_per_user: int, max_total: int, queue_size: int):
+        self.max_per_user = max_per_user
+        self.max_total = max_total
+        self.queue_size = queue_size
+        self._subscribers: Dict[str, set] = {}
+        self._user_connections: Dict[str, int] = {}
+        self._total = 0
+
+    def subscribe(self, workspace_id: str, user_id: str) -> asyncio.Queue:
+        if self._user_connections.get(user_id, 0) >= self.max_per_user:
+            raise HTTPException(status_code=429, detail="Too many open event streams")
+        if self._total >= self.max_total:
+            raise HTTPException(status_code=503, detail="Event streams unavailable")
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        self._subscribers.setdefault(workspace_id, set()).add(queue)
+        self._user_connections[user_id] = self._user_connections.get(user_id, 0) + 1
+        self._total += 1
+        return queue
+
+    def unsubscribe(self, workspace_id: str, user_id: str, queue: asyncio.Queue) -> None:
+        subscribers = self._subscribers.get(workspace_id)
+        if subscribers is None or queue not in subscribers:
+            return
+        subscribers.discard(queue)
+        self._total -= 1
+        if not subscribers:
+            del self._subscribers[workspace_id]
+        remaining = self._user_connections.get(user_id, 1) - 1
+        if remaining > 0:
+            self._user_connections[user_id] = remaining
+        else:
+            self._user_connections.pop(user_id, None)
+
+    def publish(self, workspace_id: str, event: str, payload: Dict[str, Any]) -> None:
+        subscribers = self._subscribers.get(workspace_id)
+        if not subscribers:
+            return
+        frame = encode_sse_frame(event, payload)
+        for queue in subscribers:
+            try:
+                queue.put_nowait(frame)
+            except asyncio.QueueFull:
+                # The consumer fell behind: drop its backlog and have it resync from its last revision.
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(encode_sse_frame("resync", {"revision": payload["revision"]}))
+
+    def connection_count(self) -> int:
+        return self._total
+
+change_broker = ChangeBroker(SSE_MAX_CONNECTIONS_PER_USER, SSE_MAX_CONNECTIONS, SSE_QUEUE_SIZE)
+
+async def run_change_stream_publisher() -> None:
+    # Every worker tails the committed watermark and fans out to its own connections. Rows in
+    # sync_changes are not watched: they can land before /api/sync is allowed to serve them.
+    resume_token = None
+    while True:
+        try:
+            async with db.sync_counters.watch(
+                [{"$match": {"operationType": "update", "updateDescription.updatedFields.committed": {"$exists": True}}}],
+                full_document="updateLookup",
+                resume_after=resume_token,
+            ) as stream:
+                async for change in stream:
+                    resume_token = stream.resume_token
+                    doc = change.get("fullDocument")
+                    if doc:
+                        committed = change["updateDescription"]["updatedFields"]["committed"]
+                        change_broker.publish(doc["workspace_id"], "change", {"revision": committed})
+        except asyncio.CancelledError:
+            raise
+        except Exception as exc:
+            logger.warning("Change stream interrupted, retrying in %ss: %s", STARTUP_RETRY_SECONDS, exc)
+            await asyncio.sleep(STARTUP_RETRY_SECONDS)
+
+async def stream_change_events(
+    request: Request,
+    workspace_id: str,
+    queue: asyncio.Queue,
+    last_event_id: Optional[int],
+):
+    # A reconnecting client that missed revisions is told to catch up via /api/sync.
+    if last_event_id is not None:
+        revision = await get_sync_revision(workspace_id)
+        if revision > last_event_id:
+            yield encode_sse_frame("resync", {"revision": revision})
+    while True:
+        try:
+            frame = await asyncio.wait_for(queue.get(), SSE_HEARTBEAT_SECONDS)
+        except asyncio.TimeoutError:
+            if await request.is_disconnected():
+                break
+            frame = b": keepalive\n\n"
+        yield frame
+
+class EventStreamResponse(StreamingResponse):
+    # Releases the subscription however the response ends, including when the client is gone
+    # before the body generator is ever started (its own finally would then never run).
+    def __init__(self, content, on_close: Callable[[], None], **kwargs):
+        super().__init__(content, **kwargs)
+        self.on_close = on_close
+
+    async def __call__(self, scope, receive, send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self.on_close()
+
+@api_router.get("/events")
+async def stream_events(request: Request, workspace: WorkspaceAccess = Depends(get_workspace)):
+    last_event_id = request.headers.get("last-event-id")
+    queue = change_broker.subscribe(workspace.workspace_id, workspace.user.user_id)
+    return EventStreamResponse(
+        stream_change_events(
+            request,
+            workspace.workspace_id,
+            queue,
+            int(last_event_id) if last_event_id and last_event_id.isdigit() else None,
+        ),
+        on_close=lambda: change_broker.unsubscribe(workspace.workspace_id, workspace.user.user_id, queue),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+# ==================== CATEGORY SUGGESTIONS ====================
+
+def classifier_tokens(description: Optional[str]) -> List[str]:
+    # Digits are dates, amounts and reference numbers; they only add noise.
+    return sorted({
+        word for word in tokenize_description(description)
+        if len(word) >= SEARCH_TERM_MIN_LENGTH and not word.isdigit()
+    })
+
+class CategoryClassifier:
+    # Multinomial naive Bayes over description tokens: token x category counts in a dense
+    # NumPy matrix, so a whole import batch is scored with one gather + reduceat.
+    def __init__(self):
+        self.vocabulary: Dict[str, int] = {}
+        self.category_ids: List[str] = []
+        self.category_index: Dict[str, int] = {}
+        self.counts = np.zeros((64, 8), dtype=np.float64)
+        self.category_docs = np.zeros(8, dtype=np.float64)
+        self._model: Optional[Tuple[np.ndarray, np.ndarray]] = None
+
+    def _token_id(self, token: str) -> int:
+        token_id = self.vocabulary.get(token)
+        if token_id is None:
+            token_id = len(self.vocabulary)
+            self.vocabulary[token] = token_id
+            if token_id >= self.counts.shape[0]:
+                self.counts = np.pad(self.counts, ((0, self.counts.shape[0]), (0, 0)))
+        return token_id
+
+    def _category_id(self, category_id: str) -> int:
+        index = self.category_index.get(category_id)
+        if index is None:
+            index = len(self.category_ids)
+            self.category_ids.append(category_id)
+            self.category_index[category_id] = index
+            if index >= self.counts.shape[1]:
+                self.counts = np.pad(self.counts, ((0, 0), (0, self.counts.shape[1])))
+                self.category_docs = np.pad(self.category_docs, (0, self.category_docs.shape[0]))
+        return index
+
+    def observe_many(self, examples: List[Tuple[Optional[str], Optional[str]]], weight: float = 1.0) -> None:
+        token_rows: List[int] = []
+        token_cols: List[int] = []
+        doc_cols: List[int] = []
+        for description, category_id in examples:
+            if not category_id:
+                continue
+            column = self._category_id(category_id)
+            doc_cols.append(column)
+            for token in classifier_tokens(description):
+                token_rows.append(self._token_id(token))
+                token_cols.append(column)
+        if not doc_cols:
+            return
+
+        np.add.at(self.counts, (np.array(token_rows, dtype=np.intp), np.array(token_cols, dtype=np.intp)), weight)
+        np.add.at(self.category_docs, np.array(doc_cols, dtype=np.intp), weight)
+        if weight < 0:
+            np.maximum(self.counts, 0, out=self.counts)
+            np.maximum(self.category_docs, 0, out=self.category_docs)
+        self._model = None
+
+    def forget_category(self, category_id: str) -> None:
+        index = self.category_index.get(category_id)
+        if index is not None:
+            self.counts[:, index] = 0
+            self.category_docs[index] = 0
+            self._model = None
+
+    def _log_model(self) -> Tuple[np.ndarray, np.ndarray]:
+        if self._model is None:
+            vocabulary_size = max(len(self.vocabulary), 1)
+            categories = len(self.category_ids)
+            counts = self.counts[:vocabulary_size, :categories]
+            token_totals = counts.sum(axis=0)
+            log_likelihood = np.log(counts + 1.0) - np.log(token_totals + vocabulary_size)
+            docs = self.category_docs[:categories]
+            log_prior = np.log(docs + 1.0) - np.log(docs.sum() + categories)
+            self._model = (log_likelihood, log_prior)
+        return self._model
+
+    def predict(self, descriptions: List[Optional[str]], allowed_category_ids: Optional[set] = None) -> List[Optional[str]]:
+        predictions: List[Optional[str]] = [None] * len(descriptions)
+        if not self.category_ids:
+            return predictions
+
+        allowed = np.array([
+            allowed_category_ids is None or category_id in allowed_category_ids
+            for category_id in self.category_ids
+        ])
+        allowed &= self.category_docs[:len(self.category_ids)] > 0
+        if not allowed.any():
+            return predictions
+
+        rows: List[int] = []
+        flat_tokens: List[int] = []
+        offsets: List[int] = []
+        for row, description in enumerate(descriptions):
+            token_ids = [self.vocabulary[token] for token in classifier_tokens(description) if token in self.vocabulary]
+            if token_ids:
+                rows.append(row)
+                offsets.append(len(flat_tokens))
+                flat_tokens.extend(token_ids)
+        if not rows:
+            return predictions
+
+        log_likelihood, log_prior = self._log_model()
+        scores = np.add.reduceat(log_likelihood[np.array(flat_tokens, dtype=np.intp)], np.array(offsets, dtype=np.intp), axis=0)
+        scores += log_prior
+        scores[:, ~allowed] = -np.inf
+        best = scores.argmax(axis=1)
+        for row, category_column in zip(rows, best):
+            predictions[row] = self.category_ids[category_column]
+        return predictions
+
+category_classifiers: "OrderedDict[str, CategoryClassifier]" = OrderedDict()
+
+async def get_category_classifier(workspace_id: str) -> CategoryClassifier:
+    classifier = category_classifiers.get(workspace_id)
+    if classifier is not None:
+        category_classifiers.move_to_end(workspace_id)
+        return classifier
+
+    history = await storage.expenses.page(
+        workspace_id,
+        CLASSIFIER_HISTORY_LIMIT,
+        projection={"_id": 0, "description": 1, "category_id": 1},
+    )
+    classifier = CategoryClassifier()
+    classifier.observe_many([(doc.get("description"), doc.get("category_id")) for doc in history])
+
+    category_classifiers[workspace_id] = classifier
+    while len(category_classifiers) > CLASSIFIER_CACHE_USERS:
+        category_classifiers.popitem(last=False)
+    return classifier
+
+def observe_category_examples(
+    workspace_id: str,
+    added: List[Dict[str, Any]] = (),
+    removed: List[Dict[str, Any]] = (),
+) -> None:
+    # Only classifiers already in memory are updated; others are built from history on demand.
+    classifier = category_classifiers.get(workspace_id)
+    if classifier is None:
+        return
+    if removed:
+        classifier.observe_many([(doc.get("description"), doc.get("category_id")) for doc in removed], weight=-1.0)
+    if added:
+        classifier.observe_many([(doc.get("description"), doc.get("category_id")) for doc in added])
+
+# ==================== ARCHIVE ====================
+
+def expense_sort_key(expense_doc: Dict[str, Any]) -> Tuple[str, str]:
+    return (str(expense_doc.get("date") or ""), str(expense_doc.get("expense_id") or ""))
+
+def build_archive_bucket(workspace_id: str, batch_id: str, rows: List[Dict[str, Any]]) -> Dict[str, Any]:
+    # rows are one year of one workspace, ascending by (date, expense_id). The per-day summary
+    # lets aggregations over whole buckets skip the rows entirely.
+    summary: Dict[tuple, List[float]] = {}
+    for row in rows:
+        key = (row["date"][:10], row.get("currency"), row.get("entry_type", "expense"), row.get("category_id"))
+        totals = summary.setdefault(key, [0.0, 0])
+        totals[0] += float(row.get("amount") or 0)
+        totals[1] += 1
+    return {
+        "bucket_id": f"arc_{uuid.uuid4().hex[:12]}",
+        "batch_id": batch_id,
+        "workspace_id": workspace_id,
+        "year": rows[0]["date"][:4],
+        "min_date": rows[0]["date"],
+        "max_date": rows[-1]["date"],
+        "count": len(rows),
+        "category_ids": sorted({row["category_id"] for row in rows if row.get("category_id")}),
+        "fingerprints": [row["fingerprint"] for row in rows if row.get("fingerprint")],
+        "summary": [
+            {"day": day, "currency": currency, "entry_type": entry_type, "category_id": category_id, "total": total, "count": count}
+            for (day, currency, entry_type, category_id), (total, count) in summary.items()
+        ],
+        "rows": rows,
+        "version": 0,
+        "archived_at": datetime.now(timezone.utc).isoformat(),
+    }
+
+async def remove_archived_row(workspace_id: str, expense_id: str, batch_id: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    # One atomic update per row, so concurrent removals from the same bucket never overwrite
+    # each other. The summary gets a negative entry for the row's key instead of an in-place
+    # edit; readers sum entries per key. Returns the row only to the caller that removed it.
+    query: Dict[str, Any] = {"workspace_id": workspace_id, "rows.expense_id": expense_id}
+    if batch_id:
+        query["batch_id"] = batch_id
+    bucket = await db.expense_archive.find_one(
+        query,
+        {"_id": 0, "bucket_id": 1, "rows": {"$elemMatch": {"expense_id": expense_id}}},
+    )
+    if not bucket:
+        return None
+    row = bucket["rows"][0]
+    pull: Dict[str, Any] = {"rows": {"expense_id": expense_id}}
+    if row.get("fingerprint"):
+        pull["fingerprints"] = row["fingerprint"]
+    result = await db.expense_archive.update_one(
+        {"bucket_id": bucket["bucket_id"], "rows.expense_id": expense_id},
+        {
+            "$pull": pull,
+            "$push": {"summary": {
+                "day": row["date"][:10],
+                "currency": row.get("currency"),
+                "entry_type": row.get("entry_type", "expense"),
+                "category_id": row.get("category_id"),
+                "total": -float(row.get("amount") or 0),
+                "count": -1,
+            }},
+            "$inc": {"count": -1, "version": 1},
+        },
     )
-    if not category_doc:
-        raise HTTPException(status_code=404, detail="Category not found")
-    return normalize_category_doc(category_doc)
+    if not result.modified_count:
+        return None
+    await db.expense_archive.delete_one({"bucket_id": bucket["bucket_id"], "count": {"$lte": 0}})
+    return row
 
-@api_router.delete("/categories/{category_id}")
-async def delete_category(category_id: str, user: User = Depends(get_current_user)):
-    result = await db.categories.delete_one({"category_id": category_id, "user_id": user.user_id})
-    if result.deleted_count == 0:
-        raise HTTPException(status_code=404, detail="Category not found")
-    
-    # Also delete expenses in this category
-    await db.expenses.delete_many({"category_id": category_id, "user_id": user.user_id})
-    return {"message": "Category deleted"}
+def snapshot_clauses(snapshot: List[List[Any]]) -> List[Dict[str, Any]]:
+    return [{"expense_id": expense_id, "updated_at": updated_at} for expense_id, updated_at in snapshot]
 
-@api_router.post("/categories/{category_id}/subcategories")
-async def add_subcategory(
-    category_id: str,
-    subcategory: SubCategoryCreate,
-    user: User = Depends(get_current_user)
-):
-    subcategory_id = f"sub_{uuid.uuid4().hex[:12]}"
-    new_sub = {
-        "subcategory_id": subcategory_id,
-        "name": subcategory.name,
-        "icon": subcategory.icon or "tag"
+async def commit_archive_batch(batch: Dict[str, Any]) -> None:
+    # Only rows still as they were copied may leave the hot tier. Matching rows are first
+    # marked with the batch and the marked set is journaled, so a re-run after a crash knows
+    # which rows it moved. A row edited or deleted since the copy loses its bucket copy instead.
+    workspace_id = batch["workspace_id"]
+    batch_id = batch["batch_id"]
+    snapshot = batch.get("snapshot") or [[expense_id, None] for expense_id in batch["expense_ids"]]
+    moving = batch.get("moving")
+    if moving is None:
+        for start in range(0, len(snapshot), ARCHIVE_COMMIT_CHUNK):
+            await db.expenses.update_many(
+                {"workspace_id": workspace_id, "$or": snapshot_clauses(snapshot[start:start + ARCHIVE_COMMIT_CHUNK])},
+                {"$set": {"archive_batch": batch_id}},
+            )
+        moving = await db.expenses.distinct("expense_id", {"workspace_id": workspace_id, "archive_batch": batch_id})
+        await db.archive_batches.update_one({"batch_id": batch_id}, {"$set": {"moving": moving}})
+
+    moving_ids = set(moving)
+    for expense_id, _ in snapshot:
+        if expense_id not in moving_ids:
+            await remove_archived_row(workspace_id, expense_id, batch_id)
+    moving_snapshot = [entry for entry in snapshot if entry[0] in moving_ids]
+    for start in range(0, len(moving_snapshot), ARCHIVE_COMMIT_CHUNK):
+        await db.expenses.delete_many({
+            "workspace_id": workspace_id,
+            "archive_batch": batch_id,
+            "$or": snapshot_clauses(moving_snapshot[start:start + ARCHIVE_COMMIT_CHUNK]),
+        })
+    # Rows edited after they were marked stayed hot.
+    for expense_id in await db.expenses.distinct("expense_id", {"workspace_id": workspace_id, "expense_id": {"$in": moving}}):
+        await remove_archived_row(workspace_id, expense_id, batch_id)
+    await db.archive_batches.delete_one({"batch_id": batch_id})
+    mark_workspace_data_changed(workspace_id)
+
+async def recover_archive_batches() -> None:
+    # A batch journal outliving its pass means the worker died mid-move: finish the move if
+    # every bucket was written, otherwise roll the buckets back so the rows are archived again.
+    stale_before = (datetime.now(timezone.utc) - timedelta(seconds=ARCHIVE_STALE_BATCH_SECONDS)).isoformat()
+    async for batch in db.archive_batches.find({"created_at": {"$lt": stale_before}}, {"_id": 0}):
+        written = await db.expense_archive.count_documents({"batch_id": batch["batch_id"]})
+        if written == batch["bucket_count"]:
+            await commit_archive_batch(batch)
+        else:
+            await db.expense_archive.delete_many({"batch_id": batch["batch_id"]})
+            await db.archive_batches.delete_one({"batch_id": batch["batch_id"]})
+
+async def archive_workspace_expenses(workspace_id: str, cutoff: str) -> int:
+    rows = await db.expenses.find(
+        {"workspace_id": workspace_id, "date": {"$lt": cutoff}},
+        {"_id": 0, "search_terms": 0, "recurrence_key": 0, "archive_batch": 0},
+    ).sort([("date", 1), ("expense_id", 1)]).to_list(ARCHIVE_ROWS_PER_PASS)
+    if not rows:
+        return 0
+
+    batch_id = f"arb_{uuid.uuid4().hex[:12]}"
+    buckets = []
+    for _, year_rows in groupby(rows, key=lambda row: row["date"][:4]):
+        year_rows = list(year_rows)
+        for start in range(0, len(year_rows), ARCHIVE_BUCKET_ROWS):
+            buckets.append(build_archive_bucket(workspace_id, batch_id, year_rows[start:start + ARCHIVE_BUCKET_ROWS]))
+
+    batch = {
+        "batch_id": batch_id,
+        "workspace_id": workspace_id,
+        "expense_ids": [row["expense_id"] for row in rows],
+        "snapshot": [[row["expense_id"], row.get("updated_at")] for row in rows],
+        "bucket_count": len(buckets),
+        "created_at": datetime.now(timezone.utc).isoformat(),
     }
-    
-    result = await db.categories.update_one(
-        {"category_id": category_id, "user_id": user.user_id},
-        {"$push": {"subcategories": new_sub}}
-    )
-    
-    if result.modified_count == 0:
-        raise HTTPException(status_code=404, detail="Category not found")
-    
-    return new_sub
+    try:
+        # One open batch per workspace (unique index): concurrent workers never archive the same rows.
+        await db.archive_batches.insert_one(batch)
+    except DuplicateKeyError:
+        return 0
+    await db.expense_archive.insert_many(buckets)
+    await commit_archive_batch(batch)
+    return len(rows)
 
-@api_router.delete("/categories/{category_id}/subcategories/{subcategory_id}")
-async def delete_subcategory(
-    category_id: str,
-    subcategory_id: str,
-    user: User = Depends(get_current_user)
-):
-    result = await db.categories.update_one(
-        {"category_id": category_id, "user_id": user.user_id},
-        {"$pull": {"subcategories": {"subcategory_id": subcategory_id}}}
-    )
-    
-    if result.modified_count == 0:
-        raise HTTPException(status_code=404, detail="Category or subcategory not found")
-    
-    return {"message": "Subcategory deleted"}
+async def iter_workspace_ids():
+    async for user_doc in db.users.find({}, {"_id": 0, "user_id": 1}):
+        yield user_doc["user_id"]
+    async for workspace_doc in db.workspaces.find({}, {"_id": 0, "workspace_id": 1}):
+        yield workspace_doc["workspace_id"]
 
-# ==================== EXPENSE ENDPOINTS ====================
+async def archive_old_expenses(today: Optional[date] = None) -> int:
+    today = today or datetime.now(timezone.utc).date()
+    cutoff = (today - timedelta(days=ARCHIVE_HORIZON_DAYS)).isoformat()
+    await recover_archive_batches()
+    archived = 0
+    async for workspace_id in iter_workspace_ids():
+        archived += await archive_workspace_expenses(workspace_id, cutoff)
+    return archived
 
-@api_router.get("/expenses", response_model=List[Expense])
-async def get_expenses(
+async def run_archive_scheduler() -> None:
+    await database_ready.wait()
+    while True:
+        try:
+            archived = await archive_old_expenses()
+            if archived:
+                logger.info("Archived %s transactions", archived)
+        except Exception as exc:
+            logger.warning("Archive pass failed: %s", exc)
+        await asyncio.sleep(ARCHIVE_SCAN_SECONDS)
+
+async def find_archive_buckets(
+    workspace_id: str,
+    projection: Dict[str, int],
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    cursor: Optional[Tuple[str, str]] = None,
+    route: Optional[str] = None,
+    category_id: Optional[str] = None,
+    limit: Optional[int] = None,
+) -> List[Dict[str, Any]]:
+    if STORAGE_BACKEND != "mongo":
+        return []
+    query: Dict[str, Any] = {"workspace_id": workspace_id}
+    if start_date:
+        query["max_date"] = {"$gte": start_date}
+    upper_bounds = [bound for bound in (end_date, cursor[0] if cursor else None) if bound]
+    if upper_bounds:
+        query["min_date"] = {"$lte": min(upper_bounds)}
+    if category_id:
+        query["category_ids"] = category_id
+    read_db = get_read_db(route) if route else db
+    return await read_db.expense_archive.find(query, projection).sort("max_date", -1).to_list(limit)
+
+def archived_row_matches(
+    row: Dict[str, Any],
+    start_date: Optional[str],
+    end_date: Optional[str],
+    cursor: Optional[Tuple[str, str]],
+) -> bool:
+    if start_date and row["date"] < start_date:
+        return False
+    if end_date and row["date"] > end_date:
+        return False
+    return not cursor or expense_sort_key(row) < cursor
+
+async def iter_archived_expenses(
+    workspace_id: str,
     start_date: Optional[str] = None,
     end_date: Optional[str] = None,
+    cursor: Optional[Tuple[str, str]] = None,
+    route: Optional[str] = None,
     category_id: Optional[str] = None,
     entry_type: Optional[str] = None,
-    user: User = Depends(get_current_user)
 ):
-    query = {"user_id": user.user_id}
-    query.update(build_entry_type_query(entry_type))
-    query.update(build_date_query(start_date, end_date))
-    if category_id:
-        query["category_id"] = category_id
-    
-    expenses = await db.expenses.find(query, {"_id": 0}).sort("date", -1).to_list(1000)
-    return [normalize_expense_doc(expense) for expense in expenses]
+    # Newest first, in hot-index order. Buckets are loaded one at a time by max_date; a row is
+    # released once no remaining bucket can hold anything newer, so overlapping buckets still merge.
+    buckets = await find_archive_buckets(
+        workspace_id,
+        {"_id": 0, "bucket_id": 1, "max_date": 1},
+        start_date,
+        end_date,
+        cursor,
+        route,
+        category_id,
+    )
+    normalized_type = normalize_entry_type(entry_type) if entry_type else None
+    read_db = get_read_db(route) if route else db
+    pending: List[Dict[str, Any]] = []
+    for index, bucket in enumerate(buckets):
+        bucket_doc = await read_db.expense_archive.find_one({"bucket_id": bucket["bucket_id"]}, {"_id": 0, "rows": 1})
+        rows = bucket_doc.get("rows", []) if bucket_doc else []
+        pending.extend(
+            row for row in rows
+            if archived_row_matches(row, start_date, end_date, cursor)
+            and (not category_id or row.get("category_id") == category_id)
+            and (not normalized_type or normalize_entry_type(row.get("entry_type"), "expense") == normalized_type)
+        )
+        pending.sort(key=expense_sort_key)
+        next_max_date = buckets[index + 1]["max_date"] if index + 1 < len(buckets) else None
+        while pending and (next_max_date is None or pending[-1]["date"] > next_max_date):
+            yield project_doc(pending.pop(), EXPENSE_PROJECTION)
 
-@api_router.post("/expenses", response_model=Expense)
-async def create_expense(expense_data: ExpenseCreate, user: User = Depends(get_current_user)):
-    expense_id = f"exp_{uuid.uuid4().hex[:12]}"
-    entry_type = normalize_entry_type(expense_data.entry_type)
+async def take_archived_expenses(workspace_id: str, limit: int, **filters: Any) -> List[Dict[str, Any]]:
+    rows = []
+    async with aclosing(iter_archived_expenses(workspace_id, **filters)) as archived:
+        async for row in archived:
+            rows.append(row)
+            if len(rows) >= limit:
+                break
+    return rows
 
-    await ensure_category_for_entry_type(expense_data.category_id, user.user_id, entry_type)
-    
-    expense_doc = {
-        "expense_id": expense_id,
-        "user_id": user.user_id,
-        "amount": expense_data.amount,
-        "currency": expense_data.currency,
-        "description": expense_data.description,
-        "category_id": expense_data.category_id,
-        "subcategory_id": expense_data.subcategory_id,
-        "entry_type": entry_type,
-        "date": expense_data.date.isoformat() if isinstance(expense_data.date, datetime) else expense_data.date,
-        "created_at": datetime.now(timezone.utc).isoformat()
-    }
-    await db.expenses.insert_one(expense_doc)
-    expense_doc.pop("_id", None)
-    return expense_doc
+def merge_expense_pages(hot: List[Dict[str, Any]], archived: List[Dict[str, Any]], limit: int) -> List[Dict[str, Any]]:
+    if not archived:
+        return hot[:limit]
+    # A row caught mid-archival exists in both tiers; keep one copy.
+    merged = {row["expense_id"]: row for row in archived}
+    merged.update((row["expense_id"], row) for row in hot)
+    return sorted(merged.values(), key=expense_sort_key, reverse=True)[:limit]
 
-@api_router.put("/expenses/{expense_id}")
-async def update_expense(
-    expense_id: str,
-    expense_data: ExpenseUpdate,
-    user: User = Depends(get_current_user)
-):
-    update_data = {k: v for k, v in expense_data.model_dump().items() if v is not None}
-    if "date" in update_data and isinstance(update_data["date"], datetime):
-        update_data["date"] = update_data["date"].isoformat()
+async def merge_archived_page(
+    workspace_id: str,
+    hot: List[Dict[str, Any]],
+    limit: int,
+    **filters: Any,
+) -> List[Dict[str, Any]]:
+    # hot is a page of up to limit rows. When it is full and its oldest row is newer than every
+    # matching bucket, no archived row can make the page, so the archive is not read at all.
+    if len(hot) >= limit:
+        newest = await find_archive_buckets(
+            workspace_id,
+            {"_id": 0, "max_date": 1},
+            filters.get("start_date"),
+            filters.get("end_date"),
+            filters.get("cursor"),
+            filters.get("route"),
+            filters.get("category_id"),
+            limit=1,
+        )
+        if not newest or newest[0]["max_date"] < hot[-1]["date"]:
+            return hot[:limit]
+    archived = await take_archived_expenses(workspace_id, limit, **filters)
+    return merge_expense_pages(hot, archived, limit)
+
+async def find_archived_expenses(workspace_id: str, expense_ids: List[str]) -> List[Dict[str, Any]]:
+    if not expense_ids or STORAGE_BACKEND != "mongo":
+        return []
+    wanted = set(expense_ids)
+    rows = []
+    async for bucket in db.expense_archive.find(
+        {"workspace_id": workspace_id, "rows.expense_id": {"$in": list(wanted)}},
+        {"_id": 0, "rows": 1},
+    ):
+        rows.extend(project_doc(row, EXPENSE_PROJECTION) for row in bucket["rows"] if row["expense_id"] in wanted)
+    return rows
 
-    existing_doc = await db.expenses.find_one(
-        {"expense_id": expense_id, "user_id": user.user_id},
-        {"_id": 0}
+async def restore_archived_expense(workspace_id: str, expense_id: str) -> Optional[Dict[str, Any]]:
+    # Edits and deletes work on the hot tier, so the row moves back there first (a later pass
+    # re-archives it if it is still old). It is inserted before it leaves its bucket: a crash in
+    # between leaves a copy in both tiers, which reads already collapse, never a lost row.
+    if STORAGE_BACKEND != "mongo":
+        return None
+    bucket = await db.expense_archive.find_one(
+        {"workspace_id": workspace_id, "rows.expense_id": expense_id},
+        {"_id": 0, "rows": {"$elemMatch": {"expense_id": expense_id}}},
     )
-    if not existing_doc:
-        raise HTTPException(status_code=404, detail="Expense not found")
+    if not bucket:
+        return None
+    row = bucket["rows"][0]
 
-    target_entry_type = normalize_entry_type(
-        update_data.get("entry_type", existing_doc.get("entry_type")),
-        "expense"
+    if not await storage.expenses.get(workspace_id, expense_id):
+        restored = {**row, "search_terms": build_search_terms(row.get("description"))}
+        try:
+            # Keeping the archived fingerprint makes a concurrent restore of the same row collide.
+            await storage.expenses.insert(restored)
+        except DuplicateKeyError:
+            # Lost that race, or a newer hot row took the ordinal: only the latter needs a new one.
+            if not await storage.expenses.get(workspace_id, expense_id):
+                restored.pop("_id", None)
+                await insert_expense_doc(restored)
+
+    await remove_archived_row(workspace_id, expense_id)
+    return await storage.expenses.get(workspace_id, expense_id, {"_id": 0})
+
+async def merge_expense_streams(hot, archived):
+    hot_row = await anext(hot, None)
+    archived_row = await anext(archived, None)
+    while hot_row is not None or archived_row is not None:
+        if archived_row is None or (hot_row is not None and expense_sort_key(hot_row) >= expense_sort_key(archived_row)):
+            if archived_row is not None and hot_row["expense_id"] == archived_row["expense_id"]:
+                archived_row = await anext(archived, None)
+            yield hot_row
+            hot_row = await anext(hot, None)
+        else:
+            yield archived_row
+            archived_row = await anext(archived, None)
+
+async def archived_period_totals(
+    workspace_id: str,
+    unit: str,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    entry_type: Optional[str] = None,
+    category_id: Optional[str] = None,
+    route: Optional[str] = None,
+) -> List[Dict[str, Any]]:
+    # Same row shape as build_period_totals_pipeline. Buckets entirely inside the range are
+    # summed from their per-day summary; only buckets straddling a range edge read their rows.
+    buckets = await find_archive_buckets(
+        workspace_id,
+        {"_id": 0, "bucket_id": 1, "min_date": 1, "max_date": 1, "summary": 1},
+        start_date,
+        end_date,
+        route=route,
     )
-    target_category_id = update_data.get("category_id", existing_doc.get("category_id"))
-    await ensure_category_for_entry_type(target_category_id, user.user_id, target_entry_type)
-    update_data["entry_type"] = target_entry_type
+    normalized_type = normalize_entry_type(entry_type) if entry_type else None
+    read_db = get_read_db(route) if route else db
+    totals: Dict[tuple, List[float]] = {}
 
-    if update_data:
-        await db.expenses.update_one(
-            {"expense_id": expense_id, "user_id": user.user_id},
-            {"$set": update_data}
+    def add(day: str, currency: Optional[str], row_type: Optional[str], amount: float, count: int) -> None:
+        row_type = row_type or "expense"
+        if normalized_type and row_type != normalized_type:
+            return
+        try:
+            period = truncate_to_bucket(date.fromisoformat(day[:10]), unit)
+        except (TypeError, ValueError):
+            return
+        entry = totals.setdefault((period, currency, row_type), [0.0, 0])
+        entry[0] += amount
+        entry[1] += count
+
+    for bucket in buckets:
+        inside = (not start_date or bucket["min_date"] >= start_date) and (not end_date or bucket["max_date"] <= end_date)
+        if inside:
+            for item in bucket.get("summary", []):
+                if not category_id or item.get("category_id") == category_id:
+                    add(item["day"], item.get("currency"), item.get("entry_type"), item["total"], item["count"])
+            continue
+        bucket_doc = await read_db.expense_archive.find_one({"bucket_id": bucket["bucket_id"]}, {"_id": 0, "rows": 1})
+        for row in (bucket_doc or {}).get("rows", []):
+            if archived_row_matches(row, start_date, end_date, None) and (not category_id or row.get("category_id") == category_id):
+                add(row["date"], row.get("currency"), row.get("entry_type"), float(row.get("amount") or 0), 1)
+
+    return [
+        {
+            "_id": {"period": datetime(period.year, period.month, period.day), "currency": currency, "entry_type": row_type},
+            "total": total,
+            "count": count,
+        }
+        for (period, currency, row_type), (total, count) in totals.items()
+    ]
+
+async def archived_fingerprints(workspace_id: str, fingerprints: List[str]) -> set:
+    if STORAGE_BACKEND != "mongo":
+        return set()
+    return {
+        fingerprint
+        async for bucket in db.expense_archive.find(
+            {"workspace_id": workspace_id, "fingerprints": {"$in": fingerprints}},
+            {"_id": 0, "fingerprints": 1},
         )
-    
-    expense_doc = await db.expenses.find_one(
-        {"expense_id": expense_id, "user_id": user.user_id},
-        {"_id": 0}
-    )
-    if not expense_doc:
-        raise HTTPException(status_code=404, detail="Expense not found")
-    return normalize_expense_doc(expense_doc)
+        for fingerprint in bucket["fingerprints"]
+    }
 
-@api_router.delete("/expenses/{expense_id}")
-async def delete_expense(expense_id: str, user: User = Depends(get_current_user)):
-    result = await db.expenses.delete_one({"expense_id": expense_id, "user_id": user.user_id})
-    if result.deleted_count == 0:
-        raise HTTPException(status_code=404, detail="Expense not found")
-    return {"message": "Expense deleted"}
+async def purge_archived_category(workspace_id: str, category_id: str) -> List[str]:
+    # Whole buckets are rewritten here, guarded by their version: a concurrent row removal
+    # bumps it, and the rewrite starts over from a fresh read instead of undoing that removal.
+    if STORAGE_BACKEND != "mongo":
+        return []
+    removed: List[str] = []
+    while True:
+        bucket = await db.expense_archive.find_one({"workspace_id": workspace_id, "category_ids": category_id}, {"_id": 0})
+        if not bucket:
+            return removed
+        kept = [row for row in bucket["rows"] if row.get("category_id") != category_id]
+        guard = {"bucket_id": bucket["bucket_id"], "version": bucket.get("version")}
+        if kept:
+            rebuilt = build_archive_bucket(workspace_id, bucket["batch_id"], kept)
+            rebuilt.update(bucket_id=bucket["bucket_id"], archived_at=bucket["archived_at"], version=(bucket.get("version") or 0) + 1)
+            result = await db.expense_archive.replace_one(guard, rebuilt)
+            done = result.modified_count
+        else:
+            done = (await db.expense_archive.delete_one(guard)).deleted_count
+        if done:
+            removed.extend(row["expense_id"] for row in bucket["rows"] if row.get("category_id") == category_id)
+
+async def ensure_archive_collection() -> None:
+    # Block compression is fixed when a collection is created, so create it explicitly
+    # instead of letting the first insert (or index build) create it uncompressed.
+    if await db.list_collection_names(filter={"name": "expense_archive"}):
+        return
+    try:
+        await db.create_collection(
+            "expense_archive",
+            storageEngine={"wiredTiger": {"configString": f"block_compressor={ARCHIVE_BLOCK_COMPRESSOR}"}},
+        )
+    except CollectionInvalid:
+        pass
+
+# ==================== EXPORT FORMATS ====================
+
+class ExportSink(io.RawIOBase):
+    # Non-seekable byte sink drained after every chunk, so writers stream instead of buffering the file.
+    def __init__(self):
+        super().__init__()
+        self._chunks: List[bytes] = []
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+class CsvExportEncoder:
+    def __init__(self):
+        self._header_written = False
+
+    def write(self, rows: List[List[Any]]) -> bytes:
+        output = io.StringIO()
+        writer = csv.writer(output)
+        if not self._header_written:
+            writer.writerow(EXPORT_COLUMNS)
+            self._header_written = True
+        writer.writerows(rows)
+        return output.getvalue().encode("utf-8")
+
+    def close(self) -> bytes:
+        return b"" if self._header_written else self.write([])
+
+class JsonlExportEncoder:
+    def write(self, rows: List[List[Any]]) -> bytes:
+        return "".join(
+            json.dumps(dict(zip(EXPORT_COLUMNS, row)), ensure_ascii=False) + "\n" for row in rows
+        ).encode("utf-8")
+
+    def close(self) -> bytes:
+        return b""
+
+class ParquetExportEncoder:
+    SCHEMA = pa.schema([
+        (column, pa.float64() if column == "Amount" else pa.string()) for column in EXPORT_COLUMNS
+    ])
+
+    def __init__(self):
+        self.sink = ExportSink()
+        self.writer = pq.ParquetWriter(self.sink, self.SCHEMA, compression="zstd")
+
+    def write(self, rows: List[List[Any]]) -> bytes:
+        # One row group per chunk; the footer is written on close.
+        columns = list(zip(*rows)) if rows else [[] for _ in EXPORT_COLUMNS]
+        table = pa.Table.from_arrays(
+            [pa.array(values, type=field.type) for values, field in zip(columns, self.SCHEMA)],
+            schema=self.SCHEMA,
+        )
+        self.writer.write_table(table)
+        return self.sink.drain()
+
+    def close(self) -> bytes:
+        self.writer.close()
+        return self.sink.drain()
+
+class XlsxExportEncoder:
+    # XLSX is itself a zip with the sheet in one member, so rows are spooled by the
+    # write-only workbook and the file is emitted on close.
+    def __init__(self):
+        self.workbook = Workbook(write_only=True)
+        self.sheet = self.workbook.create_sheet("Transactions")
+        self.sheet.append(EXPORT_COLUMNS)
+
+    def write(self, rows: List[List[Any]]) -> bytes:
+        for row in rows:
+            self.sheet.append(row)
+        return b""
+
+    def close(self) -> bytes:
+        sink = ExportSink()
+        self.workbook.save(sink)
+        return sink.drain()
+
+EXPORT_FORMATS = {
+    "csv": ("text/csv", CsvExportEncoder, zipfile.ZIP_DEFLATED),
+    "jsonl": ("application/x-ndjson", JsonlExportEncoder, zipfile.ZIP_DEFLATED),
+    "parquet": ("application/vnd.apache.parquet", ParquetExportEncoder, zipfile.ZIP_STORED),
+    "xlsx": ("application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", XlsxExportEncoder, zipfile.ZIP_STORED),
+}
+
+def build_export_name_maps(categories: List[Dict[str, Any]]) -> Tuple[Dict[str, Dict[str, Any]], Dict[str, Dict[str, Any]]]:
+    cat_map = {c["category_id"]: normalize_category_doc(c) for c in categories}
+    subcat_map = {}
+    for c in categories:
+        for s in c.get("subcategories", []):
+            subcat_map[s["subcategory_id"]] = s
+    return cat_map, subcat_map
+
+def build_export_row(tx: Dict[str, Any], cat_map: Dict[str, Dict[str, Any]], subcat_map: Dict[str, Dict[str, Any]]) -> List[Any]:
+    normalize_expense_doc(tx)
+    return [
+        tx["date"][:10],
+        tx["description"],
+        float(tx["amount"]),
+        tx["entry_type"],
+        tx["currency"],
+        cat_map.get(tx["category_id"], {}).get("name", ""),
+        subcat_map.get(tx.get("subcategory_id"), {}).get("name", ""),
+    ]
+
+async def iter_export_chunks(
+    workspace_id: str,
+    start_date: Optional[str],
+    end_date: Optional[str],
+    cat_map: Dict[str, Dict[str, Any]],
+    subcat_map: Dict[str, Dict[str, Any]],
+):
+    hot = storage.expenses.stream(workspace_id, EXPORT_CHUNK_ROWS, route="export", start_date=start_date, end_date=end_date)
+    archived = iter_archived_expenses(workspace_id, start_date, end_date, route="export")
+    rows = []
+    async for tx in merge_expense_streams(hot, archived):
+        rows.append(build_export_row(tx, cat_map, subcat_map))
+        if len(rows) >= EXPORT_CHUNK_ROWS:
+            yield rows
+            rows = []
+    if rows:
+        yield rows
+
+async def stream_export(workspace_id: str, start_date: Optional[str], end_date: Optional[str], cat_map, subcat_map, export_format: str):
+    encoder = EXPORT_FORMATS[export_format][1]()
+    async for rows in iter_export_chunks(workspace_id, start_date, end_date, cat_map, subcat_map):
+        data = await asyncio.to_thread(encoder.write, rows)
+        if data:
+            yield data
+    yield await asyncio.to_thread(encoder.close)
+
+async def stream_partitioned_export(
+    workspace_id: str,
+    start_date: Optional[str],
+    end_date: Optional[str],
+    cat_map,
+    subcat_map,
+    export_format: str,
+):
+    # Rows arrive sorted by date, so each month is one contiguous run and one zip member.
+    _, encoder_class, compression = EXPORT_FORMATS[export_format]
+    sink = ExportSink()
+    archive = zipfile.ZipFile(sink, "w", compression=compression)
+    current_month = None
+    encoder = None
+    member = None
+
+    async for rows in iter_export_chunks(workspace_id, start_date, end_date, cat_map, subcat_map):
+        for month, month_rows in groupby(rows, key=lambda row: row[0][:7]):
+            if month != current_month:
+                if member is not None:
+                    member.write(await asyncio.to_thread(encoder.close))
+                    member.close()
+                current_month = month
+                encoder = encoder_class()
+                member = archive.open(f"transactions-{month}.{export_format}", "w", force_zip64=True)
+            member.write(await asyncio.to_thread(encoder.write, list(month_rows)))
+        data = sink.drain()
+        if data:
+            yield data
+
+    if member is not None:
+        member.write(await asyncio.to_thread(encoder.close))
+        member.close()
+    archive.close()
+    yield sink.drain()
 
 # ==================== REPORTS & ANALYTICS ====================
 
@@ -869,41 +4571,113 @@ async def delete_expense(expense_id: str, user: User = Depends(get_current_user)
 async def get_analytics_raw(
     limit: int = Query(ANALYTICS_RAW_DEFAULT_LIMIT, ge=1, le=ANALYTICS_RAW_MAX_LIMIT),
     cursor: Optional[str] = None,
-    user: User = Depends(get_current_user),
+    workspace: WorkspaceAccess = Depends(get_workspace),
 ):
-    query: Dict[str, Any] = {"user_id": user.user_id}
-    if cursor:
-        query.update(parse_analytics_cursor(cursor))
+    cursor_key = parse_analytics_cursor(cursor) if cursor else None
 
-    fetch_limit = limit + 1
-    expenses = await db.expenses.find(query, {"_id": 0}).sort([
-        ("date", -1),
-        ("expense_id", -1),
-    ]).to_list(fetch_limit)
+    async def render() -> Response:
+        fetch_limit = limit + 1
+        expenses = await storage.expenses.page(
+            workspace.workspace_id,
+            fetch_limit,
+            route="analytics",
+            cursor=cursor_key,
+        )
+        expenses = await merge_archived_page(workspace.workspace_id, expenses, fetch_limit, cursor=cursor_key, route="analytics")
 
-    has_more = len(expenses) > limit
-    page_expenses = expenses[:limit]
-    normalized_expenses = [normalize_expense_doc(expense) for expense in page_expenses]
+        has_more = len(expenses) > limit
+        page_expenses = expenses[:limit]
+        normalized_expenses = [normalize_expense_doc(expense) for expense in page_expenses]
 
-    categories = await db.categories.find({"user_id": user.user_id}, {"_id": 0}).to_list(200)
-    normalized_categories = [normalize_category_doc(category) for category in categories]
+        categories = await storage.categories.list(workspace.workspace_id, route="analytics")
+        normalized_categories = [normalize_category_doc(category) for category in categories]
+        next_cursor = build_next_cursor(page_expenses, has_more)
 
-    next_cursor = None
-    if has_more and page_expenses:
-        last_expense = page_expenses[-1]
-        last_date = str(last_expense.get("date", "")).strip()
-        last_id = str(last_expense.get("expense_id", "")).strip()
-        if last_date and last_id:
-            next_cursor = f"{last_date}|{last_id}"
+        return JSONResponse(jsonable_encoder({
+            "expenses": normalized_expenses,
+            "categories": normalized_categories,
+            "currency": workspace.user.preferred_currency,
+            "has_more": has_more,
+            "next_cursor": next_cursor,
+            "limit": limit,
+        }))
 
-    return {
-        "expenses": normalized_expenses,
-        "categories": normalized_categories,
-        "currency": user.preferred_currency,
-        "has_more": has_more,
-        "next_cursor": next_cursor,
-        "limit": limit,
+    params = {"limit": limit, "cursor": cursor, "currency": workspace.user.preferred_currency}
+    return await serve_cached(workspace.workspace_id, "analytics_raw", params, render, "analytics")
+
+@api_router.get("/analytics/timeseries")
+async def get_analytics_timeseries(
+    granularity: Literal["day", "week", "month"] = "day",
+    entry_type: Optional[str] = None,
+    category_id: Optional[str] = None,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    workspace: WorkspaceAccess = Depends(get_workspace),
+):
+    async def render() -> Response:
+        rows = await storage.expenses.period_totals(
+            workspace.workspace_id,
+            granularity,
+            route="analytics",
+            entry_type=entry_type,
+            category_id=category_id,
+            start_date=start_date,
+            end_date=end_date,
+        )
+        rows += await archived_period_totals(
+            workspace.workspace_id,
+            granularity,
+            start_date,
+            end_date,
+            entry_type,
+            category_id,
+            route="analytics",
+        )
+
+        buckets: Dict[date, Dict[str, float]] = {}
+        for row in rows:
+            period = row["_id"]["period"].date()
+            bucket = buckets.setdefault(period, {"expense_total": 0.0, "income_total": 0.0, "count": 0})
+            amount = convert_amount(row["total"], row["_id"].get("currency"), workspace.user.preferred_currency)
+            bucket[f"{normalize_entry_type(row['_id'].get('entry_type'))}_total"] += amount
+            bucket["count"] += row["count"]
+
+        range_start = truncate_to_bucket(parse_bucket_day(start_date), granularity) if start_date else min(buckets, default=None)
+        range_end = truncate_to_bucket(parse_bucket_day(end_date), granularity) if end_date else max(buckets, default=None)
+
+        series = []
+        if range_start and range_end:
+            period = range_start
+            while period <= range_end:
+                if len(series) >= TIMESERIES_MAX_BUCKETS:
+                    raise HTTPException(status_code=400, detail="Date range too large for requested granularity")
+                bucket = buckets.get(period, {"expense_total": 0.0, "income_total": 0.0, "count": 0})
+                series.append({
+                    "period": period.isoformat(),
+                    "expense_total": round(bucket["expense_total"], 2),
+                    "income_total": round(bucket["income_total"], 2),
+                    "net_total": round(bucket["income_total"] - bucket["expense_total"], 2),
+                    "count": bucket["count"],
+                })
+                period = next_bucket(period, granularity)
+
+        return JSONResponse({
+            "granularity": granularity,
+            "currency": workspace.user.preferred_currency,
+            "start": range_start.isoformat() if range_start else None,
+            "end": range_end.isoformat() if range_end else None,
+            "buckets": series,
+        })
+
+    params = {
+        "granularity": granularity,
+        "entry_type": entry_type,
+        "category_id": category_id,
+        "start_date": start_date,
+        "end_date": end_date,
+        "currency": workspace.user.preferred_currency,
     }
+    return await serve_cached(workspace.workspace_id, "analytics_timeseries", params, render, "analytics")
 
 @api_router.get("/reports/summary")
 async def get_summary(
@@ -919,55 +4693,34 @@ async def get_summary(
 async def export_expenses(
     start_date: Optional[str] = None,
     end_date: Optional[str] = None,
-    user: User = Depends(get_current_user)
+    export_format: Literal["csv", "jsonl", "parquet", "xlsx"] = Query("csv", alias="format"),
+    partition: Literal["none", "month"] = "none",
+    workspace: WorkspaceAccess = Depends(get_workspace)
 ):
-    query = {"user_id": user.user_id}
-    query.update(build_date_query(start_date, end_date))
-    
-    transactions = await db.expenses.find(query, {"_id": 0}).sort("date", -1).to_list(10000)
-    categories = await db.categories.find({"user_id": user.user_id}, {"_id": 0}).to_list(100)
-    
-    cat_map = {c["category_id"]: normalize_category_doc(c) for c in categories}
-    subcat_map = {}
-    for c in categories:
-        for s in c.get("subcategories", []):
-            subcat_map[s["subcategory_id"]] = s
-    
-    # Create CSV
-    output = io.StringIO()
-    writer = csv.writer(output)
-    writer.writerow(["Date", "Description", "Amount", "Type", "Currency", "Category", "Subcategory"])
-    
-    for tx in transactions:
-        normalize_expense_doc(tx)
-        cat_name = cat_map.get(tx["category_id"], {}).get("name", "")
-        subcat_name = subcat_map.get(tx.get("subcategory_id"), {}).get("name", "")
-        writer.writerow([
-            tx["date"][:10],
-            tx["description"],
-            tx["amount"],
-            tx["entry_type"],
-            tx["currency"],
-            cat_name,
-            subcat_name
-        ])
-    
-    return Response(
-        content=output.getvalue(),
-        media_type="text/csv",
-        headers={"Content-Disposition": "attachment; filename=transactions.csv"}
+    categories = await storage.categories.list(workspace.workspace_id, route="export")
+    cat_map, subcat_map = build_export_name_maps(categories)
+    if partition == "month":
+        body = stream_partitioned_export(workspace.workspace_id, start_date, end_date, cat_map, subcat_map, export_format)
+        media_type, filename = "application/zip", "transactions.zip"
+    else:
+        body = stream_export(workspace.workspace_id, start_date, end_date, cat_map, subcat_map, export_format)
+        media_type, filename = EXPORT_FORMATS[export_format][0], f"transactions.{export_format}"
+    return StreamingResponse(
+        body,
+        media_type=media_type,
+        headers={"Content-Disposition": f"attachment; filename={filename}"}
     )
 
-@api_router.post("/reports/import")
-async def import_expenses(request: Request, user: User = Depends(get_current_user)):
+@api_router.post("/reports/import", dependencies=[Depends(require_database_ready)])
+async def import_expenses(request: Request, workspace: WorkspaceAccess = Depends(get_writable_workspace)):
     body = await request.json()
     csv_data = body.get("csv_data", "")
     
     if not csv_data:
         raise HTTPException(status_code=400, detail="No CSV data provided")
     
-    # Get user's categories
-    categories = await db.categories.find({"user_id": user.user_id}, {"_id": 0}).to_list(100)
+    # Get the workspace's categories
+    categories = await storage.categories.list(workspace.workspace_id)
     normalized_categories = [normalize_category_doc(c) for c in categories]
     cat_name_type_map = {
         (c["name"].lower(), c["entry_type"]): c for c in normalized_categories
@@ -982,22 +4735,45 @@ async def import_expenses(request: Request, user: User = Depends(get_current_use
         for subcat in category.get("subcategories", []):
             subcat_name_map[(subcat["name"].lower(), category["category_id"])] = subcat
     
+    def build_import_doc(row: Dict[str, str], category: Dict[str, Any], entry_type: str) -> Dict[str, Any]:
+        subcategory_id = None
+        subcat_name = row.get("Subcategory", "").lower()
+        if subcat_name:
+            subcat = subcat_name_map.get((subcat_name, category["category_id"]))
+            if subcat:
+                subcategory_id = subcat["subcategory_id"]
+
+        return {
+            "expense_id": f"exp_{uuid.uuid4().hex[:12]}",
+            "user_id": workspace.user.user_id,
+            "workspace_id": workspace.workspace_id,
+            "amount": float(row.get("Amount", 0)),
+            "currency": row.get("Currency", workspace.user.preferred_currency),
+            "description": row.get("Description", ""),
+            "search_terms": build_search_terms(row.get("Description", "")),
+            "category_id": category["category_id"],
+            "subcategory_id": subcategory_id,
+            "entry_type": entry_type,
+            "date": row.get("Date", datetime.now(timezone.utc).isoformat()[:10]),
+            "created_at": datetime.now(timezone.utc).isoformat()
+        }
+
     # Parse CSV
     reader = csv.DictReader(io.StringIO(csv_data))
-    imported = 0
+    parsed_docs = []
+    unmatched_rows = []
     errors = []
     
     for i, row in enumerate(reader):
         try:
             entry_type = normalize_entry_type(row.get("Type"), "expense")
             cat_name = row.get("Category", "").lower()
-            subcat_name = row.get("Subcategory", "").lower()
             
             category = cat_name_type_map.get((cat_name, entry_type))
             if not category:
                 category = fallback_cat_name_map.get(cat_name)
             if not category:
-                errors.append(f"Row {i+2}: Category '{row.get('Category')}' not found")
+                unmatched_rows.append((i, row, entry_type))
                 continue
 
             category_type = normalize_entry_type(category.get("entry_type"), "expense")
@@ -1007,32 +4783,53 @@ async def import_expenses(request: Request, user: User = Depends(get_current_use
                 )
                 continue
             
-            subcategory_id = None
-            if subcat_name:
-                subcat = subcat_name_map.get((subcat_name, category["category_id"]))
-                if subcat:
-                    subcategory_id = subcat["subcategory_id"]
-            
-            expense_id = f"exp_{uuid.uuid4().hex[:12]}"
-            expense_doc = {
-                "expense_id": expense_id,
-                "user_id": user.user_id,
-                "amount": float(row.get("Amount", 0)),
-                "currency": row.get("Currency", user.preferred_currency),
-                "description": row.get("Description", ""),
-                "category_id": category["category_id"],
-                "subcategory_id": subcategory_id,
-                "entry_type": entry_type,
-                "date": row.get("Date", datetime.now(timezone.utc).isoformat()[:10]),
-                "created_at": datetime.now(timezone.utc).isoformat()
-            }
-            await db.expenses.insert_one(expense_doc)
-            imported += 1
+            parsed_docs.append(build_import_doc(row, category, entry_type))
         except Exception as e:
             errors.append(f"Row {i+2}: {str(e)}")
+
+    # Rows with a missing or unknown category get one scored from the workspace's own history.
+    suggested = 0
+    if unmatched_rows:
+        classifier = await get_category_classifier(workspace.workspace_id)
+        categories_by_id = {c["category_id"]: c for c in normalized_categories}
+        for entry_type in sorted(ENTRY_TYPES):
+            rows = [item for item in unmatched_rows if item[2] == entry_type]
+            if not rows:
+                continue
+            allowed = {c["category_id"] for c in normalized_categories if c["entry_type"] == entry_type}
+            predictions = classifier.predict([row.get("Description") for _, row, _ in rows], allowed)
+            for (i, row, _), category_id in zip(rows, predictions):
+                if not category_id:
+                    errors.append(f"Row {i+2}: Category '{row.get('Category')}' not found")
+                    continue
+                try:
+                    parsed_docs.append(build_import_doc(row, categories_by_id[category_id], entry_type))
+                    suggested += 1
+                except Exception as e:
+                    errors.append(f"Row {i+2}: {str(e)}")
     
+    # Dedupe against the ledger (and its archive) with one $in lookup per batch on the fingerprint indexes.
+    assign_batch_fingerprints(parsed_docs)
+    imported_docs = []
+    for start in range(0, len(parsed_docs), IMPORT_BATCH_SIZE):
+        batch = parsed_docs[start:start + IMPORT_BATCH_SIZE]
+        fingerprints = [d["fingerprint"] for d in batch]
+        existing = await storage.expenses.existing_fingerprints(workspace.workspace_id, fingerprints)
+        existing |= await archived_fingerprints(workspace.workspace_id, fingerprints)
+        fresh = [doc for doc in batch if doc["fingerprint"] not in existing]
+        imported_docs.extend(await insert_expenses_skipping_duplicates(fresh))
+    imported = len(imported_docs)
+
+    if imported:
+        mark_workspace_data_changed(workspace.workspace_id)
+        await record_changes(workspace.workspace_id, "expense", upserted=[doc["expense_id"] for doc in imported_docs])
+        await apply_budget_usage(workspace.workspace_id, added=imported_docs)
+        observe_category_examples(workspace.workspace_id, added=imported_docs)
+
     return {
         "imported": imported,
+        "duplicates": len(parsed_docs) - imported,
+        "suggested": suggested,
         "errors": errors[:10]  # Return first 10 errors
     }
 
@@ -1058,8 +4855,7 @@ async def convert_currency(
         raise HTTPException(status_code=400, detail="Invalid currency code")
     
     # Convert to USD first, then to target currency
-    usd_amount = amount / EXCHANGE_RATES[from_currency]
-    converted = usd_amount * EXCHANGE_RATES[to_currency]
+    converted = convert_amount(amount, from_currency, to_currency)
     
     return {
         "from": from_currency,
@@ -1081,20 +4877,255 @@ async def get_dashboard_stats(user: User = Depends(get_current_user)):
 # Include the router
 app.include_router(api_router)
 
-@app.on_event("startup")
-async def ensure_db_indexes():
+# Added before CORS so CORS stays outermost and shed responses still carry its headers.
+if CONCURRENCY_WORKER_CAPACITY > 0:
+    app.add_middleware(ConcurrencyLimitMiddleware)
+
+# Add CORS middleware
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=[origin.strip() for origin in cors_origins],
+    allow_credentials=True,
+    allow_methods=["*"],
+    allow_headers=["*"],
+)
+
+# ==================== STARTUP & HEALTH ====================
+
+INDEX_SPECS: List[Tuple[str, List[Tuple[str, int]], Dict[str, Any]]] = [
+    ("expenses", [("workspace_id", 1), ("date", -1), ("expense_id", -1)], {}),
+    ("expenses", [("workspace_id", 1), ("category_id", 1), ("date", -1)], {}),
+    ("expenses", [("workspace_id", 1), ("search_terms", 1), ("date", -1), ("expense_id", -1)], {}),
+    (
+        "expenses",
+        [("workspace_id", 1), ("recurrence_key", 1)],
+        {"unique": True, "partialFilterExpression": {"recurrence_key": {"$exists": True}}},
+    ),
+    (
+        "expenses",
+        [("workspace_id", 1), ("fingerprint", 1)],
+        {"unique": True, "partialFilterExpression": {"fingerprint": {"$exists": True}}},
+    ),
+    ("categories", [("workspace_id", 1), ("entry_type", 1)], {}),
+    ("categories", [("workspace_id", 1), ("category_id", 1)], {}),
+    ("users", [("email", 1)], {}),
+    ("users", [("claims_changed_at", 1)], {"sparse": True}),
+    ("user_sessions", [("session_id", 1)], {"unique": True}),
+    ("user_sessions", [("user_id", 1), ("revoked", 1)], {}),
+    ("user_sessions", [("absolute_expires_at", 1)], {}),
+    ("user_sessions", [("revoked_at", 1)], {"sparse": True}),
+    ("recurring_rules", [("rule_id", 1)], {"unique": True}),
+    ("budgets", [("budget_id", 1)], {"unique": True}),
+    ("budgets", [("workspace_id", 1), ("category_id", 1)], {}),
+    ("budget_usage", [("budget_id", 1), ("period_start", 1)], {"unique": True}),
+    ("recurring_rules", [("workspace_id", 1), ("category_id", 1)], {}),
+    ("recurring_rules", [("active", 1), ("next_occurrence", 1)], {}),
+    ("sync_counters", [("workspace_id", 1)], {"unique": True}),
+    ("sync_changes", [("workspace_id", 1), ("entity", 1), ("entity_id", 1)], {"unique": True}),
+    ("sync_changes", [("workspace_id", 1), ("revision", 1)], {}),
+    ("workspaces", [("workspace_id", 1)], {"unique": True}),
+    ("workspace_members", [("workspace_id", 1), ("user_id", 1)], {"unique": True}),
+    ("workspace_members", [("user_id", 1)], {}),
+    ("expense_archive", [("bucket_id", 1)], {"unique": True}),
+    ("expense_archive", [("workspace_id", 1), ("max_date", -1)], {}),
+    ("expense_archive", [("workspace_id", 1), ("fingerprints", 1)], {}),
+    ("expense_archive", [("workspace_id", 1), ("rows.expense_id", 1)], {}),
+    ("expense_archive", [("workspace_id", 1), ("category_ids", 1)], {}),
+    ("expense_archive", [("batch_id", 1)], {}),
+    ("archive_batches", [("workspace_id", 1)], {"unique": True}),
+    ("archive_batches", [("batch_id", 1)], {"unique": True}),
+]
+# Ledger collections used to be keyed by user_id; these indexes were replaced by the
+# workspace_id ones above (the unique ones would otherwise reject shared-workspace rows).
+OBSOLETE_INDEX_SPECS: List[Tuple[str, List[Tuple[str, int]]]] = [
+    ("expenses", [("user_id", 1), ("date", -1), ("expense_id", -1)]),
+    ("expenses", [("user_id", 1), ("category_id", 1), ("date", -1)]),
+    ("expenses", [("user_id", 1), ("search_terms", 1), ("date", -1), ("expense_id", -1)]),
+    ("expenses", [("user_id", 1), ("recurrence_key", 1)]),
+    ("expenses", [("user_id", 1), ("fingerprint", 1)]),
+    ("categories", [("user_id", 1), ("entry_type", 1)]),
+    ("categories", [("user_id", 1), ("category_id", 1)]),
+    ("budgets", [("user_id", 1), ("category_id", 1)]),
+    ("recurring_rules", [("user_id", 1), ("category_id", 1)]),
+    ("sync_counters", [("user_id", 1)]),
+    ("sync_changes", [("user_id", 1), ("entity", 1), ("entity_id", 1)]),
+    ("sync_changes", [("user_id", 1), ("revision", 1)]),
+]
+WORKSPACE_SCOPED_COLLECTIONS = ("expenses", "categories", "recurring_rules", "budgets", "sync_counters", "sync_changes")
+if AUTH_RATE_LIMIT_BACKEND == "mongo":
+    INDEX_SPECS.append(("rate_limits", [("expires_at", 1)], {"expireAfterSeconds": 0}))
+
+startup_state: Dict[str, Any] = {"ready": False, "indexes_created": 0, "error": None}
+# Set once every index in INDEX_SPECS exists; work that relies on unique indexes waits for it.
+database_ready = asyncio.Event()
+background_tasks: List[asyncio.Task] = []
+
+def normalize_index_key(key: Any) -> tuple:
+    return tuple(
+        (field, int(direction) if isinstance(direction, (int, float)) else direction)
+        for field, direction in key
+    )
+
+async def ensure_collection_indexes(collection_name: str, specs: List[Tuple[List[Tuple[str, int]], Dict[str, Any]]]) -> int:
+    # Compare against list_indexes so restarts issue no createIndexes at all once indexes exist.
+    collection = db[collection_name]
+    existing = set()
+    async for index in collection.list_indexes():
+        existing.add(normalize_index_key(index["key"].items()))
+
+    missing = [
+        IndexModel(keys, **options)
+        for keys, options in specs
+        if normalize_index_key(keys) not in existing
+    ]
+    if missing:
+        await collection.create_indexes(missing)
+    return len(missing)
+
+async def ensure_db_indexes() -> int:
+    specs_by_collection: Dict[str, List[Tuple[List[Tuple[str, int]], Dict[str, Any]]]] = {}
+    for collection_name, keys, options in INDEX_SPECS:
+        specs_by_collection.setdefault(collection_name, []).append((keys, options))
+
+    created = await asyncio.gather(*(
+        ensure_collection_indexes(collection_name, specs)
+        for collection_name, specs in specs_by_collection.items()
+    ))
+    return sum(created)
+
+async def drop_obsolete_indexes() -> None:
+    obsolete_by_collection: Dict[str, set] = {}
+    for collection_name, keys in OBSOLETE_INDEX_SPECS:
+        obsolete_by_collection.setdefault(collection_name, set()).add(normalize_index_key(keys))
+
+    for collection_name, obsolete in obsolete_by_collection.items():
+        async for index in db[collection_name].list_indexes():
+            if normalize_index_key(index["key"].items()) in obsolete:
+                await db[collection_name].drop_index(index["name"])
+
+async def backfill_sync_watermarks() -> None:
+    # Counters from before the committed watermark were fully committed.
+    await db.sync_counters.update_many({"committed": {"$exists": False}}, [{"$set": {"committed": "$revision"}}])
+
+async def backfill_workspace_ids() -> None:
+    # Records from before workspaces belong to their owner's personal workspace (id == user_id).
+    # Runs before index creation: the unique workspace indexes need the field populated.
+    for collection_name in WORKSPACE_SCOPED_COLLECTIONS:
+        await db[collection_name].update_many(
+            {"workspace_id": {"$exists": False}},
+            [{"$set": {"workspace_id": "$user_id"}}],
+        )
+
+async def warm_connection_pool() -> None:
+    # Concurrent pings force the driver to open several pooled connections up front.
+    await asyncio.gather(*(db.command("ping") for _ in range(max(MONGO_WARMUP_CONNECTIONS, 1))))
+
+async def backfill_expense_search_terms():
+    try:
+        while True:
+            batch = await db.expenses.find(
+                {"search_terms": {"$exists": False}},
+                {"_id": 1, "description": 1},
+            ).to_list(SEARCH_BACKFILL_BATCH_SIZE)
+            if not batch:
+                return
+            await db.expenses.bulk_write([
+                UpdateOne({"_id": doc["_id"]}, {"$set": {"search_terms": build_search_terms(doc.get("description"))}})
+                for doc in batch
+            ], ordered=False)
+    except Exception as exc:
+        logger.warning("Unable to backfill expense search terms: %s", exc)
+
+async def backfill_expense_fingerprints():
     try:
-        await db.expenses.create_index([("user_id", 1), ("date", -1), ("expense_id", -1)])
-        await db.expenses.create_index([("user_id", 1), ("category_id", 1), ("date", -1)])
-        await db.categories.create_index([("user_id", 1), ("entry_type", 1)])
-        await db.categories.create_index([("user_id", 1), ("category_id", 1)])
-        await db.users.create_index([("email", 1)])
-        await db.user_sessions.create_index([("session_id", 1)], unique=True)
-        await db.user_sessions.create_index([("user_id", 1), ("revoked", 1)])
-        await db.user_sessions.create_index([("absolute_expires_at", 1)])
+        while True:
+            batch = await db.expenses.find(
+                {"fingerprint": {"$exists": False}},
+                {"_id": 1, "workspace_id": 1, "expense_id": 1, **{field: 1 for field in FINGERPRINT_FIELDS}},
+            ).to_list(SEARCH_BACKFILL_BATCH_SIZE)
+            if not batch:
+                return
+            try:
+                await db.expenses.bulk_write([
+                    UpdateOne({"_id": doc["_id"]}, {"$set": {"fingerprint": f"{expense_fingerprint_base(doc)}:0"}})
+                    for doc in batch
+                ], ordered=False)
+            except BulkWriteError as exc:
+                # Identical rows collide on ordinal 0; give each its own ordinal.
+                for error in exc.details.get("writeErrors", []):
+                    if error.get("code") != 11000:
+                        raise
+                    doc = batch[error["index"]]
+                    await update_expense_doc(doc["workspace_id"], doc["expense_id"], {}, doc)
     except Exception as exc:
-        logger.warning("Unable to ensure database indexes: %s", exc)
+        logger.warning("Unable to backfill expense fingerprints: %s", exc)
+
+async def prepare_database():
+    started = time.monotonic()
+    while True:
+        try:
+            await warm_connection_pool()
+            await drop_obsolete_indexes()
+            await backfill_workspace_ids()
+            await backfill_sync_watermarks()
+            await ensure_archive_collection()
+            startup_state["indexes_created"] = await ensure_db_indexes()
+            break
+        except Exception as exc:
+            startup_state["error"] = str(exc)
+            logger.warning("Database not ready, retrying in %ss: %s", STARTUP_RETRY_SECONDS, exc)
+            await asyncio.sleep(STARTUP_RETRY_SECONDS)
+
+    startup_state["ready"] = True
+    startup_state["error"] = None
+    database_ready.set()
+    logger.info(
+        "Database ready in %.2fs (%s indexes created)",
+        time.monotonic() - started,
+        startup_state["indexes_created"],
+    )
+    await backfill_expense_search_terms()
+    await backfill_expense_fingerprints()
+
+@app.on_event("startup")
+async def start_background_services():
+    await invalidation_bus.start()
+    # Nothing here is awaited: the app accepts traffic immediately and /readyz reports progress.
+    if AUTH_TOKEN_MODE == "hybrid":
+        background_tasks.append(asyncio.create_task(session_revocations.run()))
+    if STORAGE_BACKEND == "memory":
+        startup_state["ready"] = True
+        database_ready.set()
+    else:
+        background_tasks.append(asyncio.create_task(prepare_database()))
+        if ARCHIVE_SCAN_SECONDS > 0:
+            background_tasks.append(asyncio.create_task(run_archive_scheduler()))
+    if RECURRING_SCAN_SECONDS > 0:
+        background_tasks.append(asyncio.create_task(run_recurring_scheduler()))
+    if CHANGE_EVENTS_BACKEND == "changestream":
+        background_tasks.append(asyncio.create_task(run_change_stream_publisher()))
+
+@app.get("/healthz")
+async def healthz():
+    return {"status": "ok"}
+
+@app.get("/metrics")
+async def metrics():
+    return {"concurrency": admission_controller.snapshot()}
+
+@app.get("/readyz")
+async def readyz():
+    if not startup_state["ready"]:
+        return JSONResponse(
+            status_code=503,
+            content={"status": "starting", "error": startup_state["error"]},
+        )
+    return {"status": "ready", "indexes_created": startup_state["indexes_created"]}
 
 @app.on_event("shutdown")
 async def shutdown_db_client():
-    client.close()
+    for task in background_tasks:
+        task.cancel()
+    await invalidation_bus.close()
+    if client is not None:
+        client.close()
@@ -0,0 +1,63 @@
+import asyncio
+import os
+import sys
+from pathlib import Path
+
+import pytest
+from fastapi.testclient import TestClient
+
+# server reads its configuration at import time.
+os.environ["STORAGE_BACKEND"] = "memory"
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import server  # noqa: E402
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(server, "storage", server.build_storage("memory"))
+    monkeypatch.setattr(
+        server,
+        "auth_ip_limiter",
+        server.build_rate_limiter("auth_ip", server.AUTH_RATE_LIMIT_IP_BURST, server.AUTH_RATE_LIMIT_IP_PER_MINUTE),
+    )
+    monkeypatch.setattr(
+        server,
+        "auth_email_limiter",
+        server.build_rate_limiter("auth_email", server.AUTH_RATE_LIMIT_EMAIL_BURST, server.AUTH_RATE_LIMIT_EMAIL_PER_MINUTE),
+    )
+    with TestClient(server.app) as test_client:
+        yield test_client
+
+
+@pytest.fixture
+def auth_headers(client):
+    response = client.post(
+        "/api/auth/register",
+        json={"email": "ledger@example.com", "password": "secret123", "name": "Ledger"},
+    )
+    assert response.status_code == 200
+    client.cookies.clear()
+    return {"Authorization": f"Bearer {response.json()['token']}"}
+
+
+@pytest.fixture
+def mongo_db(monkeypatch):
+    # The Mongo repositories and the archive tier run against mongomock. It ignores partial
+    # index filters, so partial unique indexes are left out except the fingerprint one, which
+    # every expense row carries.
+    mongomock_motor = pytest.importorskip("mongomock_motor")
+    database = mongomock_motor.AsyncMongoMockClient()["expense_tracker_test"]
+    monkeypatch.setattr(server, "STORAGE_BACKEND", "mongo")
+    monkeypatch.setattr(server, "db", database)
+    monkeypatch.setattr(server, "storage", server.build_storage("mongo"))
+
+    async def create_indexes():
+        for collection_name, keys, options in server.INDEX_SPECS:
+            options = dict(options)
+            if options.pop("partialFilterExpression", None) and keys[-1][0] != "fingerprint":
+                continue
+            await database[collection_name].create_index(keys, **options)
+
+    asyncio.run(create_indexes())
+    return database
@@ -0,0 +1,160 @@
+import asyncio
+
+import server
+
+
+def seed_expenses(count, workspace_id="ws_archive", year=2019, prefix="exp"):
+    async def seed():
+        for index in range(count):
+            await server.insert_expense_doc({
+                "expense_id": f"{prefix}_{index}",
+                "user_id": workspace_id,
+                "workspace_id": workspace_id,
+                "amount": 10.0 + index,
+                "currency": "USD",
+                "description": f"Row {index}",
+                "category_id": "cat_food" if index % 2 == 0 else "cat_rent",
+                "entry_type": "expense",
+                "date": f"{year}-01-{index + 1:02d}T00:00:00",
+                "created_at": f"{year}-01-{index + 1:02d}T00:00:00",
+            })
+
+    asyncio.run(seed())
+
+
+def hot_ids(mongo_db):
+    return sorted(doc["expense_id"] for doc in asyncio.run(mongo_db.expenses.find({}).to_list(None)))
+
+
+def archived_ids(mongo_db):
+    buckets = asyncio.run(mongo_db.expense_archive.find({}).to_list(None))
+    return sorted(row["expense_id"] for bucket in buckets for row in bucket["rows"])
+
+
+def archived_totals(workspace_id="ws_archive"):
+    rows = asyncio.run(server.archived_period_totals(workspace_id, "year"))
+    return {row["_id"]["period"].year: (row["total"], row["count"]) for row in rows}
+
+
+def test_archive_pass_moves_old_rows(mongo_db):
+    seed_expenses(4)
+    assert asyncio.run(server.archive_workspace_expenses("ws_archive", "2020-01-01")) == 4
+    assert hot_ids(mongo_db) == []
+    assert archived_ids(mongo_db) == ["exp_0", "exp_1", "exp_2", "exp_3"]
+    assert archived_totals() == {2019: (46.0, 4)}
+    assert asyncio.run(mongo_db.archive_batches.count_documents({})) == 0
+
+
+def test_archive_pass_leaves_rows_changed_while_moving(mongo_db, monkeypatch):
+    seed_expenses(4)
+    commit = server.commit_archive_batch
+
+    async def edit_then_commit(batch):
+        existing = await server.storage.expenses.get("ws_archive", "exp_1", {"_id": 0})
+        await server.update_expense_doc("ws_archive", "exp_1", {"amount": 99.0}, {**existing, "amount": 99.0})
+        await server.storage.expenses.delete("ws_archive", "exp_2")
+        await commit(batch)
+
+    monkeypatch.setattr(server, "commit_archive_batch", edit_then_commit)
+    asyncio.run(server.archive_workspace_expenses("ws_archive", "2020-01-01"))
+
+    assert hot_ids(mongo_db) == ["exp_1"]
+    assert asyncio.run(server.storage.expenses.get("ws_archive", "exp_1"))["amount"] == 99.0
+    assert archived_ids(mongo_db) == ["exp_0", "exp_3"]
+    assert archived_totals() == {2019: (23.0, 2)}
+
+
+def test_recovering_a_committed_batch_keeps_its_rows(mongo_db):
+    seed_expenses(3)
+    snapshot = [[doc["expense_id"], None] for doc in asyncio.run(mongo_db.expenses.find({}).to_list(None))]
+    asyncio.run(server.archive_workspace_expenses("ws_archive", "2020-01-01"))
+    bucket = asyncio.run(mongo_db.expense_archive.find_one({}))
+
+    # The worker died after moving the rows but before dropping its journal.
+    asyncio.run(mongo_db.archive_batches.insert_one({
+        "batch_id": bucket["batch_id"],
+        "workspace_id": "ws_archive",
+        "expense_ids": [expense_id for expense_id, _ in snapshot],
+        "snapshot": snapshot,
+        "moving": [expense_id for expense_id, _ in snapshot],
+        "bucket_count": 1,
+        "created_at": "2000-01-01T00:00:00",
+    }))
+    asyncio.run(server.recover_archive_batches())
+
+    assert hot_ids(mongo_db) == []
+    assert archived_ids(mongo_db) == ["exp_0", "exp_1", "exp_2"]
+    assert asyncio.run(mongo_db.archive_batches.count_documents({})) == 0
+
+
+def test_restores_from_one_bucket_do_not_overwrite_each_other(mongo_db):
+    seed_expenses(4)
+    asyncio.run(server.archive_workspace_expenses("ws_archive", "2020-01-01"))
+
+    async def restore_two():
+        return await asyncio.gather(
+            server.restore_archived_expense("ws_archive", "exp_0"),
+            server.restore_archived_expense("ws_archive", "exp_3"),
+        )
+
+    restored = asyncio.run(restore_two())
+    assert [doc["expense_id"] for doc in restored] == ["exp_0", "exp_3"]
+    assert hot_ids(mongo_db) == ["exp_0", "exp_3"]
+    assert archived_ids(mongo_db) == ["exp_1", "exp_2"]
+    assert archived_totals() == {2019: (23.0, 2)}
+    assert asyncio.run(server.restore_archived_expense("ws_archive", "exp_0")) is None
+
+
+class RacingArchive:
+    # Lands a row removal between the purge's bucket read and its rewrite.
+    def __init__(self, collection):
+        self.collection = collection
+        self.raced = False
+
+    def __getattr__(self, name):
+        return getattr(self.collection, name)
+
+    async def replace_one(self, *args, **kwargs):
+        if not self.raced:
+            self.raced = True
+            await server.remove_archived_row("ws_archive", "exp_1")
+        return await self.collection.replace_one(*args, **kwargs)
+
+
+class RacingDatabase:
+    def __init__(self, database):
+        self.database = database
+        self.expense_archive = RacingArchive(database.expense_archive)
+
+    def __getattr__(self, name):
+        return getattr(self.database, name)
+
+
+def test_category_purge_retries_after_a_concurrent_removal(mongo_db, monkeypatch):
+    seed_expenses(4)
+    asyncio.run(server.archive_workspace_expenses("ws_archive", "2020-01-01"))
+    racing = RacingDatabase(mongo_db)
+    monkeypatch.setattr(server, "db", racing)
+
+    removed = asyncio.run(server.purge_archived_category("ws_archive", "cat_food"))
+
+    assert racing.expense_archive.raced
+    assert sorted(removed) == ["exp_0", "exp_2"]
+    assert archived_ids(mongo_db) == ["exp_3"]
+    assert archived_totals() == {2019: (13.0, 1)}
+
+
+def test_full_newer_hot_page_skips_the_archive(mongo_db, monkeypatch):
+    seed_expenses(2)
+    asyncio.run(server.archive_workspace_expenses("ws_archive", "2020-01-01"))
+    seed_expenses(3, year=2021, prefix="new")
+    hot = asyncio.run(server.storage.expenses.page("ws_archive", 3))
+
+    merged = asyncio.run(server.merge_archived_page("ws_archive", hot, 5))
+    assert [doc["expense_id"] for doc in merged] == ["new_2", "new_1", "new_0", "exp_1", "exp_0"]
+
+    async def unexpected(*args, **kwargs):
+        raise AssertionError("archive rows were read")
+
+    monkeypatch.setattr(server, "take_archived_expenses", unexpected)
+    assert asyncio.run(server.merge_archived_page("ws_archive", hot, 3)) == hot
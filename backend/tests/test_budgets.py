@@ -0,0 +1,78 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import server
+from test_memory_storage import create_expense, first_category_id
+
+
+def create_budget(client, headers, category_id, **overrides):
+    response = client.post(
+        "/api/budgets",
+        json={"category_id": category_id, "period": "month", "amount": 100, **overrides},
+        headers=headers,
+    )
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def usage(budget):
+    period_start = budget["tracked_from"]
+    return asyncio.run(server.storage.budgets.usage([budget["budget_id"]], [period_start])).get((budget["budget_id"], period_start))
+
+
+def test_creation_counts_only_matching_expenses_of_the_tracked_period(client, auth_headers):
+    category_id = first_category_id(client, auth_headers)
+    income_category_id = first_category_id(client, auth_headers, "income")
+    today = datetime.now(timezone.utc).date()
+    subcategory = client.post(
+        f"/api/categories/{category_id}/subcategories", json={"name": "Beans"}, headers=auth_headers
+    ).json()["subcategory_id"]
+
+    create_expense(client, auth_headers, category_id, amount=40, date=today.isoformat(), subcategory_id=subcategory)
+    create_expense(client, auth_headers, category_id, amount=7, date=today.isoformat())
+    create_expense(client, auth_headers, category_id, amount=500, date=(today.replace(day=1) - timedelta(days=1)).isoformat())
+    create_expense(client, auth_headers, income_category_id, amount=900, date=today.isoformat(), entry_type="income")
+
+    assert usage(create_budget(client, auth_headers, category_id)) == 47
+    assert usage(create_budget(client, auth_headers, category_id, subcategory_id=subcategory)) == 40
+
+
+def test_reconcile_overwrites_drifted_usage(client, auth_headers):
+    category_id = first_category_id(client, auth_headers)
+    today = datetime.now(timezone.utc).date().isoformat()
+    create_expense(client, auth_headers, category_id, amount=25, date=today)
+    budget = create_budget(client, auth_headers, category_id)
+
+    # A write that straddled the first pass can leave usage off in either direction.
+    asyncio.run(server.storage.budgets.add_usage(budget["workspace_id"], {(budget["budget_id"], budget["tracked_from"]): 25}))
+    stale_period = "2000-01-01"
+    asyncio.run(server.storage.budgets.set_usage(budget["workspace_id"], budget["budget_id"], {stale_period: 3}))
+    assert usage(budget) == 50
+
+    asyncio.run(server.reconcile_budget_usage(budget))
+    assert usage(budget) == 25
+    assert asyncio.run(server.storage.budgets.usage([budget["budget_id"]], [stale_period])) == {
+        (budget["budget_id"], stale_period): 0.0
+    }
+
+
+def test_delayed_pass_skips_budgets_deleted_meanwhile(client, monkeypatch):
+    monkeypatch.setattr(server, "BUDGET_RECONCILE_DELAY_SECONDS", 0)
+    reconciled = []
+
+    async def reconcile(budget_doc):
+        reconciled.append(budget_doc["budget_id"])
+
+    monkeypatch.setattr(server, "reconcile_budget_usage", reconcile)
+    kept = {"budget_id": "bud_kept", "workspace_id": "ws_a", "category_id": "cat_food"}
+    deleted = {"budget_id": "bud_deleted", "workspace_id": "ws_a", "category_id": "cat_food"}
+
+    async def run():
+        await server.storage.budgets.insert(kept)
+        await server.storage.budgets.insert(deleted)
+        await server.storage.budgets.delete("ws_a", budget_id="bud_deleted")
+        await server.reconcile_budget_usage_later(kept)
+        await server.reconcile_budget_usage_later(deleted)
+
+    asyncio.run(run())
+    assert reconciled == ["bud_kept"]
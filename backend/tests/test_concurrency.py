@@ -0,0 +1,99 @@
+import asyncio
+
+import server
+
+
+def test_weighted_semaphore_admits_in_arrival_order():
+    async def scenario():
+        semaphore = server.WeightedSemaphore(capacity=4, max_queue=10)
+        assert await semaphore.acquire(3, 1) is None
+        order = []
+
+        async def waiter(name, cost):
+            assert await semaphore.acquire(cost, 1) is None
+            order.append(name)
+
+        heavy = asyncio.create_task(waiter("heavy", 4))
+        await asyncio.sleep(0)
+        light = asyncio.create_task(waiter("light", 1))
+        await asyncio.sleep(0)
+        # One free unit would fit the light request, but it queues behind the heavy one.
+        assert order == []
+        semaphore.release(3)
+        await heavy
+        assert order == ["heavy"]
+        semaphore.release(4)
+        await light
+        assert order == ["heavy", "light"]
+
+    asyncio.run(scenario())
+
+
+def test_weighted_semaphore_sheds_on_timeout_and_full_queue():
+    async def scenario():
+        semaphore = server.WeightedSemaphore(capacity=1, max_queue=1)
+        assert await semaphore.acquire(1, 1) is None
+        queued = asyncio.create_task(semaphore.acquire(1, 0.05))
+        await asyncio.sleep(0)
+        assert await semaphore.acquire(1, 1) == "queue_full"
+        assert await queued == "timeout"
+        assert semaphore.queued == 0
+        assert semaphore.in_use == 1
+
+    asyncio.run(scenario())
+
+
+def test_admission_rejects_users_over_their_allowance():
+    async def scenario():
+        controller = server.AdmissionController(worker_capacity=64, user_capacity=5, max_wait_ms=100, max_queue=10)
+        assert await controller.acquire("export", "u1") == (None, 4)
+        assert await controller.acquire("analytics", "u1") == ("user", 0)
+        assert await controller.acquire("default", "u1") == (None, 1)
+        controller.release("export", "u1", 4)
+        assert await controller.acquire("analytics", "u1") == (None, 2)
+        assert controller.counters["analytics"]["rejected_user"] == 1
+
+    asyncio.run(scenario())
+
+
+def test_admission_queues_on_route_limit_then_times_out():
+    async def scenario():
+        controller = server.AdmissionController(worker_capacity=64, user_capacity=0, max_wait_ms=50, max_queue=10)
+        for user in ("u1", "u2"):
+            assert await controller.acquire("export", user) == (None, 4)
+        assert await controller.acquire("export", "u3") == ("timeout", 0)
+        assert controller.counters["export"]["queued"] == 1
+
+        waiting = asyncio.create_task(controller.acquire("export", "u3"))
+        await asyncio.sleep(0)
+        controller.release("export", "u1", 4)
+        assert await waiting == (None, 4)
+        assert controller.routes["export"].in_use == 2
+        assert controller.worker.in_use == 8
+
+    asyncio.run(scenario())
+
+
+def test_admission_releases_everything_when_cancelled_while_queued():
+    async def scenario():
+        controller = server.AdmissionController(worker_capacity=8, user_capacity=10, max_wait_ms=1000, max_queue=10)
+        assert await controller.acquire("export", "u1") == (None, 4)
+        assert await controller.acquire("import", "u3") == (None, 4)
+        # u2 passes the export route limit but queues on the full worker pool.
+        queued = asyncio.create_task(controller.acquire("export", "u2"))
+        await asyncio.sleep(0)
+        assert controller.worker.queued == 1
+        queued.cancel()
+        try:
+            await queued
+        except asyncio.CancelledError:
+            pass
+
+        assert controller.routes["export"].in_use == 1
+        assert controller.worker.queued == 0
+        assert "u2" not in controller._user_usage
+        controller.release("export", "u1", 4)
+        assert controller.routes["export"].in_use == 0
+        assert controller.worker.in_use == 4
+
+    asyncio.run(scenario())
@@ -0,0 +1,100 @@
+import asyncio
+import csv
+import io
+
+import pytest
+
+import server
+from test_memory_storage import create_expense, first_category_id
+
+
+def expense_doc(expense_id, workspace_id="ws_a", **overrides):
+    return {
+        "expense_id": expense_id,
+        "workspace_id": workspace_id,
+        "user_id": "user_a",
+        "amount": 12.5,
+        "currency": "USD",
+        "description": "Coffee beans",
+        "category_id": "cat_food",
+        "entry_type": "expense",
+        "date": "2024-03-01T00:00:00+00:00",
+        **overrides,
+    }
+
+
+def test_fingerprint_base_ignores_formatting_only_differences():
+    base = server.expense_fingerprint_base(expense_doc("exp_1"))
+    assert server.expense_fingerprint_base(
+        expense_doc("exp_2", amount="12.50", currency="usd", description="  coffee   BEANS ", date="2024-03-01")
+    ) == base
+    assert server.expense_fingerprint_base(expense_doc("exp_3", amount=12.51)) != base
+    assert server.expense_fingerprint_base(expense_doc("exp_4", category_id="cat_other")) != base
+
+
+def test_batch_ordinals_count_identical_rows_per_workspace():
+    docs = [
+        expense_doc("exp_1"),
+        expense_doc("exp_2", description="Tea"),
+        expense_doc("exp_3"),
+        expense_doc("exp_4", workspace_id="ws_b"),
+        expense_doc("exp_5"),
+    ]
+    server.assign_batch_fingerprints(docs)
+    assert [doc["fingerprint"].rsplit(":", 1)[1] for doc in docs] == ["0", "0", "1", "0", "2"]
+    assert docs[0]["fingerprint"].rsplit(":", 1)[0] == docs[3]["fingerprint"].rsplit(":", 1)[0]
+
+
+def test_reimport_adds_only_rows_beyond_the_known_ordinals(client, auth_headers):
+    category_id = first_category_id(client, auth_headers)
+    category_name = next(
+        category["name"]
+        for category in client.get("/api/categories", headers=auth_headers).json()
+        if category["category_id"] == category_id
+    )
+
+    def statement(repeats):
+        output = io.StringIO()
+        writer = csv.writer(output)
+        writer.writerow(["Date", "Description", "Amount", "Type", "Currency", "Category", "Subcategory"])
+        for _ in range(repeats):
+            writer.writerow(["2024-02-03", "Lunch", "12", "expense", "USD", category_name, ""])
+        return {"csv_data": output.getvalue()}
+
+    first = client.post("/api/reports/import", json=statement(2), headers=auth_headers).json()
+    assert (first["imported"], first["duplicates"]) == (2, 0)
+    second = client.post("/api/reports/import", json=statement(3), headers=auth_headers).json()
+    assert (second["imported"], second["duplicates"]) == (1, 2)
+
+
+def test_manual_entries_and_edits_take_the_next_free_ordinal(client, auth_headers):
+    category_id = first_category_id(client, auth_headers)
+    workspace_id = client.get("/api/auth/me", headers=auth_headers).json()["user_id"]
+    first = create_expense(client, auth_headers, category_id)
+    second = create_expense(client, auth_headers, category_id)
+    other = create_expense(client, auth_headers, category_id, description="Tea")
+
+    def fingerprint(expense):
+        return asyncio.run(server.storage.expenses.get(workspace_id, expense["expense_id"], {"_id": 0}))["fingerprint"]
+
+    base = fingerprint(first).rsplit(":", 1)[0]
+    assert (fingerprint(first), fingerprint(second)) == (f"{base}:0", f"{base}:1")
+
+    # Editing a non-identifying field keeps the ordinal; turning a row into a twin takes a free one.
+    client.put(f"/api/expenses/{second['expense_id']}", json={"entry_type": "expense"}, headers=auth_headers)
+    assert fingerprint(second) == f"{base}:1"
+    client.delete(f"/api/expenses/{first['expense_id']}", headers=auth_headers)
+    client.put(f"/api/expenses/{other['expense_id']}", json={"description": "Coffee beans"}, headers=auth_headers)
+    assert fingerprint(other) == f"{base}:0"
+
+
+def test_insert_gives_up_after_the_maximum_ordinal(client, monkeypatch):
+    monkeypatch.setattr(server, "FINGERPRINT_MAX_ORDINAL", 2)
+
+    async def insert_three():
+        for index in range(3):
+            await server.insert_expense_doc(expense_doc(f"exp_{index}"))
+
+    with pytest.raises(server.HTTPException) as excinfo:
+        asyncio.run(insert_three())
+    assert excinfo.value.status_code == 409
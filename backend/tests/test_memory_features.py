@@ -0,0 +1,166 @@
+import asyncio
+from contextlib import aclosing
+from datetime import date, datetime, timezone
+
+import server
+
+from test_memory_storage import create_expense, first_category_id
+
+
+def register(client, email):
+    response = client.post("/api/auth/register", json={"email": email, "password": "secret123", "name": email.split("@")[0]})
+    assert response.status_code == 200, response.text
+    client.cookies.clear()
+    return {"Authorization": f"Bearer {response.json()['token']}"}
+
+
+def test_shared_workspaces_and_members(client, auth_headers):
+    workspace = client.post("/api/workspaces", json={"name": "Household"}, headers=auth_headers).json()
+    workspace_id = workspace["workspace_id"]
+    assert [item["name"] for item in client.get("/api/workspaces", headers=auth_headers).json()] == ["Personal", "Household"]
+
+    member_headers = register(client, "member@example.com")
+    assert client.get("/api/expenses", headers={**member_headers, "X-Workspace-Id": workspace_id}).status_code == 404
+    added = client.post(
+        f"/api/workspaces/{workspace_id}/members",
+        json={"email": "member@example.com", "role": "viewer"},
+        headers=auth_headers,
+    )
+    assert added.status_code == 200, added.text
+    member_id = added.json()["user_id"]
+
+    members = client.get(f"/api/workspaces/{workspace_id}/members", headers=auth_headers).json()
+    assert sorted((member["email"], member["role"]) for member in members) == [
+        ("ledger@example.com", "owner"),
+        ("member@example.com", "viewer"),
+    ]
+
+    shared = {**auth_headers, "X-Workspace-Id": workspace_id}
+    create_expense(client, shared, first_category_id(client, shared))
+    viewer = {**member_headers, "X-Workspace-Id": workspace_id}
+    assert len(client.get("/api/expenses", headers=viewer).json()) == 1
+    payload = {"amount": 1, "currency": "USD", "description": "Snack", "category_id": first_category_id(client, shared), "date": "2024-03-02"}
+    assert client.post("/api/expenses", json=payload, headers=viewer).status_code == 403
+
+    owner_id = client.get("/api/auth/me", headers=auth_headers).json()["user_id"]
+    assert client.delete(f"/api/workspaces/{workspace_id}/members/{owner_id}", headers=auth_headers).status_code == 400
+    assert client.delete(f"/api/workspaces/{workspace_id}/members/{member_id}", headers=member_headers).status_code == 200
+    assert client.get("/api/expenses", headers=viewer).status_code == 404
+
+
+def test_recurring_rules_materialize_and_stop(client, auth_headers):
+    category_id = first_category_id(client, auth_headers)
+    rule = client.post(
+        "/api/recurring",
+        json={
+            "amount": 900,
+            "currency": "USD",
+            "description": "Rent",
+            "category_id": category_id,
+            "frequency": "monthly",
+            "interval": 1,
+            "start_date": "2024-01-31",
+            "end_date": "2024-04-30",
+        },
+        headers=auth_headers,
+    )
+    assert rule.status_code == 200, rule.text
+    assert rule.json()["active"] is False
+    dates = sorted(item["date"][:10] for item in client.get("/api/expenses", headers=auth_headers).json())
+    assert dates == ["2024-01-31", "2024-02-29", "2024-03-31", "2024-04-30"]
+    assert [item["rule_id"] for item in client.get("/api/recurring", headers=auth_headers).json()] == [rule.json()["rule_id"]]
+
+    # Deleting the category takes its rules with it.
+    assert client.delete(f"/api/categories/{category_id}", headers=auth_headers).status_code == 200
+    assert client.get("/api/recurring", headers=auth_headers).json() == []
+
+
+def test_budget_usage_follows_expense_writes(client, auth_headers):
+    category_id = first_category_id(client, auth_headers)
+    today = datetime.now(timezone.utc).date().isoformat()
+    create_expense(client, auth_headers, category_id, amount=30, date=today)
+
+    budget = client.post(
+        "/api/budgets",
+        json={"category_id": category_id, "period": "month", "amount": 100},
+        headers=auth_headers,
+    )
+    assert budget.status_code == 200, budget.text
+
+    def consumed():
+        statuses = client.get("/api/budgets/status", headers=auth_headers).json()["budgets"]
+        return statuses[0]["consumed"]
+
+    assert consumed() == 30
+    expense = create_expense(client, auth_headers, category_id, amount=20, date=today)
+    assert consumed() == 50
+    client.put(f"/api/expenses/{expense['expense_id']}", json={"amount": 5}, headers=auth_headers)
+    assert consumed() == 35
+    client.delete(f"/api/expenses/{expense['expense_id']}", headers=auth_headers)
+    assert consumed() == 30
+
+    assert client.delete(f"/api/budgets/{budget.json()['budget_id']}", headers=auth_headers).status_code == 200
+    assert client.get("/api/budgets", headers=auth_headers).json() == []
+
+
+def test_sync_feed_pages_latest_revisions_and_tombstones(client, auth_headers):
+    category_id = first_category_id(client, auth_headers)
+    baseline = client.get("/api/sync", headers=auth_headers).json()["revision"]
+    first = create_expense(client, auth_headers, category_id, description="First")
+    second = create_expense(client, auth_headers, category_id, description="Second")
+    client.put(f"/api/expenses/{first['expense_id']}", json={"description": "First, edited"}, headers=auth_headers)
+    client.delete(f"/api/expenses/{second['expense_id']}", headers=auth_headers)
+
+    page = client.get("/api/sync", params={"since": baseline, "limit": 1}, headers=auth_headers).json()
+    assert page["has_more"] is True
+    rest = client.get("/api/sync", params={"since": page["next_since"]}, headers=auth_headers).json()
+    changes = page["changes"] + rest["changes"]
+
+    # One row per record, at its latest revision.
+    assert [(change["entity_id"], change["op"]) for change in changes] == [
+        (first["expense_id"], "upsert"),
+        (second["expense_id"], "delete"),
+    ]
+    assert changes[0]["data"]["description"] == "First, edited"
+    assert changes[1]["data"] is None
+    assert rest["has_more"] is False
+    assert rest["next_since"] == rest["revision"]
+
+
+def test_event_stream_publishes_changes_and_resyncs_stale_clients(client, auth_headers):
+    workspace_id = client.get("/api/auth/me", headers=auth_headers).json()["user_id"]
+    queue = server.change_broker.subscribe(workspace_id, workspace_id)
+    try:
+        expense = create_expense(client, auth_headers, first_category_id(client, auth_headers))
+        frame = queue.get_nowait().decode()
+    finally:
+        server.change_broker.unsubscribe(workspace_id, workspace_id, queue)
+    assert "event: change" in frame
+    assert expense["expense_id"] in frame
+
+    async def first_frame():
+        # A reconnecting client behind the committed revision is told to catch up first.
+        async with aclosing(server.stream_change_events(None, workspace_id, asyncio.Queue(), 0)) as stream:
+            return await anext(stream)
+
+    revision = client.get("/api/sync", headers=auth_headers).json()["revision"]
+    assert asyncio.run(first_frame()).startswith(f"id: {revision}\nevent: resync\n".encode())
+
+
+def test_timeseries_buckets_without_aggregations(client, auth_headers):
+    category_id = first_category_id(client, auth_headers)
+    income_category_id = first_category_id(client, auth_headers, "income")
+    create_expense(client, auth_headers, category_id, amount=10, date="2024-01-02")
+    create_expense(client, auth_headers, category_id, amount=15, date="2024-01-20")
+    create_expense(client, auth_headers, income_category_id, amount=100, date="2024-03-05", entry_type="income")
+
+    body = client.get(
+        "/api/analytics/timeseries",
+        params={"granularity": "month", "start_date": "2024-01-01", "end_date": "2024-03-31"},
+        headers=auth_headers,
+    ).json()
+    assert [(bucket["period"], bucket["expense_total"], bucket["income_total"], bucket["count"]) for bucket in body["buckets"]] == [
+        (date(2024, 1, 1).isoformat(), 25.0, 0.0, 2),
+        (date(2024, 2, 1).isoformat(), 0.0, 0.0, 0),
+        (date(2024, 3, 1).isoformat(), 0.0, 100.0, 1),
+    ]
@@ -0,0 +1,171 @@
+import csv
+import io
+
+
+def first_category_id(client, headers, entry_type="expense"):
+    categories = client.get("/api/categories", params={"entry_type": entry_type}, headers=headers).json()
+    return categories[0]["category_id"]
+
+
+def create_expense(client, headers, category_id, **overrides):
+    payload = {
+        "amount": 12.5,
+        "currency": "USD",
+        "description": "Coffee beans",
+        "category_id": category_id,
+        "date": "2024-03-01",
+        **overrides,
+    }
+    response = client.post("/api/expenses", json=payload, headers=headers)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def test_register_login_and_logout(client):
+    response = client.post(
+        "/api/auth/register",
+        json={"email": "auth@example.com", "password": "secret123", "name": "Auth"},
+    )
+    assert response.status_code == 200
+    assert client.post("/api/auth/register", json={"email": "auth@example.com", "password": "x", "name": "Again"}).status_code == 400
+
+    client.cookies.clear()
+    assert client.post("/api/auth/login", json={"email": "auth@example.com", "password": "wrong"}).status_code == 401
+    login = client.post("/api/auth/login", json={"email": "auth@example.com", "password": "secret123"})
+    assert login.status_code == 200
+    client.cookies.clear()
+    headers = {"Authorization": f"Bearer {login.json()['token']}"}
+
+    me = client.get("/api/auth/me", headers=headers)
+    assert me.status_code == 200
+    assert me.json()["email"] == "auth@example.com"
+
+    assert client.post("/api/auth/logout", headers=headers).status_code == 200
+    assert client.get("/api/auth/me", headers=headers).status_code == 401
+
+
+def test_expense_crud(client, auth_headers):
+    category_id = first_category_id(client, auth_headers)
+    expense = create_expense(client, auth_headers, category_id)
+    expense_id = expense["expense_id"]
+
+    listed = client.get("/api/expenses", headers=auth_headers).json()
+    assert [item["expense_id"] for item in listed] == [expense_id]
+
+    updated = client.put(f"/api/expenses/{expense_id}", json={"amount": 20, "description": "Tea"}, headers=auth_headers)
+    assert updated.status_code == 200
+    assert updated.json()["amount"] == 20
+    assert updated.json()["description"] == "Tea"
+
+    assert client.delete(f"/api/expenses/{expense_id}", headers=auth_headers).status_code == 200
+    assert client.delete(f"/api/expenses/{expense_id}", headers=auth_headers).status_code == 404
+    assert client.put(f"/api/expenses/{expense_id}", json={"amount": 1}, headers=auth_headers).status_code == 404
+    assert client.get("/api/expenses", headers=auth_headers).json() == []
+
+
+def test_expenses_are_scoped_to_their_owner(client, auth_headers):
+    expense = create_expense(client, auth_headers, first_category_id(client, auth_headers))
+
+    other = client.post(
+        "/api/auth/register",
+        json={"email": "other@example.com", "password": "secret123", "name": "Other"},
+    )
+    client.cookies.clear()
+    other_headers = {"Authorization": f"Bearer {other.json()['token']}"}
+    assert client.get("/api/expenses", headers=other_headers).json() == []
+    assert client.delete(f"/api/expenses/{expense['expense_id']}", headers=other_headers).status_code == 404
+
+
+def test_analytics_raw_cursor_paging(client, auth_headers):
+    category_id = first_category_id(client, auth_headers)
+    created = [
+        create_expense(client, auth_headers, category_id, description=f"Item {index}", date=f"2024-01-{index % 4 + 1:02d}")
+        for index in range(10)
+    ]
+
+    seen = []
+    cursor = None
+    while True:
+        params = {"limit": 3}
+        if cursor:
+            params["cursor"] = cursor
+        page = client.get("/api/analytics/raw", params=params, headers=auth_headers).json()
+        seen.extend((item["date"][:10], item["expense_id"]) for item in page["expenses"])
+        if not page["has_more"]:
+            assert page["next_cursor"] is None
+            break
+        cursor = page["next_cursor"]
+
+    assert len(seen) == len(created)
+    assert len(set(seen)) == len(seen)
+    assert seen == sorted(seen, reverse=True)
+
+
+def test_search_matches_terms_and_filters(client, auth_headers):
+    category_id = first_category_id(client, auth_headers)
+    create_expense(client, auth_headers, category_id, description="Grocery run downtown", amount=40)
+    create_expense(client, auth_headers, category_id, description="Grocery delivery", amount=15)
+    create_expense(client, auth_headers, category_id, description="Cinema tickets", amount=25)
+
+    results = client.get("/api/expenses/search", params={"q": "grocery"}, headers=auth_headers).json()
+    assert sorted(item["description"] for item in results["expenses"]) == ["Grocery delivery", "Grocery run downtown"]
+
+    results = client.get("/api/expenses/search", params={"q": "grocery", "min_amount": 20}, headers=auth_headers).json()
+    assert [item["description"] for item in results["expenses"]] == ["Grocery run downtown"]
+
+    assert client.get("/api/expenses/search", params={"q": "a"}, headers=auth_headers).status_code == 400
+
+
+def test_identical_manual_entries_get_their_own_fingerprints(client, auth_headers):
+    category_id = first_category_id(client, auth_headers)
+    first = create_expense(client, auth_headers, category_id)
+    second = create_expense(client, auth_headers, category_id)
+    assert first["expense_id"] != second["expense_id"]
+    assert len(client.get("/api/expenses", headers=auth_headers).json()) == 2
+
+
+def test_import_skips_duplicate_rows_and_export_round_trips(client, auth_headers):
+    category_id = first_category_id(client, auth_headers)
+    category_name = next(
+        category["name"]
+        for category in client.get("/api/categories", headers=auth_headers).json()
+        if category["category_id"] == category_id
+    )
+    output = io.StringIO()
+    writer = csv.writer(output)
+    writer.writerow(["Date", "Description", "Amount", "Type", "Currency", "Category", "Subcategory"])
+    writer.writerow(["2024-02-01", "Rent", "900", "expense", "USD", category_name, ""])
+    writer.writerow(["2024-02-03", "Lunch", "12", "expense", "USD", category_name, ""])
+    writer.writerow(["2024-02-03", "Lunch", "12", "expense", "USD", category_name, ""])
+    csv_data = output.getvalue()
+
+    first = client.post("/api/reports/import", json={"csv_data": csv_data}, headers=auth_headers).json()
+    assert first["imported"] == 3
+    assert first["duplicates"] == 0
+
+    second = client.post("/api/reports/import", json={"csv_data": csv_data}, headers=auth_headers).json()
+    assert second["imported"] == 0
+    assert second["duplicates"] == 3
+
+    export = client.get("/api/reports/export", headers=auth_headers)
+    assert export.status_code == 200
+    rows = list(csv.DictReader(io.StringIO(export.text)))
+    assert [(row["Date"], row["Description"]) for row in rows] == [
+        ("2024-02-03", "Lunch"),
+        ("2024-02-03", "Lunch"),
+        ("2024-02-01", "Rent"),
+    ]
+
+    jsonl = client.get("/api/reports/export", params={"format": "jsonl", "start_date": "2024-02-02"}, headers=auth_headers)
+    assert len(jsonl.text.strip().splitlines()) == 2
+
+
+def test_profile_update_returns_the_public_user(client, auth_headers):
+    response = client.put("/api/auth/profile", json={"name": "Renamed", "preferred_currency": "EUR"}, headers=auth_headers)
+    assert response.status_code == 200
+    body = response.json()
+    assert body["name"] == "Renamed"
+    assert body["preferred_currency"] == "EUR"
+    assert "password_hash" not in body
+    assert "claims_changed_at" not in body
+    assert client.get("/api/auth/me", headers=auth_headers).json()["preferred_currency"] == "EUR"
@@ -0,0 +1,86 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import server
+
+
+class Clock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def drain(limiter, key, attempts):
+    async def run():
+        return [await limiter.consume(key) for _ in range(attempts)]
+
+    return asyncio.run(run())
+
+
+@pytest.mark.parametrize("backend", ["memory", "mongo"])
+def test_token_bucket_refills_at_its_rate(backend, monkeypatch, request):
+    clock = Clock()
+    if backend == "mongo":
+        request.getfixturevalue("mongo_db")
+        monkeypatch.setattr(server.time, "time", clock)
+        limiter = server.MongoTokenBucketLimiter("auth_test", 3, 6)
+    else:
+        monkeypatch.setattr(server.time, "monotonic", clock)
+        limiter = server.MemoryTokenBucketLimiter("auth_test", 3, 6)
+
+    first, second, third, rejected = drain(limiter, "203.0.113.7", 4)
+    assert (first, second, third) == (0.0, 0.0, 0.0)
+    assert rejected == pytest.approx(10.0)
+    assert drain(limiter, "198.51.100.1", 1) == [0.0]
+
+    # Six per minute: one token every ten seconds, never more than the burst.
+    clock.now += 5
+    assert drain(limiter, "203.0.113.7", 1)[0] == pytest.approx(5.0)
+    clock.now += 5
+    assert drain(limiter, "203.0.113.7", 2) == [0.0, pytest.approx(10.0)]
+    clock.now += 3600
+    assert drain(limiter, "203.0.113.7", 4)[:3] == [0.0, 0.0, 0.0]
+
+
+def test_memory_limiter_forgets_full_buckets(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(server.time, "monotonic", clock)
+    limiter = server.MemoryTokenBucketLimiter("auth_test", 2, 60)
+    drain(limiter, "a", 1)
+    drain(limiter, "b", 2)
+    clock.now += 1.5 + server.RATE_LIMIT_EVICT_SECONDS
+    drain(limiter, "c", 1)
+    assert set(limiter._buckets) == {"c"}
+
+
+def test_login_attempts_are_throttled_per_email(client):
+    client.post("/api/auth/register", json={"email": "throttle@example.com", "password": "secret123", "name": "T"})
+    client.cookies.clear()
+    statuses = [
+        client.post("/api/auth/login", json={"email": "throttle@example.com", "password": "wrong"}).status_code
+        for _ in range(server.AUTH_RATE_LIMIT_EMAIL_BURST)
+    ]
+    assert 429 in statuses
+    blocked = client.post("/api/auth/login", json={"email": "Throttle@example.com", "password": "secret123"})
+    assert blocked.status_code == 429
+    assert int(blocked.headers["Retry-After"]) >= 1
+
+
+@pytest.mark.parametrize(
+    "proxies, forwarded, expected",
+    [
+        (0, "198.51.100.9", "10.0.0.2"),
+        (1, "198.51.100.9", "198.51.100.9"),
+        (1, "203.0.113.66, 198.51.100.9", "198.51.100.9"),
+        (2, "203.0.113.66, 198.51.100.9, 10.0.0.1", "198.51.100.9"),
+        (3, "198.51.100.9", "198.51.100.9"),
+    ],
+)
+def test_client_ip_only_trusts_the_configured_proxy_hops(monkeypatch, proxies, forwarded, expected):
+    monkeypatch.setattr(server, "TRUSTED_PROXY_COUNT", proxies)
+    request = SimpleNamespace(client=SimpleNamespace(host="10.0.0.2"), headers={"x-forwarded-for": forwarded})
+    assert server.get_client_ip(request) == expected
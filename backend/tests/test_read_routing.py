@@ -0,0 +1,59 @@
+from pymongo.read_preferences import Primary, Secondary, SecondaryPreferred
+
+import server
+
+
+def test_pool_options_come_from_the_environment(monkeypatch):
+    for name in ("MONGO_MAX_POOL_SIZE", "MONGO_MIN_POOL_SIZE", "MONGO_WAIT_QUEUE_TIMEOUT_MS", "MONGO_MAX_IDLE_TIME_MS",
+                 "MONGO_CONNECT_TIMEOUT_MS", "MONGO_SERVER_SELECTION_TIMEOUT_MS", "MONGO_COMPRESSORS"):
+        monkeypatch.delenv(name, raising=False)
+    assert server.build_mongo_client_options() == {"maxPoolSize": 100, "minPoolSize": 0}
+
+    monkeypatch.setenv("MONGO_MAX_POOL_SIZE", "250")
+    monkeypatch.setenv("MONGO_MIN_POOL_SIZE", "10")
+    monkeypatch.setenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", "500")
+    monkeypatch.setenv("MONGO_COMPRESSORS", " zstd,snappy ")
+    assert server.build_mongo_client_options() == {
+        "maxPoolSize": 250,
+        "minPoolSize": 10,
+        "waitQueueTimeoutMS": 500,
+        "compressors": "zstd,snappy",
+    }
+
+
+def test_read_preferences_are_normalized_and_staleness_is_clamped():
+    assert isinstance(server.build_read_preference("primary", 300), Primary)
+    assert isinstance(server.build_read_preference("no-such-mode", 300), Primary)
+
+    preference = server.build_read_preference("secondary_preferred", 30)
+    assert isinstance(preference, SecondaryPreferred)
+    assert preference.max_staleness == server.MONGO_MIN_MAX_STALENESS_SECONDS
+    assert server.build_read_preference("Secondary", 120).max_staleness == 120
+    assert server.build_read_preference("secondary", -1).max_staleness == -1
+
+
+def test_each_route_can_override_the_default(monkeypatch):
+    monkeypatch.setenv("MONGO_SECONDARY_READ_PREFERENCE", "secondary")
+    monkeypatch.setenv("MONGO_READ_PREFERENCE_EXPORT", "primary")
+    monkeypatch.delenv("MONGO_READ_PREFERENCE_ANALYTICS", raising=False)
+    monkeypatch.delenv("MONGO_READ_PREFERENCE_SEARCH", raising=False)
+    preferences = server.load_route_read_preferences()
+    assert set(preferences) == set(server.READ_ROUTES)
+    assert isinstance(preferences["analytics"], Secondary)
+    assert isinstance(preferences["export"], Primary)
+
+
+class RecordingDatabase:
+    def with_options(self, read_preference):
+        return ("routed", read_preference)
+
+
+def test_only_non_primary_routes_get_a_routed_database(monkeypatch):
+    database = RecordingDatabase()
+    secondary = Secondary()
+    monkeypatch.setattr(server, "db", database)
+    monkeypatch.setattr(server, "route_read_preferences", {"analytics": secondary, "export": Primary()})
+
+    assert server.get_read_db("analytics") == ("routed", secondary)
+    assert server.get_read_db("export") is database
+    assert server.get_read_db("unknown") is database
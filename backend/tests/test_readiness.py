@@ -0,0 +1,71 @@
+import asyncio
+
+import server
+from test_memory_storage import create_expense, first_category_id
+
+
+def test_writes_wait_for_the_database_while_reads_are_served(client, auth_headers, monkeypatch):
+    category_id = first_category_id(client, auth_headers)
+    create_expense(client, auth_headers, category_id)
+    monkeypatch.setattr(server, "database_ready", asyncio.Event())
+    monkeypatch.setattr(server, "startup_state", {"ready": False, "indexes_created": 0, "error": "connection refused"})
+
+    response = client.post(
+        "/api/expenses",
+        json={"amount": 3, "currency": "USD", "description": "Tea", "category_id": category_id, "date": "2024-03-02"},
+        headers=auth_headers,
+    )
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == str(server.STARTUP_RETRY_SECONDS)
+    assert client.post("/api/reports/import", json={"csv_data": ""}, headers=auth_headers).status_code == 503
+
+    assert len(client.get("/api/expenses", headers=auth_headers).json()) == 1
+    assert client.get("/healthz").status_code == 200
+    readyz = client.get("/readyz")
+    assert readyz.status_code == 503
+    assert readyz.json()["error"] == "connection refused"
+
+    server.database_ready.set()
+    server.startup_state["ready"] = True
+    assert client.get("/readyz").status_code == 200
+    create_expense(client, auth_headers, category_id, description="Tea")
+
+
+def test_prepare_database_retries_until_the_indexes_exist(monkeypatch):
+    monkeypatch.setattr(server, "database_ready", asyncio.Event())
+    monkeypatch.setattr(server, "startup_state", {"ready": False, "indexes_created": 0, "error": None})
+    monkeypatch.setattr(server, "STARTUP_RETRY_SECONDS", 0)
+    errors = []
+    attempts = []
+
+    async def warm_connection_pool():
+        attempts.append(len(attempts))
+        if len(attempts) == 1:
+            raise ConnectionError("no primary")
+
+    async def ensure_db_indexes():
+        # Observed between attempts: the first failure is reported, nothing is ready yet.
+        errors.append(server.startup_state["error"])
+        assert not server.database_ready.is_set()
+        return 7
+
+    async def noop():
+        return None
+
+    monkeypatch.setattr(server, "warm_connection_pool", warm_connection_pool)
+    monkeypatch.setattr(server, "ensure_db_indexes", ensure_db_indexes)
+    for name in (
+        "drop_obsolete_indexes",
+        "backfill_workspace_ids",
+        "backfill_sync_watermarks",
+        "ensure_archive_collection",
+        "backfill_expense_search_terms",
+        "backfill_expense_fingerprints",
+    ):
+        monkeypatch.setattr(server, name, noop)
+
+    asyncio.run(server.prepare_database())
+    assert len(attempts) == 2
+    assert errors == ["no primary"]
+    assert server.database_ready.is_set()
+    assert server.startup_state == {"ready": True, "indexes_created": 7, "error": None}
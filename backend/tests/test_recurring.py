@@ -0,0 +1,142 @@
+import asyncio
+from datetime import date, datetime, timezone
+
+import pytest
+from fastapi import HTTPException
+
+import server
+
+WORKSPACE_ID = "ws_recurring"
+
+
+def make_rule(**overrides):
+    return {
+        "rule_id": "rule_rent",
+        "user_id": WORKSPACE_ID,
+        "workspace_id": WORKSPACE_ID,
+        "amount": 900.0,
+        "currency": "USD",
+        "description": "Rent",
+        "category_id": "cat_rent",
+        "entry_type": "expense",
+        "frequency": "monthly",
+        "interval": 1,
+        "start_date": "2024-01-31",
+        "end_date": None,
+        "occurrence_index": 0,
+        "next_occurrence": "2024-01-31",
+        "active": True,
+        **overrides,
+    }
+
+
+def occurrence_days(expense_docs):
+    return [doc["date"][:10] for doc in expense_docs]
+
+
+def test_monthly_occurrences_clamp_to_short_months():
+    docs, update = server.plan_rule_occurrences(make_rule(), date(2024, 4, 30))
+    assert occurrence_days(docs) == ["2024-01-31", "2024-02-29", "2024-03-31", "2024-04-30"]
+    assert update == {"occurrence_index": 4, "next_occurrence": "2024-05-31", "active": True}
+    assert len({doc["recurrence_key"] for doc in docs}) == 4
+    assert docs[0]["expense_id"] == server.recurrence_expense_id("rule_rent:2024-01-31")
+
+
+def test_planning_resumes_from_the_occurrence_index_and_finishes_at_end_date():
+    rule = make_rule(frequency="weekly", interval=2, start_date="2024-01-01", end_date="2024-02-01", occurrence_index=1)
+    docs, update = server.plan_rule_occurrences(rule, date(2024, 12, 31))
+    assert occurrence_days(docs) == ["2024-01-15", "2024-01-29"]
+    assert update == {"occurrence_index": 3, "next_occurrence": None, "active": False}
+
+
+def test_planning_caps_occurrences_per_pass():
+    docs, update = server.plan_rule_occurrences(make_rule(frequency="daily", start_date="2020-01-01"), date(2024, 1, 1))
+    assert len(docs) == server.RECURRING_MAX_OCCURRENCES_PER_PASS
+    assert update["active"] is True
+    assert update["next_occurrence"] > docs[-1]["date"][:10]
+
+
+@pytest.fixture
+def recurring_db(mongo_db):
+    # The scheduler's idempotency rests on this index; every row in these tests carries the key.
+    asyncio.run(mongo_db.expenses.create_index([("workspace_id", 1), ("recurrence_key", 1)], unique=True))
+    asyncio.run(mongo_db.categories.insert_one({"category_id": "cat_rent", "workspace_id": WORKSPACE_ID, "entry_type": "expense"}))
+    return mongo_db
+
+
+def workspace_access():
+    user = server.User(user_id=WORKSPACE_ID, email="rules@example.com", name="Rules", created_at=datetime.now(timezone.utc))
+    return server.WorkspaceAccess(workspace_id=WORKSPACE_ID, role="owner", user=user)
+
+
+def materialized_days(database):
+    docs = asyncio.run(database.expenses.find({}, {"_id": 0, "date": 1}).sort("date", 1).to_list(None))
+    return [doc["date"][:10] for doc in docs]
+
+
+def test_materializing_twice_or_from_a_stale_rule_never_duplicates(recurring_db):
+    asyncio.run(recurring_db.recurring_rules.insert_one(make_rule()))
+    assert asyncio.run(server.materialize_due_rules(today=date(2024, 3, 31))) == 3
+    assert asyncio.run(server.materialize_due_rules(today=date(2024, 3, 31))) == 0
+
+    # A second scheduler still holding the rule as it was before the first pass.
+    docs, _ = server.plan_rule_occurrences(make_rule(), date(2024, 3, 31))
+    assert asyncio.run(server.insert_expenses_skipping_duplicates(docs)) == []
+    assert materialized_days(recurring_db) == ["2024-01-31", "2024-02-29", "2024-03-31"]
+
+
+def test_update_rejects_end_date_before_start(recurring_db):
+    asyncio.run(recurring_db.recurring_rules.insert_one(make_rule()))
+    with pytest.raises(HTTPException) as excinfo:
+        asyncio.run(server.update_recurring_rule(
+            "rule_rent",
+            server.RecurringRuleUpdate(end_date=date(2023, 12, 31)),
+            workspace_access(),
+        ))
+    assert excinfo.value.status_code == 400
+
+
+def test_extending_end_date_reactivates_a_finished_rule(recurring_db):
+    asyncio.run(recurring_db.recurring_rules.insert_one(make_rule(end_date="2024-01-31")))
+    asyncio.run(server.materialize_due_rules(workspace_id=WORKSPACE_ID))
+    finished = asyncio.run(recurring_db.recurring_rules.find_one({}, {"_id": 0}))
+    assert (finished["active"], finished["next_occurrence"]) == (False, None)
+    assert materialized_days(recurring_db) == ["2024-01-31"]
+
+    updated = asyncio.run(server.update_recurring_rule(
+        "rule_rent",
+        server.RecurringRuleUpdate(end_date=date(2100, 1, 1)),
+        workspace_access(),
+    ))
+    assert updated["active"] is True
+    assert updated["next_occurrence"] > datetime.now(timezone.utc).date().isoformat()
+    # The catch-up ran straight away rather than waiting for the scheduler.
+    assert materialized_days(recurring_db)[:3] == ["2024-01-31", "2024-02-29", "2024-03-31"]
+
+    shortened = asyncio.run(server.update_recurring_rule(
+        "rule_rent",
+        server.RecurringRuleUpdate(end_date=date(2024, 3, 1)),
+        workspace_access(),
+    ))
+    assert (shortened["active"], shortened["next_occurrence"]) == (False, None)
+
+
+def test_scheduler_waits_for_the_database_to_be_ready(monkeypatch):
+    passes = []
+
+    async def record_pass():
+        passes.append(True)
+        return 0
+
+    async def scenario():
+        monkeypatch.setattr(server, "database_ready", asyncio.Event())
+        monkeypatch.setattr(server, "materialize_due_rules", record_pass)
+        scheduler = asyncio.create_task(server.run_recurring_scheduler())
+        await asyncio.sleep(0.01)
+        assert passes == []
+        server.database_ready.set()
+        await asyncio.sleep(0.01)
+        scheduler.cancel()
+        assert passes == [True]
+
+    asyncio.run(scenario())
@@ -0,0 +1,73 @@
+import server
+
+
+def make_cache(max_entries=8, max_bytes=1024, max_versions=8):
+    return server.ResultCache(max_entries, max_bytes, max_entry_bytes=256, max_versions=max_versions)
+
+
+def test_bump_invalidates_only_that_workspace():
+    cache = make_cache()
+    key_a = cache.make_key("ws_a", "timeseries", {"unit": "month", "category_id": None})
+    key_b = cache.make_key("ws_b", "timeseries", {"unit": "month"})
+    cache.set(key_a, b"a", "application/json", {})
+    cache.set(key_b, b"b", "application/json", {})
+    assert cache.make_key("ws_a", "timeseries", {"unit": "month"}) == key_a
+
+    cache.bump("ws_a")
+    assert cache.get(cache.make_key("ws_a", "timeseries", {"unit": "month"})) is None
+    assert cache.get(cache.make_key("ws_b", "timeseries", {"unit": "month"})) == (b"b", "application/json", {})
+
+
+def test_result_rendered_across_a_bump_is_never_served():
+    cache = make_cache()
+    key = cache.make_key("ws_a", "raw", {})
+    cache.bump("ws_a")
+    cache.set(key, b"stale", "application/json", {})
+    assert cache.get(cache.make_key("ws_a", "raw", {})) is None
+
+
+def test_entries_are_bounded_by_count_and_bytes():
+    cache = make_cache(max_entries=2, max_bytes=10)
+    for index in range(3):
+        cache.set(("ws", str(index)), b"x", "text/plain", {})
+    assert cache.get(("ws", "0")) is None
+    assert cache.get(("ws", "2")) is not None
+
+    cache.set(("ws", "big"), b"y" * 9, "text/plain", {})
+    assert cache._bytes <= 10
+    cache.set(("ws", "huge"), b"z" * 300, "text/plain", {})
+    assert cache.get(("ws", "huge")) is None
+
+
+def test_versions_are_bounded_and_eviction_never_reuses_a_version():
+    cache = make_cache(max_versions=2)
+    key = cache.make_key("ws_a", "raw", {})
+    cache.bump("ws_a")
+    stale_key = cache.make_key("ws_a", "raw", {})
+    cache.set(stale_key, b"rendered before the write below", "application/json", {})
+    cache.bump("ws_a")
+    cache.bump("ws_b")
+    cache.bump("ws_c")
+
+    assert len(cache._versions) == 2
+    assert "ws_a" not in cache._versions
+    current = cache.make_key("ws_a", "raw", {})
+    assert current not in (key, stale_key)
+    assert cache.get(current) is None
+
+    # With no writes since eviction the key is stable, so it is still cacheable.
+    cache.set(current, b"fresh", "application/json", {})
+    assert cache.get(cache.make_key("ws_a", "raw", {}))[0] == b"fresh"
+
+
+def test_expense_writes_invalidate_cached_analytics(client, auth_headers):
+    categories = client.get("/api/categories", headers=auth_headers).json()
+    payload = {"amount": 5, "description": "Tea", "category_id": categories[0]["category_id"], "date": "2024-03-01"}
+
+    assert client.get("/api/analytics/raw", headers=auth_headers).headers["X-Cache"] == "MISS"
+    assert client.get("/api/analytics/raw", headers=auth_headers).headers["X-Cache"] == "HIT"
+    assert client.post("/api/expenses", json=payload, headers=auth_headers).status_code == 200
+
+    response = client.get("/api/analytics/raw", headers=auth_headers)
+    assert response.headers["X-Cache"] == "MISS"
+    assert [item["description"] for item in response.json()["expenses"]] == ["Tea"]
@@ -0,0 +1,86 @@
+import asyncio
+
+import pytest
+
+import server
+from test_memory_storage import create_expense, first_category_id
+
+
+async def allocate(workspace_id, entity_ids):
+    last_revision = await server.storage.sync.allocate(workspace_id, len(entity_ids))
+    first_revision = last_revision - len(entity_ids) + 1
+    await server.storage.sync.log(
+        workspace_id,
+        "expense",
+        [(entity_id, "upsert", first_revision + offset) for offset, entity_id in enumerate(entity_ids)],
+        "2024-03-01T00:00:00+00:00",
+    )
+    return first_revision, last_revision
+
+
+@pytest.fixture(params=["memory", "mongo"])
+def sync_storage(request, monkeypatch):
+    if request.param == "mongo":
+        request.getfixturevalue("mongo_db")
+    else:
+        monkeypatch.setattr(server, "storage", server.build_storage("memory"))
+    return server.storage.sync
+
+
+def test_a_batch_commits_only_after_the_batches_allocated_before_it(sync_storage):
+    async def run():
+        first = await allocate("ws_a", ["exp_1", "exp_2"])
+        second = await allocate("ws_a", ["exp_3"])
+        later = asyncio.create_task(server.commit_sync_revisions("ws_a", *second))
+        await asyncio.sleep(0.02)
+        # The second writer finished first, but its revision would expose a gap below it.
+        assert not later.done()
+        assert await server.get_sync_revision("ws_a") == 0
+        assert await sync_storage.changes("ws_a", 0, await server.get_sync_revision("ws_a"), 10) == []
+
+        await server.commit_sync_revisions("ws_a", *first)
+        await asyncio.wait_for(later, 1)
+        assert await server.get_sync_revision("ws_a") == 3
+        changes = await sync_storage.changes("ws_a", 0, 3, 10)
+        assert [(change["entity_id"], change["revision"]) for change in changes] == [("exp_1", 1), ("exp_2", 2), ("exp_3", 3)]
+
+    asyncio.run(run())
+
+
+def test_a_writer_that_never_commits_is_skipped_after_the_timeout(sync_storage, monkeypatch):
+    monkeypatch.setattr(server, "SYNC_COMMIT_TIMEOUT_SECONDS", 0.05)
+
+    async def run():
+        await allocate("ws_a", ["exp_1"])
+        second = await allocate("ws_a", ["exp_2", "exp_3"])
+        await server.commit_sync_revisions("ws_a", *second)
+        assert await server.get_sync_revision("ws_a") == 3
+
+    asyncio.run(run())
+
+
+def test_relogging_a_record_moves_it_to_its_latest_revision(sync_storage):
+    async def run():
+        await server.record_changes("ws_a", "expense", upserted=["exp_1", "exp_2"])
+        await server.record_changes("ws_a", "expense", deleted=["exp_1"])
+        changes = await sync_storage.changes("ws_a", 0, await server.get_sync_revision("ws_a"), 10)
+        assert [(change["entity_id"], change["op"], change["revision"]) for change in changes] == [
+            ("exp_2", "upsert", 2),
+            ("exp_1", "delete", 3),
+        ]
+        assert await sync_storage.changes("ws_a", 2, 3, 10) == changes[1:]
+
+    asyncio.run(run())
+
+
+def test_sync_endpoint_stops_at_the_committed_watermark(client, auth_headers):
+    workspace_id = client.get("/api/auth/me", headers=auth_headers).json()["user_id"]
+    expense = create_expense(client, auth_headers, first_category_id(client, auth_headers))
+    committed = client.get("/api/sync", headers=auth_headers).json()
+
+    # Allocated and logged by a writer that has not committed yet.
+    asyncio.run(allocate(workspace_id, ["exp_pending"]))
+    body = client.get("/api/sync", params={"since": 0}, headers=auth_headers).json()
+    assert body["revision"] == committed["revision"]
+    assert "exp_pending" not in [change["entity_id"] for change in body["changes"]]
+    assert expense["expense_id"] in [change["entity_id"] for change in body["changes"]]